@@ -1,5 +1,6 @@
 ﻿# RaceCoin - Virtual Horse Racing App
-from flask import Flask, render_template, request, redirect, url_for, session, flash
+from flask import Flask, render_template, request, redirect, url_for, session, flash, Response
+from markupsafe import Markup
 import random
 import os
 import sqlite3
@@ -8,6 +9,29 @@ from functools import wraps
 import secrets
 from datetime import datetime, timedelta, date
 import time
+import threading
+import json
+import base64
+import hashlib
+import heapq
+import itertools
+import numpy as np
+from fragment_cache import FragmentCache
+from compression import CompressionMiddleware
+import assets
+from race_engine import run_race, price_field, forecast_odds, SCORE_NOISE
+from live_races import LiveRaceBroadcaster, format_sse
+from rank_index import RankIndex
+from period_stats import PeriodStats, PERIODS, METRICS, bucket_key
+from horse_registry import HorseRegistry
+from ratings import RatingEngine
+from liability_book import LiabilityBook
+from balance_service import BalanceService
+from db_writer import DBWriter
+from storage import ShardedStorage
+from race_store import RaceStore, to_timestamp
+from search_index import SearchIndex
+from race_scheduler import RaceScheduler
 
 # Environment configuration
 os.environ['FLASK_ENV'] = os.environ.get('FLASK_ENV', 'development')
@@ -18,6 +42,14 @@ app.config['SESSION_COOKIE_HTTPONLY'] = True
 app.config['SESSION_COOKIE_SECURE'] = os.environ.get('FLASK_ENV') == 'production'
 app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
 
+# Hashed static bundles from build_assets.py (immutable Cache-Control)
+assets.init_app(app)
+
+# gzip/brotli + ETag/304 handling for rendered pages
+app.wsgi_app = CompressionMiddleware(
+    app.wsgi_app, min_size=int(os.environ.get('COMPRESS_MIN_SIZE', 500))
+)
+
 # Branding Configuration
 APP_NAME = "RaceCoin"
 APP_TAGLINE = "Virtual Horse Racing & Betting"
@@ -29,14 +61,23 @@ APP_AUTHOR = "RaceCoin Gaming"
 
 # Database setup
 DB_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "users.db")
+# Player rows are spread over DB_SHARDS files by user id; users.db holds the global tables
+storage = ShardedStorage(DB_FILE, shards=int(os.environ.get('DB_SHARDS', 1)))
 
 def get_db():
-    conn = sqlite3.connect(DB_FILE)
-    conn.row_factory = sqlite3.Row
-    return conn
+    """Connection to the catalog: global tables (horses, liability, ratings, ...)"""
+    return storage.get_db()
+
+def get_user_db(user_id):
+    """Connection to the shard holding this player's rows"""
+    return storage.user_db(user_id)
 
 def init_db():
-    conn = get_db()
+    for shard in range(storage.shards):
+        init_user_tables(storage.connect(shard))
+    storage.init_schema()
+
+def init_user_tables(conn):
     c = conn.cursor()
     c.execute('''
         CREATE TABLE IF NOT EXISTS users (
@@ -48,11 +89,147 @@ def init_db():
             total_bets INTEGER DEFAULT 0
         )
     ''')
+    for column in ("is_admin BOOLEAN DEFAULT 0", "xp INTEGER DEFAULT 0",
+                   "current_streak INTEGER DEFAULT 0", "longest_streak INTEGER DEFAULT 0",
+                   "highest_accumulator INTEGER DEFAULT 0", "biggest_single_win INTEGER DEFAULT 0"):
+        try:
+            c.execute(f"ALTER TABLE users ADD COLUMN {column}")
+        except sqlite3.OperationalError:
+            pass
+    # Every bet placed, open until its race has an official result; numbered per player
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS bets (
+            user_id INTEGER NOT NULL,
+            bet_no INTEGER NOT NULL,
+            race_key TEXT,
+            kind TEXT NOT NULL,
+            stake INTEGER NOT NULL,
+            details TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'open',
+            payout INTEGER DEFAULT 0,
+            placed_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            settled_at TEXT,
+            PRIMARY KEY (user_id, bet_no)
+        )
+    ''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_bets_open ON bets (user_id, status)")
     conn.commit()
     conn.close()
 
 init_db()
 
+# Request-path writes go through one writer thread per shard and share group commits;
+# a write not started within DB_WRITE_TIMEOUT seconds is withdrawn and the request fails
+DB_WRITE_TIMEOUT = float(os.environ.get('DB_WRITE_TIMEOUT', 10))
+db_writers = [DBWriter(lambda shard=shard: storage.connect(shard),
+                       max_delay=float(os.environ.get('DB_WRITE_MAX_DELAY_MS', 5)) / 1000)
+              for shard in range(storage.shards)]
+
+def writer_for(user_id):
+    return db_writers[storage.shard_of(user_id)]
+
+# Daily/weekly/monthly boards, updated as bets settle (stored on each player's shard)
+period_stats = PeriodStats(get_db)
+for shard in range(storage.shards):
+    PeriodStats(lambda shard=shard: storage.connect(shard)).init_schema()
+
+def merge_boards(board, metric, limit):
+    """Run board(conn) on every shard and merge their sorted top lists"""
+    boards = storage.scatter(lambda conn, shard: board(conn))
+    return list(itertools.islice(heapq.merge(*boards, key=lambda r: (-r[metric], r['user_id'])), limit))
+
+def period_board(period, metric, limit=10):
+    """Top players for a period, merged from every shard's own top list"""
+    return merge_boards(lambda conn: period_stats.top(period, metric, limit, conn=conn), metric, limit)
+
+def date_range_board(start, end, metric, limit=10):
+    """Top players over any date range (a player's days all sit on their shard, so each shard sums its own)"""
+    return merge_boards(lambda conn: period_stats.merge_days(start, end, metric, limit, conn=conn), metric, limit)
+
+# Shared form/momentum/strength per horse, updated once per settled race
+horse_registry = HorseRegistry(get_db)
+horse_registry.init_schema()
+
+# Plackett–Luce strengths from every stored finishing order, fully refitted every
+# RATINGS_REFIT_HOURS by one worker (0 leaves it to `python ratings.py`)
+horse_ratings = RatingEngine(get_db, reload_seconds=int(os.environ.get('RATINGS_RELOAD_SECONDS', 300)))
+horse_ratings.init_schema()
+if float(os.environ.get('RATINGS_REFIT_HOURS', 24)) > 0:
+    horse_ratings.start_refits(float(os.environ.get('RATINGS_REFIT_HOURS', 24)) * 3600)
+
+# Stakes/payouts per runner; moves published odds and caps the book's exposure
+liability_book = LiabilityBook(
+    get_db,
+    overround=float(os.environ['BOOK_OVERROUND']) if os.environ.get('BOOK_OVERROUND') else None,
+    max_exposure=int(os.environ.get('BOOK_MAX_EXPOSURE', 20000)),
+    on_change=lambda: fragment_cache.bump('race_cards')
+)
+liability_book.init_schema()
+
+# Coins served from memory: a bet costs one journal append, and the users
+# table catches up in a group commit every BALANCE_FLUSH_SECONDS
+balances = BalanceService(
+    get_db,
+    os.environ.get('BALANCE_JOURNAL', DB_FILE + '.journal'),
+    flush_seconds=float(os.environ.get('BALANCE_FLUSH_SECONDS', 2)),
+    shard_of=storage.shard_of,
+    connect_shard=storage.connect
+)
+balances.init_schema()
+
+# ----- XP/Rank System -----
+XP_PER_LEVEL = 100
+
+RANKS = [
+    (1, "Rookie"),
+    (10, "Amateur"),
+    (20, "Pro"),
+    (40, "Champion"),
+    (100, "Legend")
+]
+
+def get_number_rank(xp, xp_per_level=XP_PER_LEVEL):
+    return (xp // xp_per_level) + 1
+
+def get_rank_title(number_rank):
+    for threshold, name in reversed(RANKS):
+        if number_rank >= threshold:
+            return name
+    return "Rookie"
+
+def calculate_xp(win_amount, current_streak, acca_win=0):
+    base_xp = 10 + (win_amount // 10)
+    streak_bonus = current_streak * 5
+    acca_bonus = acca_win // 50
+    return base_xp + streak_bonus + acca_bonus
+
+def write_user_stats(c, user_id, stake, won, win_amount, acca_win):
+    c.execute("SELECT wins, current_streak, longest_streak, highest_accumulator, total_bets, "
+              "biggest_single_win, xp FROM users WHERE id = ?", (user_id,))
+    row = c.fetchone()
+    if not row:
+        return
+    wins, current_streak, longest_streak = row['wins'], row['current_streak'], row['longest_streak']
+    highest_accumulator, biggest_single_win = row['highest_accumulator'], row['biggest_single_win']
+    earned_xp = 0
+    if won:
+        wins += 1
+        current_streak += 1
+        longest_streak = max(longest_streak, current_streak)
+        biggest_single_win = max(biggest_single_win, win_amount)
+        earned_xp = calculate_xp(win_amount, current_streak, acca_win)
+    else:
+        current_streak = 0
+    highest_accumulator = max(highest_accumulator, acca_win)
+    c.execute('''
+        UPDATE users
+        SET wins = ?, current_streak = ?, longest_streak = ?, highest_accumulator = ?,
+            total_bets = total_bets + 1, biggest_single_win = ?, xp = xp + ?
+        WHERE id = ?
+    ''', (wins, current_streak, longest_streak, highest_accumulator, biggest_single_win, earned_xp, user_id))
+    period_stats.record(user_id, net=win_amount - stake, xp=earned_xp, wins=int(won), bets=1, conn=c)
+# ----- End XP/Rank System -----
+
 def login_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
@@ -61,6 +238,300 @@ def login_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def admin_required(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if 'user_id' not in session:
+            return redirect(url_for('login'))
+        if not session.get('is_admin'):
+            flash('Access denied. Admin privileges required.')
+            return redirect(url_for('races'))
+        return f(*args, **kwargs)
+    return decorated_function
+
+# ----- Odds Conversion -----
+STANDARD_FRACTIONS = [
+    (1.05, "1/20"), (1.1, "1/10"), (1.2, "1/5"), (1.25, "1/4"), (1.33, "1/3"),
+    (1.5, "1/2"), (1.57, "4/7"), (1.67, "4/6"), (1.73, "8/11"), (1.8, "4/5"),
+    (1.91, "10/11"), (2.0, "Evs"), (2.1, "11/10"), (2.25, "5/4"), (2.38, "11/8"),
+    (2.5, "6/4"), (2.63, "13/8"), (2.75, "7/4"), (3.0, "2/1"), (3.5, "5/2"),
+    (4.0, "3/1"), (4.5, "7/2"), (5.0, "4/1"), (6.0, "5/1"), (7.0, "6/1"),
+    (8.0, "7/1"), (9.0, "8/1"), (10.0, "9/1"), (11.0, "10/1"), (13.0, "12/1"),
+    (15.0, "14/1"), (17.0, "16/1"), (21.0, "20/1"), (26.0, "25/1"), (34.0, "33/1"),
+    (51.0, "50/1"), (67.0, "66/1"), (101.0, "100/1")
+]
+
+def decimal_to_nearest_fraction(decimal_odds):
+    closest = min(STANDARD_FRACTIONS, key=lambda x: abs(x[0] - decimal_odds))
+    return closest[1]
+# ----- End Odds Conversion -----
+
+# ----- Fragment Cache -----
+fragment_cache = FragmentCache(maxsize=int(os.environ.get('FRAGMENT_CACHE_SIZE', 256)))
+
+def render_fragment(namespace, template_name, load_context, key=None):
+    """Render a shared partial once per namespace version; load_context only runs on a miss"""
+    html = fragment_cache.get_or_render(
+        namespace, key, lambda: render_template(template_name, **load_context())
+    )
+    return Markup(html)
+
+def invalidate_leaderboard():
+    fragment_cache.bump('leaderboard')
+# ----- End Fragment Cache -----
+
+# ----- Rank Index -----
+def load_rank_rows():
+    balances.flush()
+    return [(row['id'], row['username'], row['coins'])
+            for row in storage.query_all("SELECT id, username, coins FROM users")]
+
+# Exact leaderboard position in O(log n); kept in step with adjust_user_coins
+# and rebuilt from the database every RANK_RESYNC_SECONDS
+rank_index = RankIndex(load_rank_rows, resync_seconds=int(os.environ.get('RANK_RESYNC_SECONDS', 300)))
+# ----- End Rank Index -----
+
+# ----- Shared Race Programme -----
+HORSE_NAMES = [
+    'Thunder Bolt', 'Lightning Strike', 'Storm Runner', 'Fire Flash',
+    'Wind Walker', 'Golden Arrow', 'Silver Bullet', 'Royal Champion',
+    'Midnight Express', 'Golden Thunder', 'Swift Arrow', 'Dancing Star'
+]
+# Tracks the race scheduler runs a programme at
+SCHEDULED_TRACKS = [t.strip() for t in os.environ.get(
+    'RACE_TRACKS', 'RaceCoin Racecourse,RaceCoin Downs,RaceCoin Park').split(',') if t.strip()]
+
+def generate_race_form_and_odds(horses):
+    """Build the race card (form, odds, favourites) for a list of horse names"""
+    states = {horse: horse_registry.get(horse) for horse in horses}
+    favourite_scores = {}
+    for horse in horses:
+        state = states[horse]
+        favourite_scores[horse] = (horse_ratings.strength(horse) + state['momentum']
+                                   + random.randint(-SCORE_NOISE, SCORE_NOISE))
+
+    sorted_horses = sorted(horses, key=lambda h: favourite_scores[h], reverse=True)
+    favourites = set(sorted_horses[:2])
+    odds_dict = dict(zip(horses, price_field([favourite_scores[horse] for horse in horses])))
+
+    horse_infos = []
+    for horse in horses:
+        horse_infos.append({
+            'name': horse,
+            'form': states[horse]['form'] or '-',
+            'momentum': states[horse]['momentum'],
+            'odds': odds_dict[horse],
+            'fractional_odds': decimal_to_nearest_fraction(odds_dict[horse]),
+            'is_favourite': horse in favourites
+        })
+    return horse_infos, odds_dict
+
+def generate_virtual_races(num_races=3):
+    """Generate a fresh programme of virtual races with their race cards"""
+    races = []
+    for i in range(num_races):
+        race_horses = random.sample(HORSE_NAMES, 6)
+        horse_infos, odds_dict = generate_race_form_and_odds(race_horses)
+        races.append({
+            'id': i + 1,
+            'title': f'RaceCoin Track - Race {i + 1}',
+            'start_time': (datetime.now() + timedelta(hours=i+1)).isoformat(),
+            'track': 'RaceCoin Racecourse',
+            'race_number': i + 1,
+            'is_real_race': False,
+            'horses': horse_infos,
+            'odds': odds_dict
+        })
+    return races
+
+# Race cards are the same for every player, so they are generated once and
+# only replaced when the programme is republished.
+races_list = generate_virtual_races()
+# Columnar copy of the programme for filtered lookups (course, time window, runner)
+race_store = RaceStore(races_list)
+
+# Autocomplete over every horse and course; the app's race cards have no jockeys, so it
+# serves only these kinds (free_racing_flask_integration.py indexes jockeys too)
+SEARCH_KINDS = ('horse', 'course')
+search_index = SearchIndex()
+for name in HORSE_NAMES:
+    search_index.add('horse', name)
+for track in ['RaceCoin Racecourse'] + SCHEDULED_TRACKS:
+    search_index.add('course', track)
+
+def index_races(races):
+    search_index.clear_races()
+    for race in races:
+        search_index.add_race(race)
+
+index_races(races_list)
+
+def get_race(race_id):
+    return next((r for r in races_list if r['id'] == race_id), None)
+
+def race_key(race):
+    return f"{race['id']}|{race['start_time']}"
+
+def refresh_prices_if_moved(previous):
+    """Re-render cached race cards (and API payloads, which carry decimal odds) only when a bet moved a price"""
+    current = priced_race(get_race(previous['id']))
+    if current['odds'] != previous['odds']:
+        fragment_cache.bump('race_cards')
+
+def priced_race(race):
+    """The race card with the liability book's current odds in place of the opening prices"""
+    odds = liability_book.odds(race_key(race), race['odds'])
+    horses = [{**h, 'odds': odds[h['name']], 'fractional_odds': decimal_to_nearest_fraction(odds[h['name']])}
+              for h in race['horses']]
+    return {**race, 'horses': horses, 'odds': odds}
+
+def settle_race_programme(races):
+    """Feed every race's result into the horse registry (once per race, across workers)"""
+    for race in races:
+        run = get_race_run(race)
+        horse_registry.record_race(race_key(race), run['finishing_order'])
+        horse_ratings.record_race(race_key(race), run['finishing_order'])
+
+def refresh_races_list():
+    """Settle the current programme, then republish it and invalidate cached race cards"""
+    global races_list, race_store
+    settle_race_programme(races_list)
+    liability_book.forget([race_key(r) for r in races_list])
+    horse_registry.reload()
+    horse_ratings.reload()
+    races_list = generate_virtual_races()
+    race_store = RaceStore(races_list)
+    index_races(races_list)
+    fragment_cache.bump('race_cards')
+    fragment_cache.bump('race_runs')
+    live_races.reset()
+    schedule_offs(races_list)
+    return races_list
+
+def get_race_run(race):
+    """Shared result and trajectory for a race, simulated once per published card"""
+    # Seeded with the app secret, so the public card alone can't be replayed to find the winner
+    return fragment_cache.get_or_render('race_runs', race['id'], lambda: run_race(race, app.secret_key))
+
+def get_trajectory_json(race):
+    def serialize():
+        run = get_race_run(race)
+        payload = {key: run[key] for key in
+                   ('race_id', 'tick_ms', 'scale', 'ticks', 'winner_index', 'finish_ticks', 'positions')}
+        return json.dumps(payload, separators=(',', ':'))
+    return fragment_cache.get_or_render('race_runs', ('trajectory', race['id']), serialize)
+
+# One simulation per race, streamed to every spectator over SSE
+live_races = LiveRaceBroadcaster()
+
+def race_is_off(race):
+    """Whether betting has closed, so the result (and the trajectory that gives it away) may be shown"""
+    return not race.get('betting_open', True) or to_timestamp(race['start_time']) <= time.time()
+
+def start_race(race):
+    """The off: betting closes, then the shared live race starts for every spectator"""
+    race['betting_open'] = False
+    race['status'] = 'running'
+    live_races.start(race_key(race), get_race_run(race))
+    fragment_cache.bump('race_cards')
+
+# Fixed programme: one timer per race fires the off at its start time
+# (with RACE_SCHEDULER the scheduler's clock does this instead)
+race_timers = []
+
+def schedule_offs(races):
+    for timer in race_timers:
+        timer.cancel()
+    race_timers.clear()
+    for race in races:
+        timer = threading.Timer(max(0, to_timestamp(race['start_time']) - time.time()), start_race, (race,))
+        timer.daemon = True
+        timer.start()
+        race_timers.append(timer)
+# ----- End Shared Race Programme -----
+
+# ----- Race Scheduler -----
+# With RACE_SCHEDULER=1 races run around the clock: every track publishes a
+# race each RACE_CADENCE_SECONDS, betting closes just before the off, the
+# race goes live at its start time and settles itself a minute later.
+# Without it the fixed programme above is republished by an admin as before.
+# The programme lives in this process, so run a single worker (threads are fine).
+
+programme_lock = threading.Lock()
+
+def publish_programme(races):
+    """Swap in a new programme and invalidate everything derived from it"""
+    global races_list, race_store
+    races = sorted(races, key=lambda r: r['start_time'])
+    race_store = RaceStore(races)
+    races_list = races
+    index_races(races)
+    fragment_cache.bump('race_cards')
+
+def make_scheduled_race(race_id, track, race_number, start):
+    race_horses = random.sample(HORSE_NAMES, 6)
+    horse_infos, odds_dict = generate_race_form_and_odds(race_horses)
+    return {
+        'id': race_id,
+        'title': f'{track} - Race {race_number}',
+        'start_time': datetime.fromtimestamp(start).isoformat(),
+        'track': track,
+        'race_number': race_number,
+        'is_real_race': False,
+        'horses': horse_infos,
+        'odds': odds_dict
+    }
+
+def on_race_open(race):
+    with programme_lock:
+        publish_programme(races_list + [race])
+
+def on_race_close(race):
+    fragment_cache.bump('race_cards')
+
+def on_race_run(race):
+    # Start the shared simulation whether or not anyone is watching yet
+    start_race(race)
+
+def on_race_settle(race):
+    key = race_key(race)
+    finishing_order = get_race_run(race)['finishing_order']
+    horse_registry.record_race(key, finishing_order)
+    horse_ratings.record_race(key, finishing_order)
+    liability_book.forget([key])
+    with programme_lock:
+        publish_programme([r for r in races_list if r['id'] != race['id']])
+    live_races.forget(key)
+
+race_scheduler = None
+if os.environ.get('RACE_SCHEDULER', '').lower() in ('1', 'true', 'yes'):
+    publish_programme([])
+    race_scheduler = RaceScheduler(
+        make_scheduled_race,
+        {'open': on_race_open, 'close': on_race_close, 'run': on_race_run, 'settle': on_race_settle},
+        SCHEDULED_TRACKS,
+        cadence_seconds=int(os.environ.get('RACE_CADENCE_SECONDS', 300)),
+        races_ahead=int(os.environ.get('RACE_PROGRAMME_DEPTH', 3))
+    ).start()
+else:
+    schedule_offs(races_list)
+
+def race_result(key):
+    """Official finishing order of a race (by race_key), or None while it is still to be run"""
+    if race_scheduler is None:
+        # Fixed programme: official once the race has gone off and the last runner is home
+        race = next((r for r in races_list if race_key(r) == key), None)
+        if race:
+            if not race_is_off(race):
+                return None
+            run = get_race_run(race)
+            if time.time() < to_timestamp(race['start_time']) + run['ticks'] * run['tick_ms'] / 1000:
+                return None
+            return run['finishing_order']
+    # Settled races (scheduled, or an earlier fixed programme) are stored with the ratings
+    return horse_ratings.finishing_order(key)
+# ----- End Race Scheduler -----
+
 # Add context processor for branding
 @app.context_processor
 def inject_branding():
@@ -86,15 +557,19 @@ def login():
         username = request.form['username']
         password = request.form['password']
         
-        conn = get_db()
-        c = conn.cursor()
-        c.execute("SELECT id, password_hash FROM users WHERE username = ?", (username,))
-        user = c.fetchone()
-        conn.close()
+        user = None
+        found = storage.find_user(username)
+        if found:
+            conn = storage.connect(found[1])
+            c = conn.cursor()
+            c.execute("SELECT id, password_hash, is_admin FROM users WHERE id = ?", (found[0],))
+            user = c.fetchone()
+            conn.close()
         
         if user and check_password_hash(user['password_hash'], password):
             session['user_id'] = user['id']
             session['username'] = username
+            session['is_admin'] = bool(user['is_admin'])
             return redirect(url_for('races'))
         else:
             flash('Invalid username or password')
@@ -118,11 +593,19 @@ def register():
         password_hash = generate_password_hash(password)
         
         try:
-            conn = get_db()
-            c = conn.cursor()
-            c.execute("INSERT INTO users (username, password_hash) VALUES (?, ?)", (username, password_hash))
-            conn.commit()
-            conn.close()
+            user_id, shard = storage.register(username)
+            try:
+                coins = db_writers[shard].call(insert_user, user_id, username, password_hash,
+                                               timeout=DB_WRITE_TIMEOUT)
+            except TimeoutError:
+                storage.unregister(user_id)
+                flash('Registration is busy right now, please try again')
+                return render_template('register.html')
+            except Exception:
+                storage.unregister(user_id)
+                raise
+            rank_index.update(user_id, coins, username)
+            invalidate_leaderboard()
             flash('Registration successful! Please log in.')
             return redirect(url_for('login'))
         except sqlite3.IntegrityError:
@@ -130,6 +613,12 @@ def register():
     
     return render_template('register.html')
 
+def insert_user(c, user_id, username, password_hash):
+    c.execute("INSERT INTO users (id, username, password_hash) VALUES (?, ?, ?)",
+              (user_id, username, password_hash))
+    c.execute("SELECT coins FROM users WHERE id = ?", (user_id,))
+    return c.fetchone()['coins']
+
 @app.route('/logout')
 def logout():
     session.clear()
@@ -138,74 +627,418 @@ def logout():
 @app.route('/races')
 @login_required
 def races():
-    # Generate virtual races compatible with your templates
-    horse_names = [
-        'Thunder Bolt', 'Lightning Strike', 'Storm Runner', 'Fire Flash', 
-        'Wind Walker', 'Golden Arrow', 'Silver Bullet', 'Royal Champion',
-        'Midnight Express', 'Golden Thunder', 'Swift Arrow', 'Dancing Star'
-    ]
-    
-    races = []
-    for i in range(3):
-        race_horses = random.sample(horse_names, 6)
-        race = {
-            'id': i + 1,
-            'meeting_name': f'RaceCoin Track - Race {i + 1}',
-            'start_time': (datetime.now() + timedelta(hours=i+1)).isoformat(),
-            'track': 'RaceCoin Racecourse',
-            'race_number': i + 1,
-            'runners': []
-        }
-        
-        for idx, horse in enumerate(race_horses):
-            race['runners'].append({
-                'name': horse,
-                'number': idx + 1,
-                'odds': {
-                    'decimal': round(random.uniform(2.0, 8.0), 2)
-                },
-                'jockey': f'Jockey {idx + 1}',
-                'weight': f'{random.randint(8, 10)}-{random.randint(0, 13)}'
-            })
-        
-        races.append(race)
-    
-    return render_template('races.html', races=races)
+    race_cards_html = render_fragment(
+        'race_cards', '_race_cards.html', lambda: {'races': [priced_race(r) for r in races_list]}
+    )
+    coins = get_user_coins(session['user_id'])
+    return render_template('races.html', race_cards_html=race_cards_html,
+                           coins=coins, username=session.get('username'))
+
+@app.route('/admin/refresh-races')
+@admin_required
+def refresh_races_manual():
+    if race_scheduler is not None:
+        flash('Races are scheduled automatically')
+        return redirect(url_for('races'))
+    refresh_races_list()
+    flash('Race programme republished')
+    return redirect(url_for('races'))
+
+def get_user_coins(user_id):
+    return balances.balance(user_id)
 
-@app.route('/place_bet/<int:race_id>')
+def adjust_user_coins(user_id, delta):
+    """Credit or debit a player; returns the new balance, or None if they can't cover a debit"""
+    coins = balances.apply(user_id, delta)
+    if coins is not None:
+        rank_index.update(user_id, coins)
+        invalidate_leaderboard()
+    return coins
+
+# ----- Bets -----
+# Bets are stored on the player's shard as soon as they are paid for and
+# stay 'open' until settled. Settling flips the row to won/lost with
+# UPDATE ... WHERE status = 'open' in the same transaction as the stats,
+# and only bets this request actually closed are paid out, so a replayed
+# or concurrent /results can never pay a bet twice.
+
+def record_bet(user_id, kind, stake, details, key=None):
+    """Store a placed (already debited) bet; returns its number for this player
+
+    Raises if the bet was not stored (including TimeoutError), so the caller can refund it.
+    """
+    return writer_for(user_id).call(insert_bet, user_id, key, kind, stake, json.dumps(details),
+                                    timeout=DB_WRITE_TIMEOUT)
+
+def insert_bet(c, user_id, key, kind, stake, details):
+    c.execute("SELECT COALESCE(MAX(bet_no), 0) + 1 FROM bets WHERE user_id = ?", (user_id,))
+    bet_no = c.fetchone()[0]
+    c.execute("INSERT INTO bets (user_id, bet_no, race_key, kind, stake, details) VALUES (?, ?, ?, ?, ?, ?)",
+              (user_id, bet_no, key, kind, stake, details))
+    return bet_no
+
+def open_bets(user_id):
+    conn = get_user_db(user_id)
+    rows = conn.execute("SELECT bet_no, kind, race_key, stake, details FROM bets "
+                        "WHERE user_id = ? AND status = 'open' ORDER BY bet_no", (user_id,)).fetchall()
+    conn.close()
+    return [(row['bet_no'], row['kind'], row['race_key'], row['stake'], json.loads(row['details'])) for row in rows]
+
+def settle_bets(user_id, outcomes):
+    """Close open bets and record their stats in one transaction; returns the bet numbers closed
+
+    outcomes are (bet_no, won, payout, stake, acca_win) tuples. Raises TimeoutError
+    (nothing closed) if the writer is too busy to start it in time.
+    """
+    closed = writer_for(user_id).call(close_bets, user_id, outcomes, timeout=DB_WRITE_TIMEOUT)
+    fragment_cache.bump('period_boards')
+    return closed
+
+def close_bets(c, user_id, outcomes):
+    closed = []
+    for bet_no, won, payout, stake, acca_win in outcomes:
+        c.execute("UPDATE bets SET status = ?, payout = ?, settled_at = CURRENT_TIMESTAMP "
+                  "WHERE user_id = ? AND bet_no = ? AND status = 'open'",
+                  ('won' if won else 'lost', payout, user_id, bet_no))
+        if c.rowcount:
+            write_user_stats(c, user_id, stake, won, payout, acca_win)
+            closed.append(bet_no)
+    return closed
+# ----- End Bets -----
+
+@app.route('/place_bet/<int:race_id>', methods=['GET', 'POST'])
 @login_required
 def place_bet(race_id):
-    # Simple betting page - you can expand this later
-    return render_template('place_bet.html', race_id=race_id)
+    card = get_race(race_id)
+    if not card:
+        return 'Race not found', 404
+    race = priced_race(card)
+    user_id = session['user_id']
+    coins = get_user_coins(user_id)
+    error_message = None
+
+    if request.method == 'POST':
+        horse = request.form.get('horse')
+        forecast_first = request.form.get('forecast_first')
+        forecast_second = request.form.get('forecast_second')
+        try:
+            amount = int(request.form.get('amount', 0))
+        except ValueError:
+            amount = 0
+        try:
+            forecast_amount = int(request.form.get('forecast_amount', 0))
+        except ValueError:
+            forecast_amount = 0
+
+        win_bet_valid = horse and amount > 0
+        forecast_bet_valid = (
+            forecast_first and forecast_second
+            and forecast_first != forecast_second
+            and forecast_amount > 0
+        )
+        bet = None
+        if race_is_off(card):
+            error_message = "Betting has closed for this race"
+        elif win_bet_valid and forecast_bet_valid:
+            error_message = "Please place either a single bet OR a forecast bet, not both for the same race."
+        elif win_bet_valid:
+            if horse not in race['odds']:
+                error_message = "Invalid horse choice"
+            # Paid for before the book takes it, so money the player doesn't have never moves the odds
+            elif adjust_user_coins(user_id, -amount) is None:
+                error_message = "Not enough coins"
+            else:
+                # Priced and recorded by the liability book (may refuse if the book is full)
+                odds, error_message = liability_book.place(race_key(card), card['odds'], horse, amount)
+                if error_message:
+                    adjust_user_coins(user_id, amount)
+            if not error_message:
+                bet = {
+                    'race_id': race_id,
+                    'type': 'win',
+                    'horse': horse,
+                    'amount': amount,
+                    'odds': odds,
+                    'fractional_odds': decimal_to_nearest_fraction(odds),
+                    'is_favourite': any(h['is_favourite'] for h in race['horses'] if h['name'] == horse)
+                }
+        elif forecast_bet_valid:
+            if forecast_first not in race['odds'] or forecast_second not in race['odds']:
+                error_message = "Invalid horse choice"
+            elif adjust_user_coins(user_id, -forecast_amount) is None:
+                error_message = "Not enough coins"
+            else:
+                odds = forecast_odds(race['odds'][forecast_first], race['odds'][forecast_second])
+                # Pays only if the first pick wins, so it counts against that runner's exposure
+                error_message = liability_book.cover([(race_key(card), card['odds'], forecast_first,
+                                                       forecast_amount, int(forecast_amount * odds))])
+                if error_message:
+                    adjust_user_coins(user_id, forecast_amount)
+                else:
+                    bet = {
+                        'race_id': race_id,
+                        'type': 'forecast',
+                        'forecast_first': forecast_first,
+                        'forecast_second': forecast_second,
+                        'amount': forecast_amount,
+                        'odds': odds
+                    }
+        else:
+            error_message = "No valid bet placed"
+
+        if bet:
+            try:
+                record_bet(user_id, bet['type'], bet['amount'], bet, key=race_key(card))
+            except Exception as e:
+                print(f"DEBUG: Bet not stored, refunding: {e}")
+                adjust_user_coins(user_id, bet['amount'])
+                error_message = "Your bet could not be placed, please try again"
+            else:
+                if bet['type'] == 'win':
+                    refresh_prices_if_moved(race)
+                return redirect(url_for('race_animation', race_id=race_id))
+
+    return render_template('place_bet.html', race=race, coins=coins, error_message=error_message)
+
+@app.route('/race_animation/<int:race_id>')
+@login_required
+def race_animation(race_id):
+    race = get_race(race_id)
+    if not race:
+        return 'Race not found', 404
+    # Before the off the page only gets the field; the result arrives with the live race
+    run = get_race_run(race) if race_is_off(race) else {'winner': None, 'winner_index': None}
+    return render_template(
+        'race_animation.html',
+        race={**race, 'horses': [h['name'] for h in race['horses']]},
+        winner=run['winner'],
+        winner_index=run['winner_index'],
+        trajectory_url=url_for('race_trajectory', race_id=race_id),
+        stream_url=url_for('race_stream', race_id=race_id)
+    )
+
+# Every open stream holds one of the worker's gunicorn threads (gunicorn.conf.py), so
+# streams may use all but STREAM_RESERVED_THREADS of them; past that, viewers are turned
+# away with a 503 and replay the trajectory instead. Viewers who arrive long before the
+# off don't hold a thread while they wait: they get the field and reconnect nearer the time.
+STREAM_RESERVED_THREADS = int(os.environ.get('STREAM_RESERVED_THREADS', 20))
+MAX_STREAMS = int(os.environ.get('MAX_STREAMS', 0)) or max(
+    1, int(os.environ.get('GUNICORN_THREADS', 200)) - STREAM_RESERVED_THREADS)
+STREAM_WAIT_SECONDS = 30
+stream_slots = threading.BoundedSemaphore(MAX_STREAMS)
+
+@app.route('/race_stream/<int:race_id>')
+@login_required
+def race_stream(race_id):
+    race = get_race(race_id)
+    if not race:
+        return 'Race not found', 404
+    try:
+        last_event_id = int(request.headers.get('Last-Event-ID', 0))
+    except ValueError:
+        last_event_id = 0
+    live = live_races.get(race_key(race), get_race_run(race))
+    until_off = to_timestamp(race['start_time']) - time.time()
+    waiting = not live.started and not last_event_id
+
+    if waiting and until_off > STREAM_WAIT_SECONDS:
+        # Close straight away; the browser reconnects (retry) shortly before the off
+        retry_ms = int(min(until_off - STREAM_WAIT_SECONDS / 2, 300) * 1000)
+        return Response(f"retry: {retry_ms}\n\n" + format_sse(0, 'waiting', race_field_json(race)),
+                        mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+    if not stream_slots.acquire(blocking=False):
+        return Response('Too many live viewers, try again shortly', 503, headers={'Retry-After': '5'})
+
+    def stream():
+        # Watching never starts the race: before the off, send the field and start time and wait
+        if waiting:
+            yield format_sse(0, 'waiting', race_field_json(race))
+        yield from live.stream(last_event_id)
+
+    response = Response(stream(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+    # Runs when the server closes the response, even if the stream never started
+    response.call_on_close(stream_slots.release)
+    return response
+
+def race_field_json(race):
+    return json.dumps({
+        'race_id': race['id'],
+        'start_time': race['start_time'],
+        'runners': [h['name'] for h in race['horses']]
+    }, separators=(',', ':'))
+
+@app.route('/api/races/<int:race_id>/trajectory')
+@login_required
+def race_trajectory(race_id):
+    race = get_race(race_id)
+    if not race:
+        return {'error': 'Race not found'}, 404
+    if not race_is_off(race):
+        return {'error': 'Race has not gone off yet', 'start_time': race['start_time']}, 403
+    return app.response_class(get_trajectory_json(race), mimetype='application/json')
 
 @app.route('/results')
 @login_required  
 def results():
-    return render_template('results.html', results=[])
+    """Settle the player's open bets against the official race results"""
+    user_id = session['user_id']
+    results_info = []
+    outcomes = []
+    # Bets on races that have not finished yet stay open
+    pending = 0
 
-@app.route('/leaderboard')
+    for bet_no, kind, key, stake, bet in open_bets(user_id):
+        if kind == 'multi':
+            orders = [race_result(s['race_key']) for s in bet['selections']]
+            if not all(orders):
+                pending += 1
+                continue
+            won = all(order[0] == s['horse'] for order, s in zip(orders, bet['selections']))
+            win_amount = int(stake * bet['accumulator_odds']) if won else 0
+            outcomes.append((bet_no, won, win_amount, stake, win_amount))
+            results_info.append({
+                'race_id': ' + '.join(str(s['race_id']) for s in bet['selections']),
+                'bet_type': 'Multi',
+                'user_selections': [s['horse'] for s in bet['selections']],
+                'amount': stake,
+                'odds': bet['accumulator_odds'],
+                'won': won,
+                'win_amount': win_amount
+            })
+            continue
+        order = race_result(key)
+        if not order:
+            pending += 1
+            continue
+        winner = order[0]
+        second = order[1] if len(order) > 1 else None
+        if kind == 'forecast':
+            won = winner == bet['forecast_first'] and second == bet['forecast_second']
+        else:
+            won = winner == bet['horse']
+        win_amount = int(stake * bet['odds']) if won else 0
+        outcomes.append((bet_no, won, win_amount, stake, 0))
+        results_info.append({
+            **bet,
+            'bet_type': 'Forecast' if kind == 'forecast' else 'Win',
+            'won': won,
+            'win_amount': win_amount,
+            'winner': winner,
+            'second': second
+        })
+
+    # Another request may have settled some of these first: only show and pay what this one closed
+    try:
+        closed = set(settle_bets(user_id, outcomes)) if outcomes else set()
+    except TimeoutError:
+        # Withdrawn before it ran: the bets are still open and settle on the next visit
+        flash('Settling is busy right now, refresh in a moment')
+        closed = set()
+        pending += len(outcomes)
+    results_info = [info for info, outcome in zip(results_info, outcomes) if outcome[0] in closed]
+    winnings = sum(info['win_amount'] for info in results_info)
+
+    if winnings:
+        coins = adjust_user_coins(user_id, winnings)
+    else:
+        coins = get_user_coins(user_id)
+        if results_info:
+            invalidate_leaderboard()
+    return render_template('results.html', results=results_info, coins=coins, pending=pending,
+                           position=rank_index.position(user_id), total_players=rank_index.total())
+
+@app.route('/multi_bet', methods=['GET', 'POST'])
 @login_required
-def leaderboard():
-    conn = get_db()
-    c = conn.cursor()
-    c.execute("SELECT username, coins, wins, total_bets FROM users ORDER BY coins DESC LIMIT 10")
-    users = c.fetchall()
-    conn.close()
-    
+def multi_bet():
+    coins = get_user_coins(session['user_id'])
+    if request.method == 'POST':
+        selections = []
+        cards = []
+        accumulator_odds = 1.0
+        for card in races_list:
+            race = priced_race(card)
+            horse = request.form.get(f"race_{race['id']}")
+            if horse and horse in race['odds'] and not race_is_off(race):
+                accumulator_odds *= race['odds'][horse]
+                selections.append({'race_id': race['id'], 'race_key': race_key(race), 'horse': horse,
+                                   'odds': race['odds'][horse]})
+                cards.append(card)
+        try:
+            stake = int(request.form.get('multi_stake', 0))
+        except ValueError:
+            stake = 0
+        if len(selections) < 2 or stake <= 0 or adjust_user_coins(session['user_id'], -stake) is None:
+            flash('Invalid multi-bet: pick at least two races and a stake you can cover')
+            return redirect(url_for('multi_bet'))
+        # The whole payout is at risk in every leg (it pays only if they all win)
+        payout = int(stake * round(accumulator_odds, 2))
+        error_message = liability_book.cover([(s['race_key'], card['odds'], s['horse'], 0, payout)
+                                              for s, card in zip(selections, cards)])
+        if error_message:
+            adjust_user_coins(session['user_id'], stake)
+            flash(error_message)
+            return redirect(url_for('multi_bet'))
+        try:
+            record_bet(session['user_id'], 'multi', stake, {
+                'selections': selections,
+                'accumulator_odds': round(accumulator_odds, 2)
+            })
+        except Exception as e:
+            print(f"DEBUG: Bet not stored, refunding: {e}")
+            adjust_user_coins(session['user_id'], stake)
+            flash('Your bet could not be placed, please try again')
+            return redirect(url_for('multi_bet'))
+        flash(f'Multi bet placed at {round(accumulator_odds, 2)}')
+        return redirect(url_for('races'))
+
+    race_selections_html = render_fragment(
+        'race_cards', '_multi_bet_races.html', lambda: {'races': [priced_race(r) for r in races_list]}
+    )
+    return render_template('multi_bet.html', race_selections_html=race_selections_html, coins=coins)
+
+def load_leaderboard():
+    balances.flush()
+    users = storage.merge_top("SELECT id, username, coins, wins, total_bets FROM users "
+                              "ORDER BY coins DESC, id ASC LIMIT 10", (),
+                              key=lambda row: (-row['coins'], row['id']), limit=10)
+
     leaderboard = []
     for user in users:
         user_dict = dict(user)
         user_dict['rank'] = 'Rookie'
         user_dict['achievements'] = []
         leaderboard.append(user_dict)
-    
-    return render_template('leaderboard.html', leaderboard=leaderboard)
+    return leaderboard
+
+@app.route('/leaderboard')
+@login_required
+def leaderboard():
+    leaderboard_rows_html = render_fragment(
+        'leaderboard', '_leaderboard_rows.html', lambda: {'leaderboard': load_leaderboard()}
+    )
+    period = request.args.get('period', 'week')
+    metric = request.args.get('metric', 'net')
+    if period not in PERIODS:
+        period = 'week'
+    if metric not in METRICS:
+        metric = 'net'
+    period_rows_html = render_fragment(
+        'period_boards', '_period_board_rows.html',
+        lambda: {'rows': period_board(period, metric), 'metric': metric},
+        key=(period, metric, bucket_key(period))
+    )
+    return render_template('leaderboard.html', leaderboard_rows_html=leaderboard_rows_html,
+                           period_rows_html=period_rows_html, period=period, metric=metric,
+                           periods=PERIODS, metrics=METRICS)
 
 @app.route('/profile')
 @login_required
 def profile():
     user_id = session['user_id']
-    conn = get_db()
+    conn = get_user_db(user_id)
     c = conn.cursor()
     c.execute("SELECT * FROM users WHERE id = ?", (user_id,))
     user = c.fetchone()
@@ -216,14 +1049,208 @@ def profile():
     
     user_dict = dict(user)
     # Add required fields that templates expect
-    user_dict['xp'] = 0
-    user_dict['rank'] = 'Rookie'
-    user_dict['number_rank'] = 1
-    user_dict['current_streak'] = 0
-    user_dict['biggest_single_win'] = 0
+    user_dict['number_rank'] = get_number_rank(user_dict['xp'])
+    user_dict['rank'] = get_rank_title(user_dict['number_rank'])
+    position, neighbours = rank_index.neighbours(user_id)
+    user_dict['position'] = position
+    user_dict['total_players'] = rank_index.total()
     user_dict['login_streak'] = 0
     
-    return render_template('profile.html', user=user_dict, achievements=[])
+    return render_template('profile.html', user=user_dict, achievements=[], neighbours=neighbours)
+
+# ----- JSON API v1 -----
+# Read-only endpoints for the mobile client. Shared payloads are serialized
+# once per data version (race programme / leaderboard) and served as cached
+# bytes with an ETag, so a polling client is a cache hit or a 304.
+API_DEFAULT_LIMIT = 20
+API_MAX_LIMIT = 100
+
+def api_login_required(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if 'user_id' not in session:
+            return {'error': 'Authentication required'}, 401
+        return f(*args, **kwargs)
+    return decorated_function
+
+def encode_cursor(values):
+    raw = json.dumps(values, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor, size):
+    """The cursor's list of `size` ints, or None if it is malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(values, list) or len(values) != size or \
+            not all(isinstance(v, int) for v in values):
+        return None
+    return values
+
+def api_page_args(cursor_size):
+    """(cursor, limit) from the query string, or None for a bad cursor; cursor is None on the first page"""
+    try:
+        limit = int(request.args.get('limit', API_DEFAULT_LIMIT))
+    except ValueError:
+        limit = API_DEFAULT_LIMIT
+    limit = max(1, min(limit, API_MAX_LIMIT))
+    cursor = request.args.get('cursor') or None
+    if cursor is not None and decode_cursor(cursor, cursor_size) is None:
+        return None
+    return cursor, limit
+
+def serialize_payload(payload):
+    body = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    return body, '"%s"' % hashlib.sha256(body).hexdigest()[:32]
+
+def cached_payload(namespace, key, build):
+    """(body, etag) for a shared payload, built and serialized once per namespace version"""
+    return fragment_cache.get_or_render(namespace, ('api', key), lambda: serialize_payload(build()))
+
+def api_response(body, etag, cache_control='private, no-cache'):
+    response = app.response_class(body, mimetype='application/json')
+    response.headers['ETag'] = etag
+    response.headers['Cache-Control'] = cache_control
+    return response.make_conditional(request)
+
+def race_payload(card):
+    race = priced_race(card)
+    return {
+        'id': race['id'],
+        'title': race['title'],
+        'track': race['track'],
+        'race_number': race['race_number'],
+        'start_time': race['start_time'],
+        'is_real_race': race['is_real_race'],
+        'runners': [{
+            'name': h['name'],
+            'form': h['form'],
+            'odds': h['odds'],
+            'fractional_odds': h['fractional_odds'],
+            'is_favourite': h['is_favourite']
+        } for h in race['horses']],
+        'links': {
+            'trajectory': url_for('race_trajectory', race_id=race['id']),
+            'stream': url_for('race_stream', race_id=race['id'])
+        }
+    }
+
+def race_filters():
+    """Optional ?track=&horse=&from=&to= filters for the races endpoint; None if a time is invalid"""
+    filters = {'course': request.args.get('track') or None, 'horse': request.args.get('horse') or None}
+    try:
+        filters['start'] = to_timestamp(request.args['from']) if request.args.get('from') else None
+        filters['end'] = to_timestamp(request.args['to']) if request.args.get('to') else None
+    except ValueError:
+        return None
+    return filters
+
+def build_races_page(cursor, limit, filters):
+    after_id = decode_cursor(cursor, 1)[0] if cursor else 0
+    store = race_store
+    rows = store.filter(**filters)
+    rows = rows[np.argsort(store.race_ids[rows], kind='stable')]
+    rows = rows[store.race_ids[rows] > after_id]
+    remaining = [store.races[row] for row in rows[:limit + 1]]
+    page = remaining[:limit]
+    next_cursor = encode_cursor([page[-1]['id']]) if len(remaining) > limit else None
+    return {'races': [race_payload(r) for r in page], 'next_cursor': next_cursor}
+
+def build_leaderboard_page(cursor, limit):
+    """Keyset page ordered by coins desc, id asc; the cursor is the last (coins, id) seen"""
+    balances.flush()
+    if cursor is None:
+        sql, params = ("SELECT id, username, coins, wins, total_bets FROM users "
+                       "ORDER BY coins DESC, id ASC LIMIT ?", (limit + 1,))
+    else:
+        coins, user_id = decode_cursor(cursor, 2)
+        sql, params = ("SELECT id, username, coins, wins, total_bets FROM users "
+                       "WHERE coins < ? OR (coins = ? AND id > ?) "
+                       "ORDER BY coins DESC, id ASC LIMIT ?", (coins, coins, user_id, limit + 1))
+    # Each shard's own page, merged: the first limit + 1 overall are among them
+    rows = storage.merge_top(sql, params, key=lambda row: (-row['coins'], row['id']), limit=limit + 1)
+    page = rows[:limit]
+    next_cursor = encode_cursor([page[-1]['coins'], page[-1]['id']]) if len(rows) > limit else None
+    return {
+        'players': [{
+            'username': row['username'],
+            'coins': row['coins'],
+            'wins': row['wins'],
+            'total_bets': row['total_bets']
+        } for row in page],
+        'next_cursor': next_cursor
+    }
+
+@app.route('/api/v1/races')
+@api_login_required
+def api_races():
+    args = api_page_args(cursor_size=1)
+    if args is None:
+        return {'error': 'Invalid cursor'}, 400
+    cursor, limit = args
+    filters = race_filters()
+    if filters is None:
+        return {'error': 'Invalid from/to time'}, 400
+    body, etag = cached_payload('race_cards', ('races', cursor, limit, tuple(sorted(filters.items()))),
+                                lambda: build_races_page(cursor, limit, filters))
+    return api_response(body, etag)
+
+@app.route('/api/v1/races/<int:race_id>')
+@api_login_required
+def api_race(race_id):
+    race = get_race(race_id)
+    if not race:
+        return {'error': 'Race not found'}, 404
+    body, etag = cached_payload('race_cards', ('race', race_id), lambda: race_payload(race))
+    return api_response(body, etag)
+
+@app.route('/api/v1/leaderboard')
+@api_login_required
+def api_leaderboard():
+    args = api_page_args(cursor_size=2)
+    if args is None:
+        return {'error': 'Invalid cursor'}, 400
+    cursor, limit = args
+    body, etag = cached_payload('leaderboard', ('players', cursor, limit),
+                                lambda: build_leaderboard_page(cursor, limit))
+    return api_response(body, etag)
+
+@app.route('/api/v1/search')
+@api_login_required
+def api_search():
+    """Autocomplete: ?q=<typed prefix>&kind=horse|course&limit="""
+    requested = request.args.getlist('kind')
+    kinds = [k for k in requested if k in SEARCH_KINDS] if requested else list(SEARCH_KINDS)
+    if not kinds:
+        return {'error': 'kind must be one of: ' + ', '.join(SEARCH_KINDS)}, 400
+    try:
+        limit = max(1, min(int(request.args.get('limit', 10)), 25))
+    except ValueError:
+        limit = 10
+    results = search_index.search(request.args.get('q', ''), limit=limit, kinds=kinds)
+    for result in results:
+        for race in result['races']:
+            race['url'] = url_for('api_race', race_id=race['id'])
+    return {'results': results}
+
+@app.route('/api/v1/me')
+@api_login_required
+def api_me():
+    conn = get_user_db(session['user_id'])
+    c = conn.cursor()
+    c.execute("SELECT id, username, coins, wins, total_bets FROM users WHERE id = ?",
+              (session['user_id'],))
+    user = c.fetchone()
+    conn.close()
+    if not user:
+        return {'error': 'Authentication required'}, 401
+    # Per-user, so never shared: still gets an ETag for cheap polling
+    body, etag = serialize_payload({**dict(user), 'coins': get_user_coins(user['id']),
+                                    'position': rank_index.position(user['id'])})
+    return api_response(body, etag)
+# ----- End JSON API v1 -----
 
 if __name__ == "__main__":
     app.run(debug=True, host='0.0.0.0', port=5000)
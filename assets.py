@@ -0,0 +1,70 @@
+# RaceCoin - Built static assets
+#
+# build_assets.py writes content-hashed files to static/dist/ and a manifest
+# mapping logical names to them. Templates ask for assets by logical name;
+# when no build has been run they fall back to the pinned CDN release.
+
+import json
+import os
+
+from flask import request, url_for
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STATIC_DIR = os.path.join(BASE_DIR, "static")
+DIST_DIR = os.path.join(STATIC_DIR, "dist")
+MANIFEST_FILE = os.path.join(DIST_DIR, "manifest.json")
+
+# One Bootstrap version for every page
+BOOTSTRAP_VERSION = "5.3.0"
+CDN_URLS = {
+    'app.css': f"https://cdn.jsdelivr.net/npm/bootstrap@{BOOTSTRAP_VERSION}/dist/css/bootstrap.min.css",
+    'app.js': f"https://cdn.jsdelivr.net/npm/bootstrap@{BOOTSTRAP_VERSION}/dist/js/bootstrap.bundle.min.js",
+}
+
+# Hashed filenames never change content, so browsers may keep them forever
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+def load_manifest(path=MANIFEST_FILE):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {'files': {}, 'sprites': []}
+
+
+def init_app(app):
+    manifest = load_manifest()
+    files = manifest.get('files', {})
+    if files:
+        print(f"DEBUG: Loaded asset manifest with {len(files)} built files")
+
+    def asset_url(name):
+        """URL for a logical asset name (e.g. 'app.js'), or None if it was not built"""
+        if name in files:
+            return url_for('static', filename=f"dist/{files[name]}")
+        return CDN_URLS.get(name)
+
+    def asset_stylesheets():
+        """Stylesheets every page needs: the bundle, or pinned CDN Bootstrap plus sprite CSS"""
+        if 'app.css' in files:
+            return [asset_url('app.css')]
+        sheets = [CDN_URLS['app.css']]
+        if 'sprites.css' in files:
+            sheets.append(asset_url('sprites.css'))
+        return sheets
+
+    @app.context_processor
+    def inject_assets():
+        return {
+            'asset_url': asset_url,
+            'asset_stylesheets': asset_stylesheets,
+            'horse_sprites': manifest.get('sprites', [])
+        }
+
+    @app.after_request
+    def cache_built_assets(response):
+        if request.path.startswith('/static/dist/') and not request.path.endswith('manifest.json') \
+                and response.status_code in (200, 304):
+            response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+        return response
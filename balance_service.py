@@ -0,0 +1,232 @@
+# RaceCoin - Coin balances with a write-ahead journal
+#
+# Balances are served from memory. Every debit or credit is one line
+# appended (and fsynced) to a journal file, which is what makes it durable;
+# the users table is brought up to date in one group commit every few
+# seconds. Workers share the journal: appends take an exclusive file lock
+# and every process tails the lines the others wrote before it reads or
+# changes a balance, so all workers see the same coins. On start-up the
+# journal is replayed from the last checkpoint, and once it has been
+# committed and grown past ROTATE_BYTES it is swapped for an empty one.
+
+import json
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    # No file locks (Windows): only safe with a single worker process
+    fcntl = None
+
+ROTATE_BYTES = 4 * 1024 * 1024
+
+
+class BalanceService:
+    def __init__(self, get_db, journal_path, flush_seconds=2.0, sync=True, shard_of=None, connect_shard=None):
+        self.get_db = get_db
+        # Where each player's users row lives; by default everything is in get_db()
+        self.shard_of = shard_of or (lambda user_id: 0)
+        self.connect_shard = connect_shard or (lambda shard: get_db())
+        self.journal_path = journal_path
+        self.flush_seconds = flush_seconds
+        # fsync every append; without it a crash can lose the last few bets (the OS still has them on exit)
+        self.sync = sync
+        self._balances = {}
+        self._dirty = set()
+        self._journal = None
+        self._inode = None
+        self._offset = 0
+        self._partial = b''
+        self._lock = threading.Lock()
+        self._flusher = None
+
+    def init_schema(self):
+        conn = self.get_db()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS balance_checkpoint (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                journal_offset INTEGER NOT NULL
+            )
+        ''')
+        conn.commit()
+        conn.close()
+
+    # ----- Journal -----
+
+    def _acquire(self, exclusive):
+        """Lock the current journal file, reopening it if another worker rotated it meanwhile"""
+        if self._journal is None:
+            self._open()
+            self._start_flusher()
+        while fcntl is not None:
+            fcntl.flock(self._journal.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                if os.stat(self.journal_path).st_ino == self._inode:
+                    return
+            except FileNotFoundError:
+                pass
+            # Rotated after a group commit: the database is current up to the swap
+            fcntl.flock(self._journal.fileno(), fcntl.LOCK_UN)
+            self._journal.close()
+            self._open()
+
+    def _release(self):
+        if fcntl is not None and self._journal is not None:
+            fcntl.flock(self._journal.fileno(), fcntl.LOCK_UN)
+
+    def _open(self):
+        """Open the current journal and replay it from the last checkpoint"""
+        self._journal = open(self.journal_path, 'a+b')
+        self._inode = os.fstat(self._journal.fileno()).st_ino
+        self._balances = {}
+        self._dirty = set()
+        self._partial = b''
+        conn = self.get_db()
+        row = conn.execute("SELECT journal_offset FROM balance_checkpoint WHERE id = 1").fetchone()
+        conn.close()
+        size = os.fstat(self._journal.fileno()).st_size
+        self._offset = row[0] if row and row[0] <= size else 0
+        self._catch_up()
+
+    def _catch_up(self):
+        """Apply lines appended since we last looked (ours or another worker's)"""
+        size = os.fstat(self._journal.fileno()).st_size
+        if size <= self._offset:
+            return
+        self._journal.seek(self._offset)
+        data = self._partial + self._journal.read(size - self._offset)
+        self._offset = size
+        lines = data.split(b'\n')
+        # A line still being written (or torn by a crash) waits for its newline
+        self._partial = lines.pop()
+        for line in lines:
+            if not line:
+                continue
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                print(f"DEBUG: Skipping unreadable balance journal line at {self._offset}")
+                continue
+            self._balances[entry['u']] = entry['b']
+            self._dirty.add(entry['u'])
+
+    def _append(self, user_id, delta, balance):
+        line = json.dumps({'u': user_id, 'd': delta, 'b': balance, 't': round(time.time(), 3)},
+                          separators=(',', ':')).encode() + b'\n'
+        if self._partial:
+            # Cut off a torn line so ours starts cleanly
+            line = b'\n' + line
+            self._partial = b''
+        self._journal.seek(0, os.SEEK_END)
+        self._journal.write(line)
+        self._journal.flush()
+        if self.sync:
+            os.fsync(self._journal.fileno())
+        self._offset = self._journal.tell()
+
+    # ----- Balances -----
+
+    def _load(self, user_id):
+        if user_id not in self._balances:
+            conn = self.connect_shard(self.shard_of(user_id))
+            row = conn.execute("SELECT coins FROM users WHERE id = ?", (user_id,)).fetchone()
+            conn.close()
+            if row is None:
+                return None
+            self._balances[user_id] = row[0]
+        return self._balances[user_id]
+
+    def balance(self, user_id):
+        """Current coins (0 for an unknown user)"""
+        with self._lock:
+            self._acquire(exclusive=False)
+            try:
+                self._catch_up()
+                coins = self._load(user_id)
+            finally:
+                self._release()
+        return coins or 0
+
+    def apply(self, user_id, delta):
+        """Credit (or debit, if negative) a user; returns the new balance, or None if it would go below 0"""
+        with self._lock:
+            self._acquire(exclusive=True)
+            try:
+                self._catch_up()
+                coins = self._load(user_id)
+                if coins is None or coins + delta < 0:
+                    return None
+                coins += delta
+                self._append(user_id, delta, coins)
+                self._balances[user_id] = coins
+                self._dirty.add(user_id)
+            finally:
+                self._release()
+        return coins
+
+    # ----- Group commit -----
+
+    def flush(self):
+        """Write every changed balance (one transaction per shard), then the journal checkpoint"""
+        with self._lock:
+            self._acquire(exclusive=True)
+            try:
+                self._catch_up()
+                if not self._dirty:
+                    return 0
+                # On failure the balances are still journaled and in memory; the next flush retries
+                by_shard = {}
+                for u in self._dirty:
+                    by_shard.setdefault(self.shard_of(u), []).append((self._balances[u], u))
+                for shard, rows in by_shard.items():
+                    conn = self.connect_shard(shard)
+                    conn.executemany("UPDATE users SET coins = ? WHERE id = ?", rows)
+                    conn.commit()
+                    conn.close()
+                # The checkpoint only moves once every shard has its balances
+                conn = self.get_db()
+                conn.execute('''
+                    INSERT INTO balance_checkpoint (id, journal_offset) VALUES (1, ?)
+                    ON CONFLICT (id) DO UPDATE SET journal_offset = excluded.journal_offset
+                ''', (self._offset - len(self._partial),))
+                conn.commit()
+                conn.close()
+                self._dirty.clear()
+                if self._offset >= ROTATE_BYTES and not self._partial:
+                    self._rotate()
+            finally:
+                self._release()
+        return sum(len(rows) for rows in by_shard.values())
+
+    def _rotate(self):
+        """Swap in an empty journal; everything in the old one is committed"""
+        conn = self.get_db()
+        conn.execute("UPDATE balance_checkpoint SET journal_offset = 0 WHERE id = 1")
+        conn.commit()
+        conn.close()
+        fresh = self.journal_path + '.new'
+        open(fresh, 'wb').close()
+        os.replace(fresh, self.journal_path)
+        # Other workers notice the new inode once they hold the lock, and reopen
+        self._release()
+        self._journal.close()
+        self._journal = open(self.journal_path, 'a+b')
+        self._inode = os.fstat(self._journal.fileno()).st_ino
+        self._offset = 0
+        print(f"DEBUG: Rotated balance journal {self.journal_path}")
+
+    def _start_flusher(self):
+        if self._flusher is not None:
+            return
+        self._flusher = threading.Thread(target=self._flush_loop, daemon=True, name='balance-flush')
+        self._flusher.start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_seconds)
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"DEBUG: Balance flush failed: {e}")
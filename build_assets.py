@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+RaceCoin asset build step
+
+Packs the horse PNGs in static/ into a single sprite atlas, bundles the pinned
+Bootstrap release with the sprite CSS, and writes everything to static/dist/
+under content-hashed filenames listed in static/dist/manifest.json.
+
+Usage:
+    python build_assets.py [--cell 128] [--offline]
+
+Requires Pillow. With --offline (or when the CDN is unreachable) the Bootstrap
+files are not vendored and templates keep loading the pinned CDN release.
+"""
+
+import argparse
+import glob
+import hashlib
+import io
+import json
+import math
+import os
+import shutil
+import sys
+import unicodedata
+
+from assets import BOOTSTRAP_VERSION, CDN_URLS, DIST_DIR, MANIFEST_FILE, STATIC_DIR
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# Zero-width characters have crept into some of the source filenames
+ZERO_WIDTH = dict.fromkeys(map(ord, '\u200b\u200c\u200d\u2060\ufeff'))
+
+
+def sprite_key(path):
+    """'static/Horse_paint_beige\\u200b.png' -> 'paint-beige'"""
+    name = os.path.splitext(os.path.basename(path))[0]
+    name = unicodedata.normalize('NFC', name).translate(ZERO_WIDTH)
+    if name.lower().startswith('horse_'):
+        name = name[len('horse_'):]
+    return name.lower().replace('_', '-').replace(' ', '-')
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()[:10]
+
+
+def write_hashed(stem, ext, data):
+    filename = f"{stem}.{content_hash(data)}.{ext}"
+    with open(os.path.join(DIST_DIR, filename), 'wb') as f:
+        f.write(data)
+    return filename
+
+
+def build_atlas(cell):
+    """Pack every horse image into one square-celled grid; returns (png bytes, sprites, cols, rows)"""
+    sources = sorted(glob.glob(os.path.join(STATIC_DIR, 'Horse_*.png')))
+    if not sources:
+        return None, {}, 0, 0
+
+    cols = math.ceil(math.sqrt(len(sources)))
+    rows = math.ceil(len(sources) / cols)
+    atlas = Image.new('RGBA', (cols * cell, rows * cell), (0, 0, 0, 0))
+    sprites = {}
+
+    for index, path in enumerate(sources):
+        with Image.open(path) as im:
+            im = im.convert('RGBA')
+            # Pad to a square canvas so sprites scale without distortion
+            side = max(im.size)
+            square = Image.new('RGBA', (side, side), (0, 0, 0, 0))
+            square.paste(im, ((side - im.width) // 2, (side - im.height) // 2))
+            square = square.resize((cell, cell), Image.LANCZOS)
+        col, row = index % cols, index // cols
+        atlas.paste(square, (col * cell, row * cell))
+        sprites[sprite_key(path)] = {'col': col, 'row': row}
+
+    # Palette quantisation keeps the atlas a fraction of the source size
+    buf = io.BytesIO()
+    atlas.quantize(colors=256, method=Image.FASTOCTREE).save(buf, format='PNG', optimize=True)
+    return buf.getvalue(), sprites, cols, rows
+
+
+def sprite_css(atlas_file, sprites, cols, rows):
+    lines = [
+        ".horse-atlas {",
+        f"    background-image: url('{atlas_file}');",
+        f"    background-size: {cols * 100}% {rows * 100}%;",
+        "    background-repeat: no-repeat;",
+        "}",
+    ]
+    for key, pos in sorted(sprites.items()):
+        x = 0 if cols == 1 else pos['col'] * 100 / (cols - 1)
+        y = 0 if rows == 1 else pos['row'] * 100 / (rows - 1)
+        lines.append(f".horse-{key} {{ background-position: {x:g}% {y:g}%; }}")
+    return "\n".join(lines) + "\n"
+
+
+def fetch_bootstrap():
+    """Download the pinned Bootstrap CSS/JS; returns (css, js) or (None, None)"""
+    try:
+        import requests
+        css = requests.get(CDN_URLS['app.css'], timeout=20)
+        js = requests.get(CDN_URLS['app.js'], timeout=20)
+        css.raise_for_status()
+        js.raise_for_status()
+    except Exception as e:
+        print(f"⚠️ Could not fetch Bootstrap {BOOTSTRAP_VERSION}: {e}")
+        return None, None
+    # The vendored CSS would otherwise point at a source map we don't ship
+    css_text = css.content.replace(b'/*# sourceMappingURL=bootstrap.min.css.map */', b'')
+    js_text = js.content.replace(b'//# sourceMappingURL=bootstrap.bundle.min.js.map', b'')
+    return css_text, js_text
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--cell', type=int, default=128, help='sprite cell size in px (default 128, 2x the on-page size)')
+    parser.add_argument('--offline', action='store_true', help="don't vendor Bootstrap from the CDN")
+    args = parser.parse_args(argv)
+
+    if Image is None:
+        print("❌ Pillow is required to build the sprite atlas: pip install Pillow")
+        return 1
+
+    shutil.rmtree(DIST_DIR, ignore_errors=True)
+    os.makedirs(DIST_DIR)
+    manifest = {'bootstrap_version': BOOTSTRAP_VERSION, 'files': {}, 'sprites': []}
+
+    atlas_png, sprites, cols, rows = build_atlas(args.cell)
+    css_parts = []
+    if atlas_png:
+        atlas_file = write_hashed('horses', 'png', atlas_png)
+        manifest['files']['horses.png'] = atlas_file
+        manifest['sprites'] = sorted(sprites)
+        css_parts.append(sprite_css(atlas_file, sprites, cols, rows).encode('utf-8'))
+        print(f"✅ Packed {len(sprites)} horse images into {atlas_file} ({len(atlas_png) // 1024} KB)")
+
+    bootstrap_css, bootstrap_js = (None, None) if args.offline else fetch_bootstrap()
+    if bootstrap_css:
+        css_parts.insert(0, bootstrap_css)
+        manifest['files']['app.js'] = write_hashed('app', 'js', bootstrap_js)
+    if css_parts:
+        # Bootstrap + sprites ship as one stylesheet; without Bootstrap the
+        # sprite CSS is still bundled and Bootstrap comes from the pinned CDN
+        key = 'app.css' if bootstrap_css else 'sprites.css'
+        manifest['files'][key] = write_hashed(key.split('.')[0], 'css', b"\n".join(css_parts))
+
+    with open(MANIFEST_FILE, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    for logical, hashed in sorted(manifest['files'].items()):
+        print(f"   {logical} -> dist/{hashed}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,218 @@
+# RaceCoin - Response compression and conditional GET middleware
+#
+# Wraps the Flask WSGI app: buffered text responses get a strong ETag from
+# the rendered body, If-None-Match is answered with 304, and bodies above a
+# size threshold are compressed with brotli (when installed) or gzip. HEAD
+# is answered from the headers of the same client's last GET of the URL, and
+# otherwise passed to the app untouched - it is never turned into a GET.
+
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+
+from fragment_cache import FragmentCache
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always available
+    brotli = None
+
+COMPRESSIBLE_TYPES = (
+    'text/html', 'text/css', 'text/plain', 'text/javascript',
+    'application/javascript', 'application/json', 'image/svg+xml'
+)
+
+# Streams must reach the client as they are produced
+STREAMING_TYPES = ('text/event-stream',)
+
+# Headers a HEAD answer may repeat from the GET it was recorded from (never cookies)
+HEAD_HEADERS = ('content-type', 'content-length', 'content-encoding', 'etag', 'vary', 'cache-control',
+                'expires', 'last-modified')
+
+
+def parse_accept_encoding(header):
+    """Return the set of encodings the client accepts with q > 0"""
+    accepted = set()
+    for part in (header or '').split(','):
+        pieces = part.strip().split(';')
+        coding = pieces[0].strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in pieces[1:]:
+            name, _, value = param.strip().partition('=')
+            if name == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if q > 0:
+            accepted.add(coding)
+    return accepted
+
+
+def etag_matches(if_none_match, etag):
+    """Weak comparison of an If-None-Match header against the ETag we would serve
+
+    Encoded variants carry a -gz/-br suffix, so a cached gzip copy only
+    validates if gzip is still what this request would get.
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    wanted = etag.strip('"')
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate.strip('"') == wanted:
+            return True
+    return False
+
+
+class CompressionMiddleware:
+    def __init__(self, app, min_size=500, gzip_level=6, brotli_quality=5, cache_size=128):
+        self.app = app
+        self.min_size = min_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        # Identical renders (same ETag) are only compressed once
+        self.encoded_cache = FragmentCache(maxsize=cache_size)
+        # (url, cookies, accept-encoding) -> (status, headers) of the last buffered GET, for HEAD
+        self.head_cache = OrderedDict()
+        self.head_cache_size = cache_size * 8
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _head_key(environ):
+        cookie = hashlib.sha256(environ.get('HTTP_COOKIE', '').encode('latin-1')).hexdigest()
+        return (environ.get('PATH_INFO', ''), environ.get('QUERY_STRING', ''), cookie,
+                environ.get('HTTP_ACCEPT_ENCODING', ''))
+
+    def _head(self, environ, start_response):
+        """Headers of the matching GET if we have them (same ETag and length), else the app's own HEAD"""
+        with self._lock:
+            cached = self.head_cache.get(self._head_key(environ))
+        if cached is None:
+            return self.app(environ, start_response)
+        start_response(*cached)
+        return []
+
+    def _remember_head(self, environ, status, headers):
+        key = self._head_key(environ)
+        with self._lock:
+            self.head_cache[key] = (status, [(k, v) for k, v in headers if k.lower() in HEAD_HEADERS])
+            self.head_cache.move_to_end(key)
+            while len(self.head_cache) > self.head_cache_size:
+                self.head_cache.popitem(last=False)
+
+    def __call__(self, environ, start_response):
+        method = environ.get('REQUEST_METHOD')
+        if method == 'HEAD':
+            return self._head(environ, start_response)
+        if method != 'GET':
+            return self.app(environ, start_response)
+
+        captured = {}
+        written = []
+
+        def capture_start_response(status, headers, exc_info=None):
+            captured['status'] = status
+            captured['headers'] = headers
+            captured['exc_info'] = exc_info
+            return written.append
+
+        app_iter = self.app(environ, capture_start_response)
+
+        if not self._should_buffer(captured):
+            write = start_response(captured['status'], captured['headers'], captured.get('exc_info'))
+            for chunk in written:
+                write(chunk)
+            return app_iter
+
+        try:
+            body = b''.join(written) + b''.join(app_iter)
+        finally:
+            if hasattr(app_iter, 'close'):
+                app_iter.close()
+
+        headers = [(k, v) for k, v in captured['headers'] if k.lower() != 'content-length']
+        etag = self._header(headers, 'ETag')
+        if not etag:
+            etag = '"%s"' % hashlib.sha256(body).hexdigest()[:32]
+            headers.append(('ETag', etag))
+        headers = self._add_vary(headers)
+
+        encoding = self._choose_encoding(environ, body)
+        served_etag = etag
+        if encoding:
+            suffix = 'br' if encoding == 'br' else 'gz'
+            served_etag = '"%s-%s"' % (etag.strip('"'), suffix)
+            headers = [(k, v) for k, v in headers if k.lower() != 'etag']
+            headers.append(('ETag', served_etag))
+
+        if etag_matches(environ.get('HTTP_IF_NONE_MATCH'), served_etag):
+            not_modified = [(k, v) for k, v in headers
+                            if k.lower() in ('etag', 'vary', 'cache-control', 'set-cookie', 'expires', 'date')]
+            start_response('304 Not Modified', not_modified)
+            return []
+
+        if encoding:
+            body = self.encoded_cache.get_or_render(
+                encoding, etag, lambda: self._encode(body, encoding)
+            )
+            headers.append(('Content-Encoding', encoding))
+
+        headers.append(('Content-Length', str(len(body))))
+        start_response(captured['status'], headers)
+        self._remember_head(environ, captured['status'], headers)
+        return [body]
+
+    def _should_buffer(self, captured):
+        if not captured['status'].startswith('200'):
+            return False
+        content_type = (self._header(captured['headers'], 'Content-Type') or '').split(';')[0].strip().lower()
+        if content_type in STREAMING_TYPES or content_type not in COMPRESSIBLE_TYPES:
+            return False
+        if self._header(captured['headers'], 'Content-Encoding'):
+            return False
+        if 'no-transform' in (self._header(captured['headers'], 'Cache-Control') or ''):
+            return False
+        return True
+
+    def _choose_encoding(self, environ, body):
+        if len(body) < self.min_size:
+            return None
+        accepted = parse_accept_encoding(environ.get('HTTP_ACCEPT_ENCODING'))
+        if brotli is not None and 'br' in accepted:
+            return 'br'
+        if 'gzip' in accepted:
+            return 'gzip'
+        return None
+
+    def _encode(self, body, encoding):
+        if encoding == 'br':
+            return brotli.compress(body, quality=self.brotli_quality)
+        return gzip.compress(body, compresslevel=self.gzip_level, mtime=0)
+
+    @staticmethod
+    def _header(headers, name):
+        name = name.lower()
+        for key, value in headers:
+            if key.lower() == name:
+                return value
+        return None
+
+    @staticmethod
+    def _add_vary(headers):
+        vary = None
+        for key, value in headers:
+            if key.lower() == 'vary':
+                vary = value
+        if vary and 'accept-encoding' in vary.lower():
+            return headers
+        headers = [(k, v) for k, v in headers if k.lower() != 'vary']
+        headers.append(('Vary', f'{vary}, Accept-Encoding' if vary else 'Accept-Encoding'))
+        return headers
@@ -0,0 +1,159 @@
+# RaceCoin - Single-writer SQLite queue
+#
+# SQLite allows one writer at a time, so request threads that each open a
+# connection and commit just queue up on the database lock with retries.
+# Instead, every write is handed to one writer thread per process, which
+# runs whatever has queued up (at most max_batch operations, waiting at
+# most max_delay for company) in a single transaction: one fsync for the
+# whole batch. Callers get a Future that resolves once their write is
+# committed, so reading after .result() sees it. Any failure fails only
+# the batch's futures: the writer reconnects and carries on, and call()
+# gives up on a write that has not started within its timeout.
+
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, TimeoutError
+
+# Attempts at a batch that hits "database is locked" (another process writing)
+BUSY_RETRIES = 5
+
+
+def is_busy(error):
+    return isinstance(error, sqlite3.OperationalError) and ('locked' in str(error) or 'busy' in str(error))
+
+
+class DBWriter:
+    def __init__(self, get_db, max_batch=256, max_delay=0.005):
+        self.get_db = get_db
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self.batches = 0
+        self.operations = 0
+
+    def submit(self, operation, *args):
+        """Queue operation(cursor, *args) to run in the next group commit; returns a Future of its result"""
+        future = Future()
+        self._start()
+        self._queue.put((operation, args, future))
+        return future
+
+    def execute(self, sql, params=()):
+        """Queue a single statement; the Future resolves to its lastrowid"""
+        return self.submit(lambda c: c.execute(sql, params).lastrowid)
+
+    def call(self, operation, *args, timeout=None):
+        """Run operation in a group commit and return its result
+
+        Raises TimeoutError if the writer has not picked it up within timeout;
+        the write is then withdrawn, so it never happens. Once picked up it
+        is waited for, since a batch always ends in a commit or a failure.
+        """
+        future = self.submit(operation, *args)
+        try:
+            return future.result(timeout=timeout)
+        except TimeoutError:
+            if future.cancel():
+                raise
+        return future.result()
+
+    def _start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, daemon=True, name='db-writer')
+                self._thread.start()
+
+    def _collect(self):
+        """Block for one operation, then take whatever else arrives within max_delay"""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _connect(self):
+        conn = self.get_db()
+        # Transactions are opened explicitly below
+        conn.isolation_level = None
+        # Readers on other connections keep going while a batch commits
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _run(self):
+        conn = None
+        while True:
+            # Writes whose caller gave up (cancelled) are dropped; the rest can no longer be cancelled
+            batch = [item for item in self._collect() if item[2].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                if conn is None:
+                    conn = self._connect()
+                results = self._commit_with_retries(conn, batch)
+            except Exception as e:
+                # Anything else (no connection, a broken one): fail this batch and start afresh
+                print(f"DEBUG: DB writer batch failed: {e}")
+                results = [(None, e)] * len(batch)
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+                    conn = None
+            self.batches += 1
+            self.operations += len(batch)
+            # Only now is every successful write durable and visible to other connections
+            for (_, _, future), (result, error) in zip(batch, results):
+                if error is None:
+                    future.set_result(result)
+                else:
+                    future.set_exception(error)
+
+    def _commit_with_retries(self, conn, batch):
+        for attempt in range(BUSY_RETRIES):
+            try:
+                return self._commit(conn, batch)
+            except sqlite3.Error as e:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                if not is_busy(e) or attempt == BUSY_RETRIES - 1:
+                    return [(None, e)] * len(batch)
+                # Nothing was kept, so the whole batch can simply run again
+                time.sleep(0.01 * 2 ** attempt)
+
+    def _commit(self, conn, batch):
+        c = conn.cursor()
+        c.execute("BEGIN IMMEDIATE")
+        results = []
+        for operation, args, _ in batch:
+            # A savepoint per operation: one failing write doesn't sink the rest of the batch
+            c.execute("SAVEPOINT op")
+            try:
+                results.append((operation(c, *args), None))
+                c.execute("RELEASE op")
+            except Exception as e:
+                if is_busy(e):
+                    raise
+                c.execute("ROLLBACK TO op")
+                c.execute("RELEASE op")
+                results.append((None, e))
+        c.execute("COMMIT")
+        return results
+
+    def stats(self):
+        return {
+            'batches': self.batches,
+            'operations': self.operations,
+            'queued': self._queue.qsize(),
+            'average_batch': round(self.operations / self.batches, 1) if self.batches else 0
+        }
@@ -0,0 +1,79 @@
+# RaceCoin - Fragment cache for shared template partials
+#
+# Race cards, multi-bet selections and leaderboard rows are identical for
+# every player, only the surrounding page (username, coin balance) differs.
+# Partials are rendered once per namespace version and kept in a small LRU.
+
+import threading
+from collections import OrderedDict
+
+
+class FragmentCache:
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def version(self, namespace):
+        """Current version number for a namespace (starts at 0)"""
+        with self._lock:
+            return self._versions.get(namespace, 0)
+
+    def bump(self, namespace):
+        """Invalidate every fragment in a namespace and return the new version"""
+        with self._lock:
+            new_version = self._versions.get(namespace, 0) + 1
+            self._versions[namespace] = new_version
+            for entry_key in [k for k in self._entries if k[0] == namespace]:
+                del self._entries[entry_key]
+            return new_version
+
+    def get(self, namespace, key=None):
+        with self._lock:
+            entry_key = (namespace, self._versions.get(namespace, 0), key)
+            value = self._entries.get(entry_key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(entry_key)
+            self.hits += 1
+            return value
+
+    def set(self, namespace, key, value, version=None):
+        with self._lock:
+            current = self._versions.get(namespace, 0)
+            # A render that started before an invalidation must not be stored
+            if version is not None and version != current:
+                return
+            entry_key = (namespace, current, key)
+            self._entries[entry_key] = value
+            self._entries.move_to_end(entry_key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def get_or_render(self, namespace, key, render):
+        """Return the cached fragment, calling render() only on a miss"""
+        value = self.get(namespace, key)
+        if value is not None:
+            return value
+        version = self.version(namespace)
+        value = render()
+        self.set(namespace, key, value, version=version)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'versions': dict(self._versions)
+            }
@@ -0,0 +1,22 @@
+# RaceCoin - gunicorn settings (picked up automatically by `gunicorn app:app`)
+#
+# Live race viewers hold an open SSE connection, so the threaded worker is
+# used: each spectator costs a thread, not a whole sync worker process.
+#
+# Capacity: a worker serves at most `threads` requests at once, streams
+# included. A stream holds its thread from shortly before the off until the
+# result (viewers arriving earlier get the field and reconnect later), and
+# the app keeps STREAM_RESERVED_THREADS (default 20) of them for pages, so a
+# worker carries GUNICORN_THREADS - 20 live viewers; the rest get a 503 and
+# replay the trajectory. The race programme lives in one process, so scale
+# spectators with GUNICORN_THREADS (each idle thread is ~a stack's worth of
+# memory, so ~1000 is fine), not WEB_CONCURRENCY.
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+worker_class = 'gthread'
+workers = int(os.environ.get('WEB_CONCURRENCY', 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 200))
+# Streams stay open for a whole race; idle ones send keep-alive comments
+timeout = 60
+keepalive = 5
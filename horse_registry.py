@@ -0,0 +1,152 @@
+# RaceCoin - Horse registry
+#
+# One record per horse in the `horses` table: its recent finishing
+# positions, form string, momentum and a smoothed strength rating. Every
+# worker reads the same rows, so odds no longer depend on whose session or
+# which process generated them. A settled race updates all of its runners
+# in one transaction; reads come from an in-memory copy.
+
+import threading
+
+HISTORY_SIZE = 10
+FORM_LENGTH = 5
+# Weight of the newest result in the strength rating (exponential smoothing)
+STRENGTH_ALPHA = 0.2
+DEFAULT_STRENGTH = 70.0
+
+
+def default_state(name):
+    return {
+        'name': name,
+        'recent_results': [],
+        'form': '',
+        'momentum': 0,
+        'consecutive_losses': 0,
+        'total_races': 0,
+        'wins': 0,
+        'strength': DEFAULT_STRENGTH
+    }
+
+
+def row_to_state(row):
+    state = dict(row)
+    state['recent_results'] = [int(p) for p in row['recent_results'].split(',') if p]
+    return state
+
+
+def form_string(results):
+    """Racing-style form figures, newest last: 1-9 for places, 0 for 10th or worse"""
+    return ''.join(str(p) if p < 10 else '0' for p in results[-FORM_LENGTH:])
+
+
+class HorseRegistry:
+    def __init__(self, get_db):
+        self.get_db = get_db
+        self._cache = None
+        self._lock = threading.Lock()
+
+    def init_schema(self):
+        conn = self.get_db()
+        c = conn.cursor()
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS horses (
+                name TEXT PRIMARY KEY,
+                recent_results TEXT DEFAULT '',
+                form TEXT DEFAULT '',
+                momentum INTEGER DEFAULT 0,
+                consecutive_losses INTEGER DEFAULT 0,
+                total_races INTEGER DEFAULT 0,
+                wins INTEGER DEFAULT 0,
+                strength REAL DEFAULT 70.0
+            )
+        ''')
+        # Guards against settling the same race twice (several workers, repeat calls)
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS settled_races (
+                race_key TEXT PRIMARY KEY,
+                settled_at TEXT DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        conn.commit()
+        conn.close()
+
+    def _load(self):
+        conn = self.get_db()
+        c = conn.cursor()
+        c.execute("SELECT * FROM horses")
+        cache = {row['name']: row_to_state(row) for row in c.fetchall()}
+        conn.close()
+        print(f"DEBUG: Loaded {len(cache)} horses into the registry")
+        return cache
+
+    def reload(self):
+        """Re-read every horse (picks up races settled by other workers)"""
+        cache = self._load()
+        with self._lock:
+            self._cache = cache
+
+    def get(self, name):
+        """Current state for a horse (a fresh default if it has never raced)"""
+        if self._cache is None:
+            self.reload()
+        with self._lock:
+            state = self._cache.get(name)
+        return dict(state) if state else default_state(name)
+
+    def record_race(self, race_key, finishing_order):
+        """Apply a race result to every runner in one batch; returns False if already settled"""
+        if self._cache is None:
+            self.reload()
+        field_size = len(finishing_order)
+        conn = self.get_db()
+        c = conn.cursor()
+        c.execute("INSERT OR IGNORE INTO settled_races (race_key) VALUES (?)", (race_key,))
+        if c.rowcount == 0:
+            conn.close()
+            return False
+
+        # Start from the stored rows, not the cache, in case another worker moved them on
+        c.execute("SELECT * FROM horses WHERE name IN (%s)" % ','.join('?' * field_size), finishing_order)
+        current = {row['name']: row_to_state(row) for row in c.fetchall()}
+
+        updated = []
+        for position, name in enumerate(finishing_order, start=1):
+            state = current.get(name) or default_state(name)
+            state['recent_results'] = (state['recent_results'] + [position])[-HISTORY_SIZE:]
+            state['form'] = form_string(state['recent_results'])
+            state['total_races'] += 1
+            if position == 1:
+                state['wins'] += 1
+                state['momentum'] += 10
+                state['consecutive_losses'] = 0
+            else:
+                state['momentum'] -= 15
+                state['consecutive_losses'] += 1
+                if state['consecutive_losses'] >= 2:
+                    state['momentum'] = 0
+            # 100 for a win down to 0 for last, smoothed into the rating
+            score = 100.0 * (field_size - position) / max(field_size - 1, 1)
+            state['strength'] = round((1 - STRENGTH_ALPHA) * state['strength'] + STRENGTH_ALPHA * score, 2)
+            updated.append(state)
+
+        c.executemany('''
+            INSERT INTO horses (name, recent_results, form, momentum, consecutive_losses,
+                                total_races, wins, strength)
+            VALUES (:name, :results_csv, :form, :momentum, :consecutive_losses,
+                    :total_races, :wins, :strength)
+            ON CONFLICT (name) DO UPDATE SET
+                recent_results = excluded.recent_results,
+                form = excluded.form,
+                momentum = excluded.momentum,
+                consecutive_losses = excluded.consecutive_losses,
+                total_races = excluded.total_races,
+                wins = excluded.wins,
+                strength = excluded.strength
+        ''', [{**s, 'results_csv': ','.join(map(str, s['recent_results']))} for s in updated])
+        conn.commit()
+        conn.close()
+
+        with self._lock:
+            for state in updated:
+                self._cache[state['name']] = state
+        return True
@@ -0,0 +1,267 @@
+# RaceCoin - Per-race liability book
+#
+# Keeps running totals of stakes and potential payouts per runner so each
+# bet is an O(1) update. Published odds drift towards where the money is
+# (keeping a fixed overround), and a bet is refused if it would push the
+# book's loss on any single result past the exposure limit. Forecast and
+# multi bets don't move prices, but their payouts are booked against the
+# runner that has to win for them to pay, so they share the same cap. Totals live in
+# memory; a background thread adds each worker's new money to the SQLite
+# totals in batches and reads back everyone else's, so all workers price
+# (and cap) the same book, a flush interval behind at most.
+
+import sqlite3
+import threading
+import time
+
+# None keeps the overround of the opening prices
+DEFAULT_OVERROUND = None
+# Stakes needed before the money counts as much as the opening prices
+DEFAULT_LIQUIDITY = 2000
+DEFAULT_MAX_EXPOSURE = 20000
+MIN_ODDS = 1.05
+# Stored row holding the stakes of forecast/multi bets (their payouts sit on the runners)
+EXOTIC = '*'
+
+
+class RaceBook:
+    def __init__(self, opening_odds, overround=DEFAULT_OVERROUND, liquidity=DEFAULT_LIQUIDITY):
+        self.runners = list(opening_odds)
+        implied = {r: 1.0 / opening_odds[r] for r in self.runners}
+        total = sum(implied.values())
+        # Opening prices as true probabilities (margin stripped)
+        self.base_prob = {r: implied[r] / total for r in self.runners}
+        self.overround = overround or total
+        self.liquidity = liquidity
+        self.stakes = {r: 0 for r in self.runners}
+        self.payouts = {r: 0 for r in self.runners}
+        self.bets = {r: 0 for r in self.runners}
+        self.total_stakes = 0
+        # Forecast/multi stakes kept by the book whatever wins (not part of the price)
+        self.exotic_stakes = 0
+        # (stakes, payouts, bets) taken here since the last flush
+        self.unflushed = {}
+        self.odds = {}
+        self.reprice()
+
+    def reprice(self):
+        """Blend opening probabilities with stake share, then apply the overround"""
+        weight = self.total_stakes / (self.total_stakes + self.liquidity)
+        for r in self.runners:
+            share = self.stakes[r] / self.total_stakes if self.total_stakes else 0.0
+            prob = (1 - weight) * self.base_prob[r] + weight * share
+            self.odds[r] = round(max(MIN_ODDS, 1.0 / (prob * self.overround)), 2)
+
+    def liability(self, runner):
+        """What the book loses if this runner wins (negative means a profit)"""
+        return self.payouts[runner] - self.total_stakes - self.exotic_stakes
+
+    def place(self, runner, stake, max_exposure):
+        """Accept a stake at the current price; returns (odds, None) or (None, error)"""
+        odds = self.odds[runner]
+        payout = int(stake * odds)
+        if self.liability(runner) + payout - stake > max_exposure:
+            return None, "The book is full on that runner, try a smaller stake"
+        self.stakes[runner] += stake
+        self.payouts[runner] += payout
+        self.bets[runner] += 1
+        self.total_stakes += stake
+        self.add_unflushed(runner, stake, payout, 1)
+        self.reprice()
+        return odds, None
+
+    def fits(self, runner, stake, payout, max_exposure):
+        return self.liability(runner) + payout - stake <= max_exposure
+
+    def cover(self, runner, stake, payout):
+        """Book a forecast/multi payout against the runner it needs to win (prices don't move)"""
+        self.payouts[runner] += payout
+        self.exotic_stakes += stake
+        self.add_unflushed(runner, 0, payout, 0)
+        self.add_unflushed(EXOTIC, stake, 0, 1)
+
+    def add_unflushed(self, runner, stakes, payouts, bets):
+        pending = self.unflushed.get(runner, (0, 0, 0))
+        self.unflushed[runner] = (pending[0] + stakes, pending[1] + payouts, pending[2] + bets)
+
+    def take_unflushed(self):
+        """Hand over the money taken since the last flush as (runner, stakes, payouts, bets)"""
+        rows = [(runner,) + totals for runner, totals in self.unflushed.items()]
+        self.unflushed = {}
+        return rows
+
+    def load(self, runner, stakes, payouts, bets):
+        """Set a runner's totals from the database, plus anything taken here that is not written yet"""
+        pending = self.unflushed.get(runner, (0, 0, 0))
+        if runner == EXOTIC:
+            self.exotic_stakes = stakes + pending[0]
+        elif runner in self.stakes:
+            self.stakes[runner] = stakes + pending[0]
+            self.payouts[runner] = payouts + pending[1]
+            self.bets[runner] = bets + pending[2]
+            self.total_stakes = sum(self.stakes.values())
+
+
+class LiabilityBook:
+    def __init__(self, get_db, overround=DEFAULT_OVERROUND, liquidity=DEFAULT_LIQUIDITY,
+                 max_exposure=DEFAULT_MAX_EXPOSURE, flush_seconds=5, on_change=None):
+        self.get_db = get_db
+        # Called when a flush moved published odds (other workers' bets), e.g. to drop cached race cards
+        self.on_change = on_change
+        self.overround = overround
+        self.liquidity = liquidity
+        self.max_exposure = max_exposure
+        self.flush_seconds = flush_seconds
+        self._books = {}
+        self._lock = threading.Lock()
+        self._flusher = None
+
+    def init_schema(self):
+        conn = self.get_db()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS race_liability (
+                race_key TEXT NOT NULL,
+                runner TEXT NOT NULL,
+                stakes INTEGER DEFAULT 0,
+                payouts INTEGER DEFAULT 0,
+                bets INTEGER DEFAULT 0,
+                PRIMARY KEY (race_key, runner)
+            )
+        ''')
+        conn.commit()
+        conn.close()
+
+    def _book(self, race_key, opening_odds):
+        book = self._books.get(race_key)
+        if book is None:
+            book = RaceBook(opening_odds, self.overround, self.liquidity)
+            # Pick up totals written before a restart
+            conn = self.get_db()
+            rows = conn.execute("SELECT runner, stakes, payouts, bets FROM race_liability WHERE race_key = ?",
+                                (race_key,)).fetchall()
+            conn.close()
+            for row in rows:
+                book.load(row['runner'], row['stakes'], row['payouts'], row['bets'])
+            book.reprice()
+            self._books[race_key] = book
+        return book
+
+    def odds(self, race_key, opening_odds):
+        """Currently published odds for every runner"""
+        with self._lock:
+            return dict(self._book(race_key, opening_odds).odds)
+
+    def place(self, race_key, opening_odds, runner, stake):
+        """Take a win bet; returns (odds accepted, None) or (None, error message)"""
+        with self._lock:
+            book = self._book(race_key, opening_odds)
+            if runner not in book.odds:
+                return None, "Invalid horse choice"
+            odds, error = book.place(runner, stake, self.max_exposure)
+        self._start_flusher()
+        return odds, error
+
+    def cover(self, legs):
+        """Take a forecast or multi bet, all legs or none; returns None or an error message
+
+        legs: (race_key, opening_odds, runner, stake, payout) per race, where runner
+        must win that race for the bet to pay. A multi's stake is credited to no
+        race (the book keeps it only if some leg loses), a forecast's to its race.
+        """
+        with self._lock:
+            books = []
+            for race_key, opening_odds, runner, stake, payout in legs:
+                book = self._book(race_key, opening_odds)
+                if runner not in book.odds:
+                    return "Invalid horse choice"
+                if not book.fits(runner, stake, payout, self.max_exposure):
+                    return "The book is full on that runner, try a smaller stake"
+                books.append(book)
+            for book, (_, _, runner, stake, payout) in zip(books, legs):
+                book.cover(runner, stake, payout)
+        self._start_flusher()
+        return None
+
+    def exposure(self, race_key):
+        """Worst-case loss per runner for a race (empty if nobody has bet)"""
+        with self._lock:
+            book = self._books.get(race_key)
+            if book is None:
+                return {}
+            return {r: book.liability(r) for r in book.runners}
+
+    def flush(self):
+        """Add this worker's new stakes to the stored totals, then pick up every other worker's"""
+        with self._lock:
+            keys = list(self._books)
+            rows = []
+            for race_key in keys:
+                rows.extend((race_key,) + row for row in self._books[race_key].take_unflushed())
+        if not keys:
+            return 0
+        conn = self.get_db()
+        try:
+            # Increments, not totals: workers each add their own money and never overwrite another's
+            conn.executemany('''
+                INSERT INTO race_liability (race_key, runner, stakes, payouts, bets)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (race_key, runner) DO UPDATE SET
+                    stakes = stakes + excluded.stakes,
+                    payouts = payouts + excluded.payouts,
+                    bets = bets + excluded.bets
+            ''', rows)
+            conn.commit()
+        except sqlite3.Error:
+            conn.close()
+            # Nothing was added; keep the money to write on the next flush
+            with self._lock:
+                for race_key, runner, stakes, payouts, bets in rows:
+                    if race_key in self._books:
+                        self._books[race_key].add_unflushed(runner, stakes, payouts, bets)
+            raise
+        try:
+            stored = conn.execute(
+                "SELECT race_key, runner, stakes, payouts, bets FROM race_liability WHERE race_key IN (%s)"
+                % ','.join('?' * len(keys)), keys
+            ).fetchall()
+        finally:
+            conn.close()
+        moved = False
+        with self._lock:
+            for row in stored:
+                book = self._books.get(row['race_key'])
+                if book is not None:
+                    book.load(row['runner'], row['stakes'], row['payouts'], row['bets'])
+            for race_key in keys:
+                book = self._books.get(race_key)
+                if book is not None:
+                    before = dict(book.odds)
+                    book.reprice()
+                    moved = moved or book.odds != before
+        if moved and self.on_change is not None:
+            self.on_change()
+        return len(rows)
+
+    def forget(self, race_keys):
+        """Flush, then drop settled races from memory"""
+        self.flush()
+        with self._lock:
+            for race_key in race_keys:
+                self._books.pop(race_key, None)
+
+    def _start_flusher(self):
+        if self._flusher is not None:
+            return
+        with self._lock:
+            if self._flusher is not None:
+                return
+            self._flusher = threading.Thread(target=self._flush_loop, daemon=True, name='liability-flush')
+        self._flusher.start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_seconds)
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"DEBUG: Liability flush failed: {e}")
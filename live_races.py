@@ -0,0 +1,161 @@
+# RaceCoin - Live race broadcaster
+#
+# Each race is played out once on a background thread from its shared
+# trajectory. Ticks go into a per-race ring buffer with increasing sequence
+# numbers and every subscriber follows that buffer, so a big race costs one
+# simulation however many people are watching. Late joiners (or reconnecting
+# EventSources sending Last-Event-ID) catch up from the buffer. Watching
+# never starts a race: only start() (the off) does, and anyone subscribed
+# before then just waits on the empty buffer.
+
+import json
+import threading
+import time
+from collections import deque
+
+# Enough for a whole race at 100ms ticks, so anyone joining mid-race sees it all
+DEFAULT_BUFFER_SIZE = 256
+# Comment lines keep idle connections (and proxies) from timing out
+KEEPALIVE_SECONDS = 15
+
+
+def format_sse(seq, event, data):
+    return f"id: {seq}\nevent: {event}\ndata: {data}\n\n"
+
+
+class LiveRace:
+    def __init__(self, run, buffer_size=DEFAULT_BUFFER_SIZE):
+        self.run = run
+        self.events = deque(maxlen=buffer_size)
+        self.condition = threading.Condition()
+        self.seq = 0
+        self.finished = False
+        self.subscribers = 0
+        self.thread = None
+
+    @property
+    def started(self):
+        return self.thread is not None
+
+    def publish(self, event, payload):
+        data = json.dumps(payload, separators=(',', ':'))
+        with self.condition:
+            self.seq += 1
+            self.events.append((self.seq, format_sse(self.seq, event, data)))
+            if event == 'end':
+                self.finished = True
+            self.condition.notify_all()
+
+    def play(self):
+        """Publish the race tick by tick in real time (runs on its own thread)"""
+        run = self.run
+        tick_seconds = run['tick_ms'] / 1000.0
+        winner_finish = run['finish_ticks'][run['winner_index']]
+        self.publish('start', {
+            'race_id': run['race_id'], 'tick_ms': run['tick_ms'],
+            'scale': run['scale'], 'ticks': run['ticks']
+        })
+        started = time.monotonic()
+        for tick in range(run['ticks']):
+            # Sleep to the schedule rather than a fixed interval so ticks don't drift
+            delay = started + tick * tick_seconds - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            self.publish('tick', {'t': tick, 'p': [track[tick] for track in run['positions']]})
+            if tick == winner_finish:
+                self.publish('result', {
+                    'winner': run['winner'], 'winner_index': run['winner_index'],
+                    'finishing_order': run['finishing_order']
+                })
+        self.publish('end', {'race_id': run['race_id']})
+
+    def start(self):
+        with self.condition:
+            if self.thread is not None:
+                return
+            self.thread = threading.Thread(target=self.play, daemon=True,
+                                           name=f"live-race-{self.run['race_id']}")
+        self.thread.start()
+
+    def cancel(self):
+        """End the stream of a race that will never start (its programme was replaced)"""
+        with self.condition:
+            if self.thread is not None or self.finished:
+                return
+        self.publish('end', {'race_id': self.run['race_id'], 'cancelled': True})
+
+    def stream(self, last_event_id=0):
+        """Yield SSE chunks from last_event_id onwards until the race has ended"""
+        last = last_event_id
+        with self.condition:
+            self.subscribers += 1
+        try:
+            while True:
+                with self.condition:
+                    pending = [chunk for seq, chunk in self.events if seq > last]
+                    if not pending:
+                        if self.finished:
+                            return
+                        self.condition.wait(timeout=KEEPALIVE_SECONDS)
+                        pending = [chunk for seq, chunk in self.events if seq > last]
+                    if pending:
+                        last = self.seq
+                    done = self.finished
+                # Write outside the lock so one slow client never holds up the rest
+                if pending:
+                    yield ''.join(pending)
+                else:
+                    yield ': keepalive\n\n'
+                if done and not pending:
+                    return
+        finally:
+            with self.condition:
+                self.subscribers -= 1
+
+
+class LiveRaceBroadcaster:
+    def __init__(self, buffer_size=DEFAULT_BUFFER_SIZE):
+        self.buffer_size = buffer_size
+        self._races = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, run):
+        """The live race for key (not started until start() is called)"""
+        with self._lock:
+            live = self._races.get(key)
+            if live is None:
+                live = LiveRace(run, buffer_size=self.buffer_size)
+                self._races[key] = live
+        return live
+
+    def start(self, key, run):
+        """The off: play the race out to everyone subscribed, now or later"""
+        live = self.get(key, run)
+        live.start()
+        return live
+
+    def subscribe(self, key, run, last_event_id=0):
+        return self.get(key, run).stream(last_event_id)
+
+    def forget(self, key):
+        """Drop one finished race"""
+        with self._lock:
+            live = self._races.pop(key, None)
+        if live is not None:
+            live.cancel()
+
+    def reset(self):
+        """Forget every race (running threads finish on their own, waiting spectators are let go)"""
+        with self._lock:
+            races = list(self._races.values())
+            self._races.clear()
+        for live in races:
+            live.cancel()
+
+    def stats(self):
+        with self._lock:
+            races = dict(self._races)
+        return {
+            key: {'seq': live.seq, 'finished': live.finished, 'subscribers': live.subscribers}
+            for key, live in races.items()
+        }
@@ -0,0 +1,113 @@
+# RaceCoin - Time-windowed leaderboard aggregates
+#
+# Each settled bet is added to the player's running totals for its day, ISO
+# week and month bucket (one upsert per period). A "this week" board is then
+# a single indexed read of that week's bucket instead of a scan over bet
+# history. Daily buckets are kept so any date range can still be rolled up
+# by merging them.
+
+from datetime import date
+
+PERIODS = ('day', 'week', 'month')
+METRICS = {
+    'net': 'Net winnings',
+    'xp': 'XP gained',
+    'wins': 'Wins'
+}
+
+
+def bucket_key(period, when=None):
+    """'day' -> '2024-05-17', 'week' -> '2024-W20', 'month' -> '2024-05'"""
+    when = when or date.today()
+    if period == 'day':
+        return when.isoformat()
+    if period == 'week':
+        year, week, _ = when.isocalendar()
+        return f"{year}-W{week:02d}"
+    if period == 'month':
+        return f"{when.year}-{when.month:02d}"
+    raise ValueError(f"Unknown period: {period}")
+
+
+class PeriodStats:
+    def __init__(self, get_db):
+        self.get_db = get_db
+
+    def init_schema(self):
+        conn = self.get_db()
+        c = conn.cursor()
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS user_period_stats (
+                period TEXT NOT NULL,
+                bucket TEXT NOT NULL,
+                user_id INTEGER NOT NULL,
+                net INTEGER DEFAULT 0,
+                xp INTEGER DEFAULT 0,
+                wins INTEGER DEFAULT 0,
+                bets INTEGER DEFAULT 0,
+                PRIMARY KEY (period, bucket, user_id)
+            )
+        ''')
+        for metric in METRICS:
+            c.execute(f"CREATE INDEX IF NOT EXISTS idx_period_stats_{metric} "
+                      f"ON user_period_stats (period, bucket, {metric} DESC)")
+        conn.commit()
+        conn.close()
+
+    def record(self, user_id, net=0, xp=0, wins=0, bets=0, when=None, conn=None):
+        """Add one settlement to the player's day, week and month buckets"""
+        own_conn = conn is None
+        conn = conn or self.get_db()
+        rows = [(period, bucket_key(period, when), user_id, net, xp, wins, bets) for period in PERIODS]
+        conn.executemany('''
+            INSERT INTO user_period_stats (period, bucket, user_id, net, xp, wins, bets)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (period, bucket, user_id) DO UPDATE SET
+                net = net + excluded.net,
+                xp = xp + excluded.xp,
+                wins = wins + excluded.wins,
+                bets = bets + excluded.bets
+        ''', rows)
+        if own_conn:
+            conn.commit()
+            conn.close()
+
+    def top(self, period, metric, limit=10, when=None, conn=None):
+        """Top players for the current (or given) day/week/month bucket"""
+        if period not in PERIODS or metric not in METRICS:
+            raise ValueError(f"Unknown board: {period}/{metric}")
+        own_conn = conn is None
+        conn = conn or self.get_db()
+        c = conn.cursor()
+        c.execute(f'''
+            SELECT s.user_id, u.username, s.net, s.xp, s.wins, s.bets
+            FROM user_period_stats s JOIN users u ON u.id = s.user_id
+            WHERE s.period = ? AND s.bucket = ?
+            ORDER BY s.{metric} DESC, s.user_id ASC
+            LIMIT ?
+        ''', (period, bucket_key(period, when), limit))
+        rows = [dict(row) for row in c.fetchall()]
+        if own_conn:
+            conn.close()
+        return rows
+
+    def merge_days(self, start, end, metric, limit=10, conn=None):
+        """Roll up an arbitrary date range by merging daily buckets"""
+        if metric not in METRICS:
+            raise ValueError(f"Unknown metric: {metric}")
+        own_conn = conn is None
+        conn = conn or self.get_db()
+        c = conn.cursor()
+        c.execute(f'''
+            SELECT s.user_id, u.username, SUM(s.net) AS net, SUM(s.xp) AS xp,
+                   SUM(s.wins) AS wins, SUM(s.bets) AS bets
+            FROM user_period_stats s JOIN users u ON u.id = s.user_id
+            WHERE s.period = 'day' AND s.bucket BETWEEN ? AND ?
+            GROUP BY s.user_id
+            ORDER BY {metric} DESC, s.user_id ASC
+            LIMIT ?
+        ''', (start.isoformat(), end.isoformat(), limit))
+        rows = [dict(row) for row in c.fetchall()]
+        if own_conn:
+            conn.close()
+        return rows
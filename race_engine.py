@@ -0,0 +1,138 @@
+# RaceCoin - Server-side race engine
+#
+# The finishing order is drawn once per race from the published odds and the
+# whole run is turned into a compact trajectory (quantised positions per
+# tick) so every viewer animates exactly the same race.
+
+import hashlib
+import hmac
+import random
+
+TICK_MS = 100
+# Positions are integers in 0..SCALE (SCALE is the finish line)
+SCALE = 1000
+WINNER_TICKS = 80
+
+# Card pricing: the best-rated runner opens at 1.8, the worst at 8.0
+SHORTEST_ODDS = 1.8
+LONGEST_ODDS = 8.0
+LEVEL_ODDS = 4.0
+# Random swing added to each runner's rating when a card is priced
+SCORE_NOISE = 10
+# Forecast (first and second in order) pays this share of the two win prices multiplied
+FORECAST_FACTOR = 0.8
+
+
+def race_seed(race, secret):
+    """Deterministic seed for a race so any process replays the same run
+
+    Keyed with a server secret: everything else here is on the public race
+    card, and a plain hash of it would let anyone replay the result early.
+    """
+    names = '|'.join(h['name'] if isinstance(h, dict) else h for h in race['horses'])
+    key = f"{race['id']}|{race.get('start_time', '')}|{names}"
+    if isinstance(secret, str):
+        secret = secret.encode('utf-8')
+    return int(hmac.new(secret, key.encode('utf-8'), hashlib.sha256).hexdigest()[:16], 16)
+
+
+def price_field(scores):
+    """Decimal odds for each runner from its rating score, linear between the longest and shortest price"""
+    max_score = max(scores)
+    min_score = min(scores)
+    prices = []
+    for score in scores:
+        if max_score == min_score:
+            odds = LEVEL_ODDS
+        else:
+            odds = LONGEST_ODDS - (LONGEST_ODDS - SHORTEST_ODDS) * ((score - min_score) / (max_score - min_score))
+        prices.append(round(max(SHORTEST_ODDS, min(odds, 100.0)), 2))
+    return prices
+
+
+def forecast_odds(first_odds, second_odds):
+    return round(first_odds * second_odds * FORECAST_FACTOR, 2)
+
+
+def simulate_finishing_order(odds, rng=None):
+    """Draw a full finishing order (list of runner indices) weighted by 1/odds
+
+    Runners are picked for each place in turn without replacement, so the
+    chance of winning matches the 1/odds weighting used for the winner.
+    """
+    rng = rng or random
+    remaining = list(range(len(odds)))
+    weights = [1.0 / o for o in odds]
+    order = []
+    while remaining:
+        pick = rng.choices(range(len(remaining)), weights=[weights[i] for i in remaining], k=1)[0]
+        order.append(remaining.pop(pick))
+    return order
+
+
+def build_trajectory(order, rng=None, winner_ticks=WINNER_TICKS, scale=SCALE):
+    """Quantised per-tick positions for each runner, consistent with the finishing order
+
+    Returns (positions, finish_ticks): positions[runner] is a list of ints
+    from 0 up to scale, and finish_ticks[runner] is the tick it crosses the
+    line. Each runner gets a noisy pace profile which is rescaled so it
+    reaches the line on its finish tick; later places finish strictly later.
+    """
+    rng = rng or random
+    n = len(order)
+    finish_ticks = [0] * n
+    tick = winner_ticks
+    for runner in order:
+        finish_ticks[runner] = tick
+        tick += rng.randint(1, 3)
+    total_ticks = max(finish_ticks)
+
+    positions = []
+    for runner in range(n):
+        finish = finish_ticks[runner]
+        pace = []
+        speed = 1.0
+        for _ in range(finish):
+            # Smoothed random walk so horses surge and fade instead of jittering
+            speed = max(0.3, min(1.7, speed + rng.uniform(-0.15, 0.15)))
+            pace.append(speed)
+        total = sum(pace)
+        track = [0]
+        covered = 0.0
+        for step in pace:
+            covered += step
+            track.append(min(scale, int(round(scale * covered / total))))
+        track[-1] = scale
+        # Hold at the line once finished so every array spans the whole race
+        track.extend([scale] * (total_ticks - finish))
+        positions.append(track)
+
+    # Nobody may reach the line before the runner placed ahead of them
+    for place in range(1, n):
+        runner, ahead = order[place], order[place - 1]
+        limit = finish_ticks[ahead]
+        for t in range(limit + 1):
+            if positions[runner][t] >= scale:
+                positions[runner][t] = scale - 1
+    return positions, finish_ticks
+
+
+def run_race(race, secret):
+    """Result and trajectory for a published race (deterministic per race and secret)"""
+    rng = random.Random(race_seed(race, secret))
+    names = [h['name'] for h in race['horses']]
+    odds = [h['odds'] for h in race['horses']]
+    order = simulate_finishing_order(odds, rng)
+    positions, finish_ticks = build_trajectory(order, rng)
+    return {
+        'race_id': race['id'],
+        'winner': names[order[0]],
+        'winner_index': order[0],
+        'finishing_order': [names[i] for i in order],
+        'order': order,
+        'tick_ms': TICK_MS,
+        'scale': SCALE,
+        'ticks': len(positions[0]),
+        'finish_ticks': finish_ticks,
+        'positions': positions
+    }
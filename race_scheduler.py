@@ -0,0 +1,178 @@
+# RaceCoin - Continuous race scheduler
+#
+# Keeps a rolling programme of virtual races per track on a fixed cadence.
+# Every race moves through open -> close (betting stops) -> run -> settle,
+# and each step is an event in a hierarchical timing wheel: seconds,
+# minutes and hours wheels, with far-future events cascading down a level
+# as the wheel above turns. Scheduling and firing are O(1) per event, so
+# thousands of concurrent races cost one background thread that wakes once
+# a tick and never polls the database.
+
+import itertools
+import math
+import threading
+import time
+
+EVENTS = ('open', 'close', 'run', 'settle')
+
+
+class TimingWheel:
+    def __init__(self, tick_seconds=1.0, wheel_sizes=(60, 60, 24), now=None):
+        self.tick_seconds = tick_seconds
+        self.wheel_sizes = wheel_sizes
+        # Ticks covered by one slot of each wheel: 1, 60, 3600 with the defaults
+        self.spans = [1]
+        for size in wheel_sizes[:-1]:
+            self.spans.append(self.spans[-1] * size)
+        self.horizon = self.spans[-1] * wheel_sizes[-1]
+        self.wheels = [[[] for _ in range(size)] for size in wheel_sizes]
+        self.overflow = []
+        self.current = self._tick(time.time() if now is None else now)
+        self._seq = itertools.count()
+        self.pending = 0
+
+    def _tick(self, when):
+        return int(math.floor(when / self.tick_seconds))
+
+    def schedule(self, when, event):
+        """File an event to fire at `when` (epoch seconds); past times fire on the next tick"""
+        due = max(math.ceil(when / self.tick_seconds), self.current + 1)
+        self._insert((due, next(self._seq), event))
+        self.pending += 1
+
+    def _insert(self, entry):
+        delta = entry[0] - self.current
+        for level, span in enumerate(self.spans):
+            if delta < span * self.wheel_sizes[level]:
+                self.wheels[level][(entry[0] // span) % self.wheel_sizes[level]].append(entry)
+                return
+        self.overflow.append(entry)
+
+    def _cascade(self, level, tick):
+        slot = self.wheels[level][(tick // self.spans[level]) % self.wheel_sizes[level]]
+        self.wheels[level][(tick // self.spans[level]) % self.wheel_sizes[level]] = []
+        for entry in slot:
+            self._insert(entry)
+
+    def advance(self, now):
+        """Turn the wheel up to `now` and return the events that came due, oldest first"""
+        target = self._tick(now)
+        fired = []
+        while self.current < target:
+            self.current += 1
+            tick = self.current
+            if tick % self.horizon == 0:
+                overflow, self.overflow = self.overflow, []
+                for entry in overflow:
+                    self._insert(entry)
+            # Highest wheel first, so its events can land in the slots cascaded next
+            for level in range(len(self.spans) - 1, 0, -1):
+                if tick % self.spans[level] == 0:
+                    self._cascade(level, tick)
+            slot_index = tick % self.wheel_sizes[0]
+            due = self.wheels[0][slot_index]
+            self.wheels[0][slot_index] = []
+            fired.extend(entry[2] for entry in sorted(due))
+        self.pending -= len(fired)
+        return fired
+
+
+class RaceScheduler:
+    def __init__(self, make_race, handlers, tracks, cadence_seconds=300, races_ahead=3,
+                 close_seconds=30, run_seconds=60, tick_seconds=1.0):
+        # make_race(race_id, track, race_number, start_time) -> race dict
+        self.make_race = make_race
+        # {'open': fn(race), 'close': ..., 'run': ..., 'settle': ...}; missing ones are skipped
+        self.handlers = handlers
+        self.tracks = list(tracks)
+        self.cadence_seconds = cadence_seconds
+        self.races_ahead = races_ahead
+        self.close_seconds = close_seconds
+        self.run_seconds = run_seconds
+        self.wheel = TimingWheel(tick_seconds)
+        self.races = {}
+        self.fired = dict.fromkeys(EVENTS, 0)
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def race_id(self, track_index, start):
+        """Same id for the same slot in every process: cadence slot number x track"""
+        return int(start // self.cadence_seconds) * len(self.tracks) + track_index + 1
+
+    def _schedule_open(self, track_index, start):
+        # Races are published `races_ahead` slots before they start
+        self.wheel.schedule(start - self.races_ahead * self.cadence_seconds, ('open', track_index, start))
+
+    def seed(self, now=None):
+        """Queue the programme from now on; tracks are staggered across the cadence"""
+        now = time.time() if now is None else now
+        first_slot = math.floor(now / self.cadence_seconds) * self.cadence_seconds
+        for track_index in range(len(self.tracks)):
+            offset = self.cadence_seconds * track_index / len(self.tracks)
+            start = first_slot + offset
+            while start <= now:
+                start += self.cadence_seconds
+            self._schedule_open(track_index, start)
+
+    def _fire(self, event):
+        kind, track_index, start = event
+        race_id = self.race_id(track_index, start)
+        if kind == 'open':
+            number = int(start // self.cadence_seconds) % 1000 + 1
+            race = self.make_race(race_id, self.tracks[track_index], number, start)
+            race['status'] = 'open'
+            race['betting_open'] = True
+            self.races[race_id] = race
+            self.wheel.schedule(start - self.close_seconds, ('close', track_index, start))
+            self.wheel.schedule(start, ('run', track_index, start))
+            self.wheel.schedule(start + self.run_seconds, ('settle', track_index, start))
+            # Rolling programme: the next slot on this track
+            self._schedule_open(track_index, start + self.cadence_seconds)
+        race = self.races.get(race_id)
+        if race is None:
+            return
+        if kind == 'close':
+            race['betting_open'] = False
+            race['status'] = 'closed'
+        elif kind == 'run':
+            race['status'] = 'running'
+        elif kind == 'settle':
+            race['status'] = 'settled'
+            del self.races[race_id]
+        self.fired[kind] += 1
+        handler = self.handlers.get(kind)
+        if handler:
+            handler(race)
+
+    def tick(self, now=None):
+        """Fire everything due by now (the background thread calls this once per tick)"""
+        with self._lock:
+            for event in self.wheel.advance(time.time() if now is None else now):
+                try:
+                    self._fire(event)
+                except Exception as e:
+                    print(f"DEBUG: Scheduler {event[0]} event failed: {e}")
+
+    def start(self):
+        if self._thread is not None:
+            return self
+        self.seed()
+        self._thread = threading.Thread(target=self._run, daemon=True, name='race-scheduler')
+        self._thread.start()
+        return self
+
+    def _run(self):
+        tick_seconds = self.wheel.tick_seconds
+        while True:
+            self.tick()
+            # Sleep to the next tick boundary rather than a fixed interval, so ticks don't drift
+            time.sleep(tick_seconds - (time.time() % tick_seconds))
+
+    def status(self):
+        with self._lock:
+            return {
+                'tracks': len(self.tracks),
+                'active_races': len(self.races),
+                'pending_events': self.wheel.pending,
+                'fired': dict(self.fired)
+            }
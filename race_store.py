@@ -0,0 +1,118 @@
+# RaceCoin - Columnar race store
+#
+# The published programme as a struct of NumPy arrays instead of a list of
+# nested dicts: one row per race (start time, course, field size, offset
+# into the runner columns) and one row per runner (horse, odds). Course and
+# horse names are interned into string tables, so filters are integer
+# comparisons over whole columns and a race's odds are a view into one flat
+# array. Thousands of races take a few hundred KB and answer in microseconds.
+
+from datetime import datetime
+
+import numpy as np
+
+
+class StringTable:
+    """Interned strings: each distinct value gets a small integer id"""
+
+    def __init__(self):
+        self.values = []
+        self.ids = {}
+
+    def intern(self, value):
+        string_id = self.ids.get(value)
+        if string_id is None:
+            string_id = self.ids[value] = len(self.values)
+            self.values.append(value)
+        return string_id
+
+    def lookup(self, value):
+        """Id of an existing string, or -1 (matches nothing) if it was never interned"""
+        return self.ids.get(value, -1)
+
+
+def to_timestamp(start_time):
+    if isinstance(start_time, datetime):
+        return int(start_time.timestamp())
+    return int(datetime.fromisoformat(str(start_time).replace('Z', '+00:00')).timestamp())
+
+
+class RaceStore:
+    def __init__(self, races):
+        """Build from race dicts as produced by the app or any provider adapter"""
+        # Source dicts by row, so a lookup never mixes rows from two programmes
+        self.races = list(races)
+        self.courses = StringTable()
+        self.horses = StringTable()
+        race_ids, starts, course_ids, field_sizes = [], [], [], []
+        runner_ids, odds = [], []
+        for race in self.races:
+            race_ids.append(race['id'])
+            starts.append(to_timestamp(race['start_time']))
+            course_ids.append(self.courses.intern(race.get('track') or race.get('course') or ''))
+            runners = race['horses']
+            field_sizes.append(len(runners))
+            for runner in runners:
+                # App cards carry dicts; some adapters only list names with a separate odds map
+                name = runner['name'] if isinstance(runner, dict) else runner
+                price = runner.get('odds', runner.get('decimal_odds')) if isinstance(runner, dict) else None
+                runner_ids.append(self.horses.intern(name))
+                odds.append(price if price is not None else race.get('odds', {}).get(name, np.nan))
+
+        self.race_ids = np.array(race_ids, dtype=np.int64)
+        self.start_times = np.array(starts, dtype=np.int64)
+        self.course_ids = np.array(course_ids, dtype=np.int32)
+        self.field_sizes = np.array(field_sizes, dtype=np.int16)
+        self.runner_offsets = np.zeros(len(race_ids) + 1, dtype=np.int64)
+        np.cumsum(self.field_sizes, out=self.runner_offsets[1:])
+        self.runner_ids = np.array(runner_ids, dtype=np.int32)
+        self.odds = np.array(odds, dtype=np.float64)
+
+    def __len__(self):
+        return len(self.race_ids)
+
+    def filter(self, course=None, start=None, end=None, horse=None):
+        """Row indices of races matching every given condition (start/end are epoch seconds)"""
+        mask = np.ones(len(self), dtype=bool)
+        if course is not None:
+            mask &= self.course_ids == self.courses.lookup(course)
+        if start is not None:
+            mask &= self.start_times >= start
+        if end is not None:
+            mask &= self.start_times < end
+        if horse is not None:
+            # Runner rows for the horse, mapped back to the race that owns each row
+            rows = np.flatnonzero(self.runner_ids == self.horses.lookup(horse))
+            races = np.zeros(len(self), dtype=bool)
+            races[np.searchsorted(self.runner_offsets, rows, side='right') - 1] = True
+            mask &= races
+        return np.flatnonzero(mask)
+
+    def sort_by_start(self, rows):
+        """Rows ordered by start time, then race id"""
+        return rows[np.lexsort((self.race_ids[rows], self.start_times[rows]))]
+
+    def upcoming(self, course=None, now=None, limit=None):
+        """Races yet to start (optionally at one course), soonest first"""
+        now = int(datetime.now().timestamp()) if now is None else now
+        rows = self.sort_by_start(self.filter(course=course, start=now))
+        return rows if limit is None else rows[:limit]
+
+    def odds_slice(self, row):
+        """The race's odds as a view into the shared odds column (no copy)"""
+        return self.odds[self.runner_offsets[row]:self.runner_offsets[row + 1]]
+
+    def runner_names(self, row):
+        ids = self.runner_ids[self.runner_offsets[row]:self.runner_offsets[row + 1]]
+        return [self.horses.values[i] for i in ids]
+
+    def course(self, row):
+        return self.courses.values[self.course_ids[row]]
+
+    def row_of(self, race_id):
+        rows = np.flatnonzero(self.race_ids == race_id)
+        return int(rows[0]) if len(rows) else None
+
+    def nbytes(self):
+        return sum(a.nbytes for a in (self.race_ids, self.start_times, self.course_ids, self.field_sizes,
+                                      self.runner_offsets, self.runner_ids, self.odds))
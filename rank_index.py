@@ -0,0 +1,244 @@
+# RaceCoin - Leaderboard rank index
+#
+# An order-statistics index over coin balances: a Fenwick tree counts players
+# per coin bucket (highest bucket first) and each bucket keeps its players
+# sorted, so a player's exact position and the players either side of them
+# are found in O(log n) instead of counting everyone with more coins.
+# Ties are broken by user id, matching the leaderboard's ORDER BY. Every new
+# player starts on the same balance, so one bucket can hold most of them:
+# buckets are kept as short sorted chunks (split as they fill, with their own
+# Fenwick tree over chunk sizes), so no update shifts more than one chunk.
+
+import bisect
+import threading
+import time
+
+# Entries per chunk after a split; a chunk splits once it holds twice this
+CHUNK_SIZE = 512
+
+
+class FenwickTree:
+    def __init__(self, size):
+        self.size = size
+        self.tree = [0] * (size + 1)
+
+    @classmethod
+    def from_counts(cls, counts):
+        """Tree over the given counts, built in O(n)"""
+        tree = cls(len(counts))
+        tree.tree[1:] = counts
+        for index in range(1, tree.size + 1):
+            parent = index + (index & -index)
+            if parent <= tree.size:
+                tree.tree[parent] += tree.tree[index]
+        return tree
+
+    def add(self, index, delta):
+        index += 1
+        while index <= self.size:
+            self.tree[index] += delta
+            index += index & -index
+
+    def prefix_sum(self, index):
+        """Sum of counts for positions 0..index inclusive"""
+        total = 0
+        index += 1
+        while index > 0:
+            total += self.tree[index]
+            index -= index & -index
+        return total
+
+    def find(self, k):
+        """Smallest position whose prefix sum reaches k (k is 1-based)"""
+        pos = 0
+        step = 1 << self.size.bit_length()
+        while step:
+            nxt = pos + step
+            if nxt <= self.size and self.tree[nxt] < k:
+                pos = nxt
+                k -= self.tree[nxt]
+            step >>= 1
+        return pos
+
+
+class SortedBucket:
+    """Sorted entries split into chunks of at most 2 * CHUNK_SIZE, indexable by position"""
+
+    def __init__(self, entries=()):
+        # entries must already be sorted
+        entries = list(entries)
+        self.chunks = [entries[i:i + CHUNK_SIZE] for i in range(0, len(entries), CHUNK_SIZE)]
+        self.maxes = [chunk[-1] for chunk in self.chunks]
+        self.length = len(entries)
+        self._reindex()
+
+    def _reindex(self):
+        self.sizes = FenwickTree.from_counts([len(chunk) for chunk in self.chunks])
+
+    def _chunk_for(self, entry):
+        """First chunk that could hold entry (the last one if entry is past every chunk)"""
+        return min(bisect.bisect_left(self.maxes, entry), len(self.chunks) - 1)
+
+    def add(self, entry):
+        self.length += 1
+        if not self.chunks:
+            self.chunks.append([entry])
+            self.maxes.append(entry)
+            self._reindex()
+            return
+        i = self._chunk_for(entry)
+        chunk = self.chunks[i]
+        bisect.insort(chunk, entry)
+        self.maxes[i] = chunk[-1]
+        if len(chunk) > 2 * CHUNK_SIZE:
+            self.chunks[i:i + 1] = [chunk[:CHUNK_SIZE], chunk[CHUNK_SIZE:]]
+            self.maxes[i:i + 1] = [chunk[CHUNK_SIZE - 1], chunk[-1]]
+            self._reindex()
+        else:
+            self.sizes.add(i, 1)
+
+    def remove(self, entry):
+        i = self._chunk_for(entry)
+        chunk = self.chunks[i]
+        del chunk[bisect.bisect_left(chunk, entry)]
+        self.length -= 1
+        if chunk:
+            self.maxes[i] = chunk[-1]
+            self.sizes.add(i, -1)
+        else:
+            del self.chunks[i]
+            del self.maxes[i]
+            self._reindex()
+
+    def index(self, entry):
+        """Number of entries that sort before entry"""
+        if not self.chunks:
+            return 0
+        i = self._chunk_for(entry)
+        before = self.sizes.prefix_sum(i - 1) if i > 0 else 0
+        return before + bisect.bisect_left(self.chunks[i], entry)
+
+    def __getitem__(self, position):
+        i = self.sizes.find(position + 1)
+        before = self.sizes.prefix_sum(i - 1) if i > 0 else 0
+        return self.chunks[i][position - before]
+
+    def __len__(self):
+        return self.length
+
+
+class RankIndex:
+    def __init__(self, load_rows, bucket_width=100, num_buckets=10000, resync_seconds=300):
+        # load_rows() returns (user_id, username, coins) for every player
+        self.load_rows = load_rows
+        self.bucket_width = bucket_width
+        self.num_buckets = num_buckets
+        self.resync_seconds = resync_seconds
+        self._lock = threading.Lock()
+        self._loaded_at = None
+        self._reset()
+
+    def _reset(self):
+        self.tree = FenwickTree(self.num_buckets)
+        self.buckets = {}
+        self.coins = {}
+        self.names = {}
+
+    def _slot(self, coins):
+        """Fenwick position for a balance: 0 is the richest bucket (which also holds the overflow)"""
+        bucket = min(max(coins, 0) // self.bucket_width, self.num_buckets - 1)
+        return self.num_buckets - 1 - bucket
+
+    def _insert(self, user_id, coins):
+        slot = self._slot(coins)
+        bucket = self.buckets.get(slot)
+        if bucket is None:
+            bucket = self.buckets[slot] = SortedBucket()
+        bucket.add((-coins, user_id))
+        self.tree.add(slot, 1)
+        self.coins[user_id] = coins
+
+    def _remove(self, user_id):
+        coins = self.coins.pop(user_id, None)
+        if coins is None:
+            return
+        slot = self._slot(coins)
+        self.buckets[slot].remove((-coins, user_id))
+        self.tree.add(slot, -1)
+
+    def resync(self):
+        """Rebuild from the database (covers writes made by other processes)"""
+        rows = list(self.load_rows())
+        with self._lock:
+            self._reset()
+            # Sorted once and chunked per bucket, rather than inserted one by one
+            grouped = {}
+            for user_id, username, coins in rows:
+                coins = coins or 0
+                self.names[user_id] = username
+                self.coins[user_id] = coins
+                grouped.setdefault(self._slot(coins), []).append((-coins, user_id))
+            for slot, entries in grouped.items():
+                entries.sort()
+                self.buckets[slot] = SortedBucket(entries)
+                self.tree.add(slot, len(entries))
+            self._loaded_at = time.monotonic()
+        print(f"DEBUG: Rank index rebuilt with {len(rows)} players")
+
+    def _ensure_fresh(self):
+        if self._loaded_at is None or time.monotonic() - self._loaded_at > self.resync_seconds:
+            self.resync()
+
+    def update(self, user_id, coins, username=None):
+        """Record a player's new balance"""
+        with self._lock:
+            if self._loaded_at is None:
+                return  # the first lookup loads everything anyway
+            if username is not None:
+                self.names[user_id] = username
+            self._remove(user_id)
+            self._insert(user_id, coins)
+
+    def _position(self, user_id):
+        coins = self.coins.get(user_id)
+        if coins is None:
+            return None
+        slot = self._slot(coins)
+        above = self.tree.prefix_sum(slot - 1) if slot > 0 else 0
+        return above + self.buckets[slot].index((-coins, user_id)) + 1
+
+    def _at(self, position):
+        """user_id at a 1-based leaderboard position"""
+        slot = self.tree.find(position)
+        above = self.tree.prefix_sum(slot - 1) if slot > 0 else 0
+        return self.buckets[slot][position - above - 1][1]
+
+    def total(self):
+        self._ensure_fresh()
+        return len(self.coins)
+
+    def position(self, user_id):
+        """1-based leaderboard position, or None for an unknown player"""
+        self._ensure_fresh()
+        with self._lock:
+            return self._position(user_id)
+
+    def neighbours(self, user_id, radius=2):
+        """(position, rows) where rows are the players from position-radius to position+radius"""
+        self._ensure_fresh()
+        with self._lock:
+            position = self._position(user_id)
+            if position is None:
+                return None, []
+            first = max(1, position - radius)
+            last = min(len(self.coins), position + radius)
+            rows = []
+            for pos in range(first, last + 1):
+                other = self._at(pos)
+                rows.append({
+                    'position': pos,
+                    'username': self.names.get(other),
+                    'coins': self.coins[other],
+                    'is_me': other == user_id
+                })
+            return position, rows
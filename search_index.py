@@ -0,0 +1,103 @@
+# RaceCoin - Autocomplete search over horses, jockeys and courses
+#
+# One sorted array of lower-cased keys per kind, searched with bisect: every
+# name is filed under its full text and under each later word ("Silver
+# Bullet" is also found by "bul"), so a prefix lookup is two binary searches
+# and a short scan instead of a LIKE '%x%' over every name. Keeping the kinds
+# apart means a jockey-only search never spends its scan on horses. Names
+# are added incrementally as races are published, and each name remembers
+# the upcoming races it appears in.
+
+import bisect
+import threading
+
+KINDS = ('horse', 'jockey', 'course')
+# Upper bound on keys inspected per kind and lookup, so one-letter queries stay cheap
+MAX_SCAN = 200
+
+
+def normalize(text):
+    return ' '.join(str(text).lower().split())
+
+
+class SearchIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        # kind -> sorted keys, and the (name, whole, normalized) entry at each position
+        self.keys = {kind: [] for kind in KINDS}
+        self.entries = {kind: [] for kind in KINDS}
+        self.known = set()
+        # (kind, name) -> {race_id: (start_time, title)}
+        self.races = {}
+
+    def add(self, kind, name):
+        """Make a name searchable (no-op if it already is)"""
+        if not name:
+            return
+        with self._lock:
+            self._add(kind, name)
+
+    def _add(self, kind, name):
+        if (kind, name) in self.known:
+            return
+        self.known.add((kind, name))
+        normalized = normalize(name)
+        words = normalized.split(' ')
+        keys = self.keys.setdefault(kind, [])
+        entries = self.entries.setdefault(kind, [])
+        for i in range(len(words)):
+            key = ' '.join(words[i:])
+            pos = bisect.bisect_right(keys, key)
+            keys.insert(pos, key)
+            # i == 0: the key is the whole name, which ranks above a match on a later word
+            entries.insert(pos, (name, i == 0, normalized))
+
+    def add_race(self, race):
+        """Index a race's course, runners and jockeys and link them to the race"""
+        with self._lock:
+            names = [('course', race.get('track') or race.get('course'))]
+            for horse in race.get('horses', []):
+                if isinstance(horse, dict):
+                    names.append(('horse', horse.get('name')))
+                    jockey = horse.get('jockey')
+                    names.append(('jockey', jockey.get('name') if isinstance(jockey, dict) else jockey))
+                else:
+                    names.append(('horse', horse))
+            for kind, name in names:
+                if name:
+                    self._add(kind, name)
+                    self.races.setdefault((kind, name), {})[race['id']] = (str(race['start_time']), race.get('title'))
+
+    def clear_races(self):
+        """Forget race links (the names stay searchable) before a programme is republished"""
+        with self._lock:
+            self.races = {}
+
+    def search(self, query, limit=10, kinds=None):
+        """Top matches for a typed prefix: exact names first, then names with upcoming races"""
+        prefix = normalize(query)
+        if not prefix:
+            return []
+        with self._lock:
+            best = {}
+            for kind in kinds or self.keys:
+                keys = self.keys.get(kind, [])
+                start = bisect.bisect_left(keys, prefix)
+                end = bisect.bisect_left(keys, prefix + '\uffff', start, min(start + MAX_SCAN, len(keys)))
+                for name, whole, normalized in self.entries.get(kind, [])[start:end]:
+                    rank = (normalized != prefix, not whole)
+                    if (kind, name) not in best or rank < best[(kind, name)]:
+                        best[(kind, name)] = rank
+            ranked = sorted(best, key=lambda entry: best[entry] + (
+                -len(self.races.get(entry, ())), len(entry[1]), entry[1]
+            ))[:limit]
+            results = []
+            for kind, name in ranked:
+                upcoming = sorted(self.races.get((kind, name), {}).items(), key=lambda r: r[1][0])
+                results.append({
+                    'kind': kind,
+                    'name': name,
+                    'races': [{'id': race_id, 'start_time': start_time, 'title': title}
+                              for race_id, (start_time, title) in upcoming]
+                })
+            return results
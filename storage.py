@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+# RaceCoin - User-sharded SQLite storage
+#
+# Player rows (users, user_period_stats and bets) live in one of N SQLite files,
+# chosen by user id, so writes for different players take different file
+# locks. users.db stays the catalog: global tables (horses, liability,
+# ratings, ...) and a user_directory that assigns every player a unique id,
+# keeps usernames unique, and records which shard holds them. A player's
+# rows are always on one shard, so per-player reads and joins stay local;
+# leaderboards and other global queries scatter to every shard in parallel
+# and merge the already-sorted results.
+#
+# Rebalancing (run with the app stopped, since workers cache where players live):
+#     python storage.py --shards 4 status
+#     python storage.py --shards 4 rebalance     # move everyone to their home shard
+#     python storage.py --shards 4 move 17 2     # move one player
+
+import argparse
+import heapq
+import itertools
+import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Per-player tables and the column holding the player's id
+USER_TABLES = {
+    'users': 'id',
+    'user_period_stats': 'user_id',
+    'bets': 'user_id'
+}
+
+
+def copy_schema(source, target):
+    """Create any missing per-player tables (and their indexes) on a shard, as defined in the catalog"""
+    for table in USER_TABLES:
+        rows = source.execute(
+            "SELECT type, sql FROM sqlite_master WHERE tbl_name = ? AND sql IS NOT NULL "
+            "ORDER BY type = 'index'", (table,)
+        ).fetchall()
+        for row in rows:
+            statement = row['sql'].replace('CREATE TABLE ', 'CREATE TABLE IF NOT EXISTS ', 1)
+            statement = statement.replace('CREATE INDEX ', 'CREATE INDEX IF NOT EXISTS ', 1)
+            target.execute(statement)
+
+
+class ShardedStorage:
+    def __init__(self, path, shards=1):
+        self.path = path
+        self.shards = max(1, shards)
+        self._directory = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=self.shards, thread_name_prefix='shard') \
+            if self.shards > 1 else None
+
+    def shard_path(self, shard):
+        # Shard 0 is the catalog file itself, so one shard is exactly the old single-file layout
+        if shard == 0:
+            return self.path
+        base, ext = os.path.splitext(self.path)
+        return f"{base}.shard{shard}{ext}"
+
+    def connect(self, shard=0):
+        conn = sqlite3.connect(self.shard_path(shard))
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def get_db(self):
+        """Catalog connection (global tables and the user directory)"""
+        return self.connect(0)
+
+    def init_schema(self):
+        conn = self.get_db()
+        c = conn.cursor()
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS user_directory (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                username TEXT UNIQUE NOT NULL,
+                shard INTEGER NOT NULL
+            )
+        ''')
+        # Players registered before sharding live in users.db, which is shard 0
+        c.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'users'")
+        if c.fetchone():
+            c.execute('''
+                INSERT OR IGNORE INTO user_directory (id, username, shard)
+                SELECT id, username, 0 FROM users
+            ''')
+        conn.commit()
+        conn.close()
+
+    # ----- Routing -----
+
+    def home_shard(self, user_id):
+        """Where a player is placed by default: ids are sequential, so modulo spreads them evenly"""
+        return user_id % self.shards
+
+    def shard_of(self, user_id):
+        with self._lock:
+            shard = self._directory.get(user_id)
+        if shard is None:
+            conn = self.get_db()
+            row = conn.execute("SELECT shard FROM user_directory WHERE id = ?", (user_id,)).fetchone()
+            conn.close()
+            shard = row['shard'] if row else self.home_shard(user_id)
+            with self._lock:
+                self._directory[user_id] = shard
+        return shard
+
+    def user_db(self, user_id):
+        """Connection to the shard holding this player's rows"""
+        return self.connect(self.shard_of(user_id))
+
+    def register(self, username):
+        """Reserve a user id and home shard; raises sqlite3.IntegrityError if the name is taken"""
+        conn = self.get_db()
+        try:
+            c = conn.cursor()
+            c.execute("INSERT INTO user_directory (username, shard) VALUES (?, 0)", (username,))
+            user_id = c.lastrowid
+            shard = self.home_shard(user_id)
+            c.execute("UPDATE user_directory SET shard = ? WHERE id = ?", (shard, user_id))
+            conn.commit()
+        finally:
+            conn.close()
+        with self._lock:
+            self._directory[user_id] = shard
+        return user_id, shard
+
+    def unregister(self, user_id):
+        """Give a reserved name back (the player's rows could not be written)"""
+        conn = self.get_db()
+        conn.execute("DELETE FROM user_directory WHERE id = ?", (user_id,))
+        conn.commit()
+        conn.close()
+
+    def find_user(self, username):
+        """(user_id, shard) for a username, or None"""
+        conn = self.get_db()
+        row = conn.execute("SELECT id, shard FROM user_directory WHERE username = ?", (username,)).fetchone()
+        conn.close()
+        return (row['id'], row['shard']) if row else None
+
+    # ----- Scatter-gather -----
+
+    def scatter(self, fn):
+        """fn(conn, shard) on every shard in parallel; returns the results in shard order"""
+        def run(shard):
+            conn = self.connect(shard)
+            try:
+                return fn(conn, shard)
+            finally:
+                conn.close()
+        if self._pool is None:
+            return [run(0)]
+        return list(self._pool.map(run, range(self.shards)))
+
+    def query_all(self, sql, params=()):
+        """Rows of one query run against every shard"""
+        return list(itertools.chain.from_iterable(
+            self.scatter(lambda conn, shard: conn.execute(sql, params).fetchall())
+        ))
+
+    def merge_top(self, sql, params, key, limit):
+        """First `limit` rows of a query that every shard returns sorted by `key`
+
+        Each shard's query must apply the same ORDER BY and its own LIMIT of
+        at least `limit`; the sorted shard results are then merged, not re-sorted.
+        """
+        per_shard = self.scatter(lambda conn, shard: conn.execute(sql, params).fetchall())
+        return list(itertools.islice(heapq.merge(*per_shard, key=key), limit))
+
+    # ----- Rebalancing -----
+
+    def move_user(self, user_id, target):
+        """Copy a player's rows to another shard, repoint the directory, then delete the old copy"""
+        source = self.shard_of(user_id)
+        if source == target:
+            return False
+        src, dst, catalog = self.connect(source), self.connect(target), self.get_db()
+        try:
+            copy_schema(catalog, dst)
+            for table, column in USER_TABLES.items():
+                rows = src.execute(f"SELECT * FROM {table} WHERE {column} = ?", (user_id,)).fetchall()
+                dst.execute(f"DELETE FROM {table} WHERE {column} = ?", (user_id,))
+                if rows:
+                    columns = rows[0].keys()
+                    dst.executemany(
+                        f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                        [tuple(row) for row in rows]
+                    )
+            dst.commit()
+            # From here the player is served from the target; a crash now only leaves a stale copy
+            catalog.execute("UPDATE user_directory SET shard = ? WHERE id = ?", (target, user_id))
+            catalog.commit()
+            for table, column in USER_TABLES.items():
+                src.execute(f"DELETE FROM {table} WHERE {column} = ?", (user_id,))
+            src.commit()
+        finally:
+            src.close()
+            dst.close()
+            catalog.close()
+        with self._lock:
+            self._directory[user_id] = target
+        return True
+
+    def placements(self):
+        conn = self.get_db()
+        rows = conn.execute("SELECT id, shard FROM user_directory ORDER BY id").fetchall()
+        conn.close()
+        return [(row['id'], row['shard']) for row in rows]
+
+    def rebalance(self):
+        """Move every player who is not on their home shard; returns how many moved"""
+        moved = 0
+        for user_id, shard in self.placements():
+            if shard != self.home_shard(user_id):
+                self.move_user(user_id, self.home_shard(user_id))
+                moved += 1
+        return moved
+
+    def known_shards(self):
+        """Every shard index in use: the configured ones plus any a player still sits on"""
+        return range(max([self.shards] + [shard + 1 for _, shard in self.placements()]))
+
+    def remove_strays(self):
+        """Delete player rows left on a shard the directory no longer points to (after a crashed move)"""
+        placement = dict(self.placements())
+        removed = 0
+        for shard in self.known_shards():
+            conn = self.connect(shard)
+            for table, column in USER_TABLES.items():
+                try:
+                    ids = {row[0] for row in conn.execute(f"SELECT DISTINCT {column} FROM {table}")}
+                except sqlite3.OperationalError:
+                    continue
+                strays = [(i,) for i in ids if placement.get(i, shard) != shard]
+                conn.executemany(f"DELETE FROM {table} WHERE {column} = ?", strays)
+                removed += len(strays)
+            conn.commit()
+            conn.close()
+        return removed
+
+    def status(self):
+        counts = dict.fromkeys(self.known_shards(), 0)
+        for _, shard in self.placements():
+            counts[shard] = counts.get(shard, 0) + 1
+        return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect and rebalance RaceCoin's user shards")
+    parser.add_argument('--db', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'users.db'))
+    parser.add_argument('--shards', type=int, default=int(os.environ.get('DB_SHARDS', 1)))
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('status', help='players per shard')
+    sub.add_parser('rebalance', help='move every player to their home shard for --shards')
+    move = sub.add_parser('move', help='move one player')
+    move.add_argument('user_id', type=int)
+    move.add_argument('shard', type=int)
+    args = parser.parse_args()
+
+    storage = ShardedStorage(args.db, args.shards)
+    storage.init_schema()
+    if args.command == 'move':
+        if not 0 <= args.shard < storage.shards:
+            raise SystemExit(f"❌ Shard must be between 0 and {storage.shards - 1}")
+        print("✅ Moved" if storage.move_user(args.user_id, args.shard) else "Already there")
+    elif args.command == 'rebalance':
+        moved = storage.rebalance()
+        print(f"✅ Moved {moved} players, removed {storage.remove_strays()} stray rows")
+    for shard, players in sorted(storage.status().items()):
+        note = '' if shard < storage.shards else '  (beyond --shards, rebalance to empty it)'
+        print(f"shard {shard}: {players:>8} players  {storage.shard_path(shard)}{note}")
+
+
+if __name__ == "__main__":
+    main()
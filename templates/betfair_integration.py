@@ -0,0 +1,225 @@
+# Betfair Exchange API Integration
+# Ported from the old app's betfair_login()/betfair_api_request() helpers.
+# Calls are meant to go through provider_resilience so a slow Betfair never
+# holds up a race page.
+
+import requests
+import random
+from datetime import datetime, timedelta
+
+from provider_resilience import get_provider
+from betfair_session import BetfairSessionManager
+
+BETFAIR_BASE_URL = "https://api.betfair.com/exchange/betting/rest/v1.0"
+# Error codes Betfair returns when the session token is missing or expired
+AUTH_ERRORS = ('INVALID_SESSION_INFORMATION', 'NO_SESSION')
+
+class BetfairExchangeAPI:
+    def __init__(self, app_key, username, password, timeout=(3.05, 5), session_manager=None, stream=None):
+        self.app_key = app_key
+        # (connect, read) - the resilience layer bounds the total, this bounds each socket wait
+        self.timeout = timeout
+        # Token shared across workers and kept alive in the background,
+        # so requests never wait on a login
+        self.session = session_manager or BetfairSessionManager(app_key, username, password, timeout=timeout).start()
+        self.provider = get_provider('betfair')
+        # Optional betfair_stream.StreamConsumer; when set, prices come from its
+        # cache and listMarketBook is only a fallback for markets not streamed yet
+        self.stream = stream
+
+    def login(self):
+        """Force a fresh Betfair login for every worker"""
+        return self.session.refresh(force=True)
+
+    def _is_auth_error(self, response):
+        return response.status_code in (400, 401) and any(code in response.text for code in AUTH_ERRORS)
+
+    def api_request(self, endpoint, params=None):
+        """Make authenticated request to Betfair API (one retry if the session has expired)"""
+        token = self.session.token()
+        if not token:
+            print("Betfair session not ready yet")
+            return None
+
+        url = f"{BETFAIR_BASE_URL}/{endpoint}/"
+
+        for attempt in range(2):
+            headers = {
+                'Content-Type': 'application/json',
+                'X-Application': self.app_key,
+                'X-Authentication': token,
+                'Accept': 'application/json'
+            }
+            try:
+                response = requests.post(url, headers=headers, json=params or {}, timeout=self.timeout)
+            except Exception as e:
+                print(f"Betfair API request error: {e}")
+                return None
+
+            if response.status_code == 200:
+                return response.json()
+            if attempt == 0 and self._is_auth_error(response):
+                token = self.session.invalidate(token)
+                if token:
+                    continue
+            print(f"Betfair API error: {response.status_code} - {response.text}")
+            return None
+
+    def get_horse_racing_events(self, max_events=4):
+        """Fetch today's horse racing WIN markets with best back prices"""
+        print("DEBUG: Fetching horse racing events from Betfair...")
+
+        event_types = self.api_request('listEventTypes', {
+            'filter': {
+                'textQuery': 'Horse Racing'
+            }
+        })
+
+        if not event_types:
+            print("Failed to get Betfair event types")
+            return None
+
+        horse_racing_type_id = None
+        for event_type in event_types:
+            if 'Horse Racing' in event_type.get('eventType', {}).get('name', ''):
+                horse_racing_type_id = event_type.get('eventType', {}).get('id')
+                break
+
+        if not horse_racing_type_id:
+            print("Horse Racing event type not found")
+            return None
+
+        today = datetime.now().strftime('%Y-%m-%dT00:00:00.000Z')
+        tomorrow = (datetime.now() + timedelta(days=1)).strftime('%Y-%m-%dT00:00:00.000Z')
+
+        events = self.api_request('listEvents', {
+            'filter': {
+                'eventTypeIds': [horse_racing_type_id],
+                'marketStartTime': {
+                    'from': today,
+                    'to': tomorrow
+                }
+            }
+        })
+
+        if not events:
+            print("No Betfair events found")
+            return None
+
+        betfair_races = []
+
+        for event in events[:max_events]:
+            event_id = event.get('event', {}).get('id')
+            event_name = event.get('event', {}).get('name', 'Horse Racing')
+
+            markets = self.api_request('listMarketCatalogue', {
+                'filter': {
+                    'eventIds': [event_id],
+                    'marketTypeCodes': ['WIN']
+                },
+                'maxResults': 1,
+                'marketProjection': ['RUNNER_DESCRIPTION', 'MARKET_START_TIME']
+            })
+
+            if markets:
+                market = markets[0]
+                market_book = self.get_market_book(market.get('marketId'))
+
+                if market_book and market_book.get('runners'):
+                    race_data = self.transform_to_race_format(market, market_book, event_name)
+                    if race_data:
+                        betfair_races.append(race_data)
+
+        print(f"DEBUG: ✅ Retrieved {len(betfair_races)} Betfair races")
+        return betfair_races
+
+    def get_market_book(self, market_id):
+        """Best offers for a market: streamed cache first, REST snapshot otherwise"""
+        if self.stream is not None:
+            self.stream.watch([market_id])
+            market_book = self.stream.market_book(market_id, max_age=30)
+            if market_book:
+                return market_book
+
+        market_book = self.api_request('listMarketBook', {
+            'marketIds': [market_id],
+            'priceProjection': {
+                'priceData': ['EX_BEST_OFFERS']
+            }
+        })
+        return market_book[0] if market_book else None
+
+    def get_races(self, fallback, budget_seconds=None):
+        """Betfair races within the latency budget, or fallback()'s virtual races"""
+        races, source = self.provider.call(self.get_horse_racing_events, fallback, budget_seconds)
+        print(f"DEBUG: Races served from {source}")
+        return races
+
+    def transform_to_race_format(self, market, market_book, event_name):
+        """Convert Betfair market data to game format"""
+        try:
+            race_id = f"betfair_{market.get('marketId', random.randint(1000, 9999))}"
+            race_time = market.get('marketStartTime', datetime.now().isoformat())
+
+            horses = []
+            horse_odds = {}
+
+            # Best back price by selection id
+            odds_lookup = {}
+            for runner in market_book.get('runners', []):
+                available_to_back = runner.get('ex', {}).get('availableToBack', [])
+                if available_to_back:
+                    odds_lookup[runner.get('selectionId')] = float(available_to_back[0].get('price', 2.0))
+
+            for runner in market.get('runners', []):
+                horse_name = runner.get('runnerName', f"Horse {len(horses)+1}")
+                horses.append(horse_name)
+                # Generate realistic odds if the exchange has no price yet
+                horse_odds[horse_name] = odds_lookup.get(runner.get('selectionId'), round(random.uniform(2.0, 12.0), 2))
+
+            # Ensure we have at least 5 horses
+            while len(horses) < 5:
+                horses.append(f"Mystery Horse {len(horses)+1}")
+                horse_odds[horses[-1]] = round(random.uniform(4.0, 10.0), 2)
+
+            return {
+                'id': race_id,
+                'horses': horses[:8],  # Max 8 horses
+                'odds': horse_odds,
+                'title': event_name,
+                'start_time': race_time,
+                'is_real_race': True,
+                'data_source': 'Betfair Exchange API',
+                'track': event_name.split(' ')[0] if event_name else 'Betfair Track',
+                'race_number': 1
+            }
+
+        except Exception as e:
+            print(f"Error converting Betfair race data: {e}")
+            return None
+
+    def test_connection(self):
+        """Test Betfair API connection"""
+        try:
+            if self.login():
+                event_types = self.api_request('listEventTypes', {})
+                if event_types:
+                    return True, f"✅ Connected to Betfair API - {len(event_types)} event types available"
+                return False, "❌ Connected but failed to get event types"
+            return False, "❌ Failed to login to Betfair"
+        except Exception as e:
+            return False, f"❌ Betfair connection error: {str(e)}"
+
+# Usage example in your Flask app:
+"""
+betfair_api = BetfairExchangeAPI(app_key, username, password)
+# Optional: stream prices instead of polling listMarketBook
+betfair_api.stream = StreamConsumer(app_key, betfair_api.session).start()
+
+@app.route('/api/refresh-races')
+def refresh_races():
+    # Never waits more than ~2.5s; virtual races win the race if Betfair is slow
+    races = betfair_api.get_races(fallback=generate_virtual_races)
+    session['races'] = races
+    return jsonify({'success': True, 'races_count': len(races)})
+"""
@@ -0,0 +1,202 @@
+# Betfair Session Manager - one session token shared by every worker
+# The token lives in a small SQLite file next to the app. A background
+# thread in each process keeps it alive well before Betfair expires it, and
+# a lease row makes sure only one worker at a time does the login or
+# keep-alive round trip. Requests just read the current token.
+
+import os
+import sqlite3
+import threading
+import time
+import uuid
+import requests
+
+BETFAIR_LOGIN_URL = "https://identitysso.betfair.com/api/login"
+BETFAIR_KEEP_ALIVE_URL = "https://identitysso.betfair.com/api/keepAlive"
+
+# Betfair sessions last 8 hours (international exchange) from the last keep-alive
+SESSION_TTL = 8 * 3600
+# Renew once less than this is left
+REFRESH_MARGIN = 2 * 3600
+# How long a worker may hold the refresh lease before another may take over
+LEASE_SECONDS = 30
+
+
+class BetfairSessionManager:
+    def __init__(self, app_key, username, password, lease_path=None, check_seconds=60, timeout=(3.05, 5)):
+        self.app_key = app_key
+        self.username = username
+        self.password = password
+        self.lease_path = lease_path or os.environ.get('BETFAIR_SESSION_DB', 'betfair_session.db')
+        self.check_seconds = check_seconds
+        self.timeout = timeout
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._token = None
+        self._expires_at = 0
+        self._lock = threading.Lock()
+        self._thread = None
+        self.logins = 0
+        self.keep_alives = 0
+        self._init_schema()
+
+    def _connect(self):
+        return sqlite3.connect(self.lease_path, timeout=5)
+
+    def _init_schema(self):
+        conn = self._connect()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS betfair_session (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                token TEXT,
+                expires_at REAL DEFAULT 0,
+                lease_owner TEXT,
+                lease_until REAL DEFAULT 0
+            )
+        ''')
+        conn.execute("INSERT OR IGNORE INTO betfair_session (id) VALUES (1)")
+        conn.commit()
+        conn.close()
+
+    def _read_shared(self):
+        conn = self._connect()
+        row = conn.execute("SELECT token, expires_at FROM betfair_session WHERE id = 1").fetchone()
+        conn.close()
+        return row or (None, 0)
+
+    def _acquire_lease(self):
+        now = time.time()
+        conn = self._connect()
+        cur = conn.execute('''
+            UPDATE betfair_session SET lease_owner = ?, lease_until = ?
+            WHERE id = 1 AND (lease_until < ? OR lease_owner = ?)
+        ''', (self.owner, now + LEASE_SECONDS, now, self.owner))
+        conn.commit()
+        conn.close()
+        return cur.rowcount == 1
+
+    def _store(self, token, expires_at):
+        conn = self._connect()
+        conn.execute('''
+            UPDATE betfair_session SET token = ?, expires_at = ?, lease_until = 0
+            WHERE id = 1 AND lease_owner = ?
+        ''', (token, expires_at, self.owner))
+        conn.commit()
+        conn.close()
+        with self._lock:
+            self._token, self._expires_at = token, expires_at
+
+    def _release(self):
+        conn = self._connect()
+        conn.execute("UPDATE betfair_session SET lease_until = 0 WHERE id = 1 AND lease_owner = ?", (self.owner,))
+        conn.commit()
+        conn.close()
+
+    def _login(self):
+        """POST credentials; returns a new token or None"""
+        if not self.app_key or self.app_key == "YOUR_BETFAIR_APP_KEY":
+            print("Betfair App Key not configured")
+            return None
+        try:
+            response = requests.post(BETFAIR_LOGIN_URL, headers={
+                'Content-Type': 'application/x-www-form-urlencoded',
+                'X-Application': self.app_key,
+                'Accept': 'application/json'
+            }, data={'username': self.username, 'password': self.password}, timeout=self.timeout)
+            body = response.json() if response.status_code == 200 else {}
+            if body.get('status') == 'SUCCESS':
+                self.logins += 1
+                print("✅ Betfair login successful")
+                return body.get('token')
+            print(f"❌ Betfair login failed: {body.get('error') or response.status_code}")
+        except Exception as e:
+            print(f"❌ Betfair login exception: {e}")
+        return None
+
+    def _keep_alive(self, token):
+        """Extend an existing session; returns the token or None if it is no longer valid"""
+        try:
+            response = requests.post(BETFAIR_KEEP_ALIVE_URL, headers={
+                'X-Application': self.app_key,
+                'X-Authentication': token,
+                'Accept': 'application/json'
+            }, timeout=self.timeout)
+            body = response.json() if response.status_code == 200 else {}
+            if body.get('status') == 'SUCCESS':
+                self.keep_alives += 1
+                return body.get('token') or token
+            print(f"DEBUG: Betfair keep-alive refused: {body.get('error') or response.status_code}")
+        except Exception as e:
+            print(f"DEBUG: Betfair keep-alive failed: {e}")
+        return None
+
+    def refresh(self, force=False):
+        """Renew the shared token if it is close to expiry (or force); True if a valid token is available"""
+        token, expires_at = self._read_shared()
+        if token and not force and expires_at - time.time() > REFRESH_MARGIN:
+            with self._lock:
+                self._token, self._expires_at = token, expires_at
+            return True
+        if not self._acquire_lease():
+            # Another worker is renewing it; pick up its token on the next check
+            return bool(token) and expires_at > time.time()
+        try:
+            new_token = self._keep_alive(token) if token and not force else None
+            new_token = new_token or self._login()
+            if new_token:
+                self._store(new_token, time.time() + SESSION_TTL)
+                return True
+            return False
+        finally:
+            self._release()
+
+    def token(self):
+        """Current token without any network call (None until the first login has landed)"""
+        with self._lock:
+            if self._token and self._expires_at > time.time():
+                return self._token
+        token, expires_at = self._read_shared()
+        if token and expires_at > time.time():
+            with self._lock:
+                self._token, self._expires_at = token, expires_at
+            return token
+        return None
+
+    def invalidate(self, token):
+        """Called after an auth error with `token`; returns a fresh token or None"""
+        with self._lock:
+            if self._token == token:
+                self._token, self._expires_at = None, 0
+        shared, _ = self._read_shared()
+        if shared and shared != token:
+            # Someone already replaced it
+            return self.token()
+        self.refresh(force=True)
+        return self.token()
+
+    def start(self):
+        """Warm the token and keep it alive from a background thread"""
+        if self._thread is not None:
+            return self
+        with self._lock:
+            if self._thread is not None:
+                return self
+            self._thread = threading.Thread(target=self._keep_alive_loop, daemon=True, name='betfair-session')
+        self._thread.start()
+        return self
+
+    def _keep_alive_loop(self):
+        while True:
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"DEBUG: Betfair session refresh failed: {e}")
+            time.sleep(self.check_seconds)
+
+    def status(self):
+        token, expires_at = self._read_shared()
+        return {
+            'has_token': bool(token) and expires_at > time.time(),
+            'expires_in': max(0, int(expires_at - time.time())),
+            'logins': self.logins,
+            'keep_alives': self.keep_alives
+        }
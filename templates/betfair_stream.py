@@ -0,0 +1,262 @@
+# Betfair Exchange Stream consumer
+# Instead of polling listMarketBook snapshots, subscribe once and apply the
+# market-change messages (mcm) the stream sends: a full image first, then
+# only the price levels that changed. Pages read best prices straight from
+# the in-memory cache, so real-odds mode stays sub-second fresh without
+# hitting the REST endpoints.
+#
+# Protocol: CRLF-terminated JSON over TLS (stream-api.betfair.com:443).
+#  - clk / initialClk are the stream's sequence tokens; they are sent back on
+#    reconnect so the server resumes with deltas instead of a new image
+#  - a market carrying a `chk` (CRC32 of its ladder, sent by the local fake
+#    server) is verified after each delta; a mismatch drops the cache and
+#    resubscribes for a fresh image
+
+import json
+import socket
+import ssl
+import threading
+import time
+import zlib
+
+STREAM_HOST = "stream-api.betfair.com"
+STREAM_PORT = 443
+
+
+def ladder_checksum(runners):
+    """CRC32 over every runner's back ladder, in a stable order"""
+    parts = []
+    for selection_id in sorted(runners):
+        ladder = runners[selection_id]['batb']
+        parts.append(f"{selection_id}:" + ",".join(f"{ladder[level][0]}@{ladder[level][1]}" for level in sorted(ladder)))
+    return zlib.crc32("|".join(parts).encode()) & 0xffffffff
+
+
+class MarketCache:
+    """Prices for one market, updated in place from stream deltas"""
+
+    def __init__(self, market_id):
+        self.market_id = market_id
+        self.definition = {}
+        self.runners = {}
+        self.updated_at = 0
+
+    def _runner(self, selection_id):
+        runner = self.runners.get(selection_id)
+        if runner is None:
+            runner = self.runners[selection_id] = {'batb': {}, 'ltp': None, 'tv': 0}
+        return runner
+
+    def apply(self, change, publish_time):
+        if change.get('img'):
+            # A full image replaces everything we knew about the market
+            self.runners = {}
+        if 'marketDefinition' in change:
+            self.definition = change['marketDefinition']
+        for rc in change.get('rc', []):
+            runner = self._runner(rc['id'])
+            # [level, price, size]; size 0 removes the level
+            for level, price, size in rc.get('batb', []):
+                if size == 0:
+                    runner['batb'].pop(level, None)
+                else:
+                    runner['batb'][level] = (price, size)
+            if 'ltp' in rc:
+                runner['ltp'] = rc['ltp']
+            if 'tv' in rc:
+                runner['tv'] = rc['tv']
+        self.updated_at = publish_time
+
+    def best_back(self, selection_id):
+        runner = self.runners.get(selection_id)
+        if not runner or not runner['batb']:
+            return None
+        return runner['batb'][min(runner['batb'])][0]
+
+    def market_book(self):
+        """Same shape as a listMarketBook entry, so existing converters work unchanged"""
+        return {
+            'marketId': self.market_id,
+            'runners': [{
+                'selectionId': selection_id,
+                'lastPriceTraded': runner['ltp'],
+                'ex': {'availableToBack': [{'price': p, 'size': s} for _, (p, s) in sorted(runner['batb'].items())]}
+            } for selection_id, runner in self.runners.items()]
+        }
+
+
+class PriceCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.markets = {}
+        self.checksum_failures = 0
+
+    def apply_mcm(self, message):
+        """Apply one market-change message; returns ids of markets whose checksum failed"""
+        bad = []
+        publish_time = message.get('pt', int(time.time() * 1000))
+        with self._lock:
+            for change in message.get('mc', []):
+                market = self.markets.get(change['id'])
+                if market is None:
+                    if not change.get('img'):
+                        # A delta for a market we never had an image for is useless
+                        bad.append(change['id'])
+                        continue
+                    market = self.markets[change['id']] = MarketCache(change['id'])
+                market.apply(change, publish_time)
+                if 'chk' in change and ladder_checksum(market.runners) != change['chk']:
+                    self.checksum_failures += 1
+                    del self.markets[change['id']]
+                    bad.append(change['id'])
+        return bad
+
+    def market_book(self, market_id, max_age=None):
+        with self._lock:
+            market = self.markets.get(market_id)
+            if market is None or not market.runners:
+                return None
+            if max_age is not None and time.time() * 1000 - market.updated_at > max_age * 1000:
+                return None
+            return market.market_book()
+
+    def clear(self):
+        with self._lock:
+            self.markets = {}
+
+
+class StreamConsumer:
+    def __init__(self, app_key, session_manager, host=STREAM_HOST, port=STREAM_PORT, use_ssl=True,
+                 fields=('EX_BEST_OFFERS', 'EX_MARKET_DEF', 'EX_LTP'), ladder_levels=3, heartbeat_ms=5000):
+        self.app_key = app_key
+        self.session = session_manager
+        self.host = host
+        self.port = port
+        self.use_ssl = use_ssl
+        self.fields = list(fields)
+        self.ladder_levels = ladder_levels
+        self.heartbeat_ms = heartbeat_ms
+        self.cache = PriceCache()
+        self.market_ids = set()
+        self.initial_clk = None
+        self.clk = None
+        self._lock = threading.Lock()
+        self._sock = None
+        self._thread = None
+        self._message_id = 0
+        self._awaiting_image = False
+        self.messages = 0
+        self.reconnects = 0
+
+    def _send(self, payload):
+        self._message_id += 1
+        payload['id'] = self._message_id
+        self._sock.sendall((json.dumps(payload) + "\r\n").encode())
+
+    def _subscribe(self, resume=True):
+        subscription = {
+            'op': 'marketSubscription',
+            'marketFilter': {'marketIds': sorted(self.market_ids)},
+            'marketDataFilter': {'fields': self.fields, 'ladderLevels': self.ladder_levels},
+            'heartbeatMs': self.heartbeat_ms
+        }
+        if resume and self.initial_clk and self.clk:
+            subscription['initialClk'] = self.initial_clk
+            subscription['clk'] = self.clk
+        self._awaiting_image = True
+        self._send(subscription)
+
+    def watch(self, market_ids):
+        """Add markets to the subscription (resubscribes if the set grew)"""
+        with self._lock:
+            new = set(market_ids) - self.market_ids
+            if not new:
+                return
+            self.market_ids |= new
+            if self._sock is not None:
+                # Resubscribing replaces the subscription, so the clocks start over
+                self.initial_clk = self.clk = None
+                self._subscribe(resume=False)
+
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=self.heartbeat_ms / 1000 * 3)
+        if self.use_ssl:
+            sock = ssl.create_default_context().wrap_socket(sock, server_hostname=self.host)
+        return sock
+
+    def _handle(self, message):
+        op = message.get('op')
+        if op == 'mcm':
+            self.messages += 1
+            if message.get('ct') in ('SUB_IMAGE', 'RESUB_DELTA'):
+                self._awaiting_image = False
+            if message.get('ct') != 'HEARTBEAT':
+                bad = self.cache.apply_mcm(message)
+                # Deltas still in flight before the new image are expected to miss
+                if bad and not self._awaiting_image:
+                    print(f"DEBUG: Stream checksum/sequence mismatch for {bad}, requesting a fresh image")
+                    with self._lock:
+                        self.initial_clk = self.clk = None
+                        self._subscribe(resume=False)
+                    return
+            # Only move the resume point once a whole segment has been applied
+            if message.get('segmentType') in (None, 'SEG_END'):
+                if 'initialClk' in message:
+                    self.initial_clk = message['initialClk']
+                if 'clk' in message:
+                    self.clk = message['clk']
+        elif op == 'status' and message.get('statusCode') == 'FAILURE':
+            raise ConnectionError(f"{message.get('errorCode')}: {message.get('errorMessage')}")
+
+    def run_once(self):
+        """One connection: authenticate, subscribe, apply messages until it drops"""
+        token = self.session.token()
+        if not token:
+            raise ConnectionError("Betfair session not ready")
+        sock = self._connect()
+        reader = sock.makefile('rb')
+        with self._lock:
+            self._sock = sock
+            self._send({'op': 'authentication', 'appKey': self.app_key, 'session': token})
+            if self.market_ids:
+                self._subscribe()
+        try:
+            for line in reader:
+                if line.strip():
+                    self._handle(json.loads(line))
+        finally:
+            with self._lock:
+                self._sock = None
+            sock.close()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run_forever, daemon=True, name='betfair-stream')
+            self._thread.start()
+        return self
+
+    def _run_forever(self):
+        backoff = 1
+        while True:
+            started = time.monotonic()
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"DEBUG: Betfair stream disconnected: {e}")
+            self.reconnects += 1
+            # Reset the backoff after a connection that stayed up for a while
+            backoff = 1 if time.monotonic() - started > 60 else min(backoff * 2, 30)
+            time.sleep(backoff)
+
+    def market_book(self, market_id, max_age=None):
+        return self.cache.market_book(market_id, max_age)
+
+    def status(self):
+        return {
+            'connected': self._sock is not None,
+            'markets': len(self.cache.markets),
+            'messages': self.messages,
+            'reconnects': self.reconnects,
+            'checksum_failures': self.cache.checksum_failures,
+            'clk': self.clk
+        }
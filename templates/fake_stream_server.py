@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Betfair Exchange Stream API
+Speaks the same CRLF-delimited JSON protocol (plain TCP, no TLS) so the
+stream consumer can be exercised without an account:
+
+    python fake_stream_server.py --port 8765 --tick-ms 200
+"""
+
+import argparse
+import itertools
+import json
+import random
+import socketserver
+import threading
+import time
+
+from betfair_stream import ladder_checksum
+
+LADDER_LEVELS = 3
+
+
+class FakeMarket:
+    def __init__(self, market_id, runners=6):
+        self.market_id = market_id
+        self.lock = threading.Lock()
+        self.runners = {}
+        for selection_id in range(1, runners + 1):
+            price = round(random.uniform(2.0, 15.0), 2)
+            self.runners[selection_id] = {'batb': {level: (round(price - level * 0.1, 2), random.randint(10, 500))
+                                                   for level in range(LADDER_LEVELS)}}
+
+    def image(self):
+        with self.lock:
+            return {
+                'id': self.market_id,
+                'img': True,
+                'marketDefinition': {'status': 'OPEN', 'inPlay': False,
+                                     'runners': [{'id': s, 'status': 'ACTIVE'} for s in self.runners]},
+                'rc': [{'id': s, 'batb': [[level, p, size] for level, (p, size) in r['batb'].items()]}
+                       for s, r in self.runners.items()],
+                'chk': ladder_checksum(self.runners)
+            }
+
+    def move(self):
+        """Shift one runner's top level, sometimes pulling a level; returns the delta"""
+        with self.lock:
+            selection_id = random.choice(list(self.runners))
+            ladder = self.runners[selection_id]['batb']
+            changes = []
+            if len(ladder) > 1 and random.random() < 0.2:
+                level = max(ladder)
+                del ladder[level]
+                changes.append([level, 0, 0])
+            else:
+                level = min(ladder) if ladder else 0
+                price = max(1.01, round((ladder[level][0] if level in ladder else 5.0) + random.choice((-0.1, 0.1)), 2))
+                ladder[level] = (price, random.randint(10, 500))
+                changes.append([level, price, ladder[level][1]])
+            return {'id': self.market_id, 'rc': [{'id': selection_id, 'batb': changes, 'ltp': changes[-1][1] or None}],
+                    'chk': ladder_checksum(self.runners)}
+
+
+class FakeStreamServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, tick_ms=200, corrupt_every=0):
+        super().__init__(address, StreamHandler)
+        self.tick_ms = tick_ms
+        self.corrupt_every = corrupt_every
+        self.markets = {}
+        self.markets_lock = threading.Lock()
+        self.clock = itertools.count(1)
+
+    def market(self, market_id):
+        with self.markets_lock:
+            if market_id not in self.markets:
+                self.markets[market_id] = FakeMarket(market_id)
+            return self.markets[market_id]
+
+
+class StreamHandler(socketserver.StreamRequestHandler):
+    def send(self, message):
+        with self.write_lock:
+            self.wfile.write((json.dumps(message) + "\r\n").encode())
+            self.wfile.flush()
+
+    def handle(self):
+        self.write_lock = threading.Lock()
+        self.subscription = None
+        self.send({'op': 'connection', 'connectionId': f"fake-{id(self)}"})
+        threading.Thread(target=self.publish, daemon=True).start()
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            if request['op'] == 'authentication':
+                self.send({'op': 'status', 'id': request['id'], 'statusCode': 'SUCCESS'})
+            elif request['op'] == 'marketSubscription':
+                self.send({'op': 'status', 'id': request['id'], 'statusCode': 'SUCCESS'})
+                markets = [self.server.market(m) for m in request['marketFilter']['marketIds']]
+                clk = str(next(self.server.clock))
+                if request.get('clk'):
+                    # Resume: the client already has images, carry on with deltas
+                    self.send({'op': 'mcm', 'id': request['id'], 'ct': 'RESUB_DELTA', 'clk': clk,
+                               'initialClk': request['initialClk'], 'pt': int(time.time() * 1000),
+                               'mc': [m.image() for m in markets]})
+                else:
+                    self.send({'op': 'mcm', 'id': request['id'], 'ct': 'SUB_IMAGE', 'clk': clk,
+                               'initialClk': f"init-{clk}", 'pt': int(time.time() * 1000),
+                               'mc': [m.image() for m in markets]})
+                self.subscription = (request['id'], markets)
+
+    def publish(self):
+        sent = 0
+        while True:
+            time.sleep(self.server.tick_ms / 1000)
+            if self.subscription is None:
+                continue
+            sub_id, markets = self.subscription
+            change = random.choice(markets).move()
+            sent += 1
+            if self.server.corrupt_every and sent % self.server.corrupt_every == 0:
+                change['chk'] ^= 1
+            try:
+                self.send({'op': 'mcm', 'id': sub_id, 'clk': str(next(self.server.clock)),
+                           'pt': int(time.time() * 1000), 'mc': [change]})
+            except OSError:
+                return
+
+
+def serve(port=8765, tick_ms=200, corrupt_every=0):
+    server = FakeStreamServer(('127.0.0.1', port), tick_ms, corrupt_every)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake Betfair Exchange Stream server")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--tick-ms', type=int, default=200)
+    parser.add_argument('--corrupt-every', type=int, default=0, help="send a bad checksum every N deltas")
+    args = parser.parse_args()
+    print(f"🏇 Fake stream listening on 127.0.0.1:{args.port}")
+    FakeStreamServer(('127.0.0.1', args.port), args.tick_ms, args.corrupt_every).serve_forever()
@@ -6,8 +6,10 @@ import json
 from datetime import datetime, timedelta
 
 class FreeHorseRacingData:
-    def __init__(self, region='uk'):
+    def __init__(self, region='uk', registry=None):
         self.region = region
+        # Optional HorseRegistry: real form/momentum for horses that have raced
+        self.registry = registry
         self.uk_courses = [
             'Ascot', 'Newmarket', 'Epsom', 'Cheltenham', 'Aintree', 'York', 'Goodwood', 
             'Doncaster', 'Chester', 'Bath', 'Windsor', 'Sandown', 'Kempton', 'Lingfield'
@@ -101,8 +103,8 @@ class FreeHorseRacingData:
             'decimal_odds': decimal_odds,
             'fractional_odds': self._decimal_to_fractional(decimal_odds),
             'is_favourite': False,  # Will be set later
-            'form': self._generate_form(),
-            'momentum': self._generate_momentum(),
+            'form': self._horse_form(name),
+            'momentum': self._horse_momentum(name),
             'jockey': random.choice(self.jockey_names),
             'weight': self._generate_weight(),
             'age': random.randint(3, 8),
@@ -136,6 +138,27 @@ class FreeHorseRacingData:
         distances = ['5f', '6f', '7f', '1m', '1m 1f', '1m 2f', '1m 4f', '1m 6f', '2m']
         return random.choice(distances)
     
+    def _horse_form(self, name):
+        """Form from the horse registry when available"""
+        if self.registry:
+            return self.registry.get(name)['form'] or '-'
+        return self._generate_form()
+
+    def _horse_momentum(self, name):
+        """Momentum label from the registry's numeric momentum when available"""
+        if not self.registry:
+            return self._generate_momentum()
+        momentum = self.registry.get(name)['momentum']
+        if momentum >= 10:
+            return 'Hot'
+        if momentum > 0:
+            return 'Rising'
+        if momentum == 0:
+            return 'Stable'
+        if momentum > -15:
+            return 'Falling'
+        return 'Cold'
+
     def _generate_form(self):
         """Generate realistic form"""
         forms = [
@@ -194,6 +217,13 @@ class FreeHorseRacingData:
         """Always returns success - no external dependency!"""
         return True, "✅ Free Racing Data is ready! No API key needed."
     
+    def search_names(self):
+        """Every (kind, name) this generator can produce, for seeding a search index"""
+        names = [('horse', name) for name in self.horse_names]
+        names += [('jockey', name) for name in self.jockey_names]
+        names += [('course', name) for name in self.uk_courses + self.us_courses + self.au_courses]
+        return names
+    
     def get_sample_race_info(self):
         """Get a sample race for testing"""
         sample_race = self._generate_single_race(1)
@@ -8,6 +8,12 @@ from datetime import datetime, timedelta
 
 # Import the Free Racing Data Generator
 from free_racing_data import FreeHorseRacingData
+from provider_gateway import get_gateway, budget_report
+from provider_resilience import get_provider
+from search_index import SearchIndex, KINDS  # search_index.py from the main app
+
+# Identical refreshes arriving together (or within 30s) share one generation
+racing_gateway = get_gateway('free_racing')
 
 # Initialize racing data generators
 racing_generators = {
@@ -16,6 +22,17 @@ racing_generators = {
     'au_racing': FreeHorseRacingData('au')
 }
 
+# Autocomplete: every known horse, jockey and course, plus races as they are ingested
+search_index = SearchIndex()
+for generator in racing_generators.values():
+    for kind, name in generator.search_names():
+        search_index.add(kind, name)
+
+def index_races(races):
+    search_index.clear_races()
+    for race in races:
+        search_index.add_race(race)
+
 # Add these routes to your Flask app:
 
 @app.route('/admin/api-config', methods=['GET', 'POST'])
@@ -61,6 +78,7 @@ def api_config():
                          use_virtual=session.get('use_virtual', True),
                          racing_mode=session.get('racing_mode', 'enhanced'),
                          racing_api_status=session.get('racing_api_status', 'Not configured'),
+                         provider_budget=budget_report(),
                          api_status="Free Racing Data - No API Key Required!")
 
 @app.route('/admin/test-api')
@@ -82,7 +100,7 @@ def test_api():
     sample_info = generator.get_sample_race_info()
     
     # Generate a test race
-    test_races = generator.generate_races(num_races=1)
+    test_races = racing_gateway.fetch(('test', source), lambda: generator.generate_races(num_races=1))
     
     if test_races:
         race = test_races[0]
@@ -101,34 +119,44 @@ def test_api():
 @app.route('/api/refresh-races')
 def refresh_races_api():
     """Refresh races using Free Racing Data"""
-    races = []
+    use_virtual = session.get('use_virtual', True)
     
     # Try to get data from Free Racing API if enabled
     if session.get('use_free_api'):
-        try:
-            source = session.get('racing_source', 'uk_racing')
-            generator = racing_generators.get(source)
-            
-            if generator:
+        source = session.get('racing_source', 'uk_racing')
+        generator = racing_generators.get(source)
+        
+        if generator:
+            def fetch_races():
                 # Generate 6-10 races
-                num_races = random.randint(6, 10)
-                races = generator.generate_races(num_races=num_races)
-                
-                if races:
-                    session['races'] = races
+                return racing_gateway.fetch(
+                    ('races', source), lambda: generator.generate_races(num_races=random.randint(6, 10))
+                )
+            
+            fallback = generate_enhanced_virtual_races if use_virtual else list
+            races, served_by = get_provider('free_racing').call(fetch_races, fallback)
+            
+            if races:
+                session['races'] = races
+                index_races(races)
+                if served_by == 'primary':
                     return jsonify({
                         'success': True, 
                         'races_count': len(races),
                         'source': f'Free Racing Data ({source.replace("_", " ").title()})',
                         'sample_race': races[0]['title'] if races else 'None'
                     })
-        except Exception as e:
-            print(f"Error with Free Racing Data: {e}")
+                return jsonify({
+                    'success': True, 
+                    'races_count': len(races),
+                    'source': 'Enhanced Virtual Racing System'
+                })
     
     # Fallback to virtual races if configured
-    if session.get('use_virtual', True):
+    if use_virtual:
         races = generate_enhanced_virtual_races()  # Your existing function
         session['races'] = races
+        index_races(races)
         return jsonify({
             'success': True, 
             'races_count': len(races),
@@ -137,6 +165,12 @@ def refresh_races_api():
     
     return jsonify({'success': False, 'error': 'No racing data source configured'})
 
+@app.route('/api/search')
+def search_api():
+    """Autocomplete for horses, jockeys and courses: ?q=<typed prefix>&kind=horse"""
+    kinds = [k for k in request.args.getlist('kind') if k in KINDS] or None
+    return jsonify({'results': search_index.search(request.args.get('q', ''), limit=10, kinds=kinds)})
+
 def generate_enhanced_virtual_races():
     """Enhanced virtual race generation using the free data generator"""
     generator = FreeHorseRacingData('uk')  # Default to UK
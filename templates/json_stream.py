@@ -0,0 +1,113 @@
+# Streaming JSON ingestion for large provider payloads
+# response.json() holds the whole body and the whole object tree in memory
+# before anything is transformed. These helpers decode a chunked body
+# incrementally and yield one array element at a time, so memory stays at
+# roughly one event plus one network chunk however long the feed is.
+
+import codecs
+import json
+
+_decoder = json.JSONDecoder()
+WHITESPACE = ' \t\n\r'
+# What may legally follow a complete value inside an array or object
+DELIMITERS = WHITESPACE + ',]}:'
+
+
+class _Buffer:
+    """Text read so far from a byte-chunk iterator, trimmed as items are consumed"""
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.utf8 = codecs.getincrementaldecoder('utf-8')()
+        self.text = ''
+        self.pos = 0
+        self.eof = False
+
+    def more(self):
+        """Append the next chunk; False once the body is exhausted"""
+        if self.eof:
+            return False
+        try:
+            chunk = next(self.chunks)
+        except StopIteration:
+            self.eof = True
+            self.text = self.text[self.pos:] + self.utf8.decode(b'', final=True)
+            self.pos = 0
+            return True
+        if isinstance(chunk, bytes):
+            chunk = self.utf8.decode(chunk)
+        # Drop what has been consumed so the buffer never holds more than the current item
+        self.text = self.text[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Next non-whitespace character (reading more as needed), or '' at the end"""
+        while True:
+            while self.pos < len(self.text) and self.text[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.text):
+                return self.text[self.pos]
+            if not self.more():
+                return ''
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f"Expected {char!r} at offset {self.pos}")
+        self.pos += 1
+
+    def value(self):
+        """Decode one complete JSON value, reading more chunks until it is whole"""
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.text, self.pos)
+            except json.JSONDecodeError:
+                if not self.more():
+                    raise
+                continue
+            # A number cut off by the chunk boundary ("1." of "1.5") decodes early;
+            # only trust it once a delimiter follows
+            if not self.eof and (end == len(self.text) or self.text[end] not in DELIMITERS):
+                self.more()
+                continue
+            self.pos = end
+            return value
+
+
+def _array_items(buf):
+    buf.expect('[')
+    if buf.peek() == ']':
+        buf.pos += 1
+        return
+    while True:
+        yield buf.value()
+        separator = buf.peek()
+        buf.pos += 1
+        if separator == ']':
+            return
+        if separator != ',':
+            raise ValueError(f"Expected ',' or ']' at offset {buf.pos - 1}")
+
+
+def iter_json_array(chunks, key=None):
+    """Yield the elements of a streamed JSON array one by one
+
+    chunks: iterable of bytes/str (e.g. response.iter_content(65536))
+    key:    None for a top-level array, or the name of a top-level member
+            holding the array (other members are decoded and discarded)
+    """
+    buf = _Buffer(chunks)
+    if key is None:
+        yield from _array_items(buf)
+        return
+    buf.expect('{')
+    while buf.peek() not in ('}', ''):
+        name = buf.value()
+        buf.expect(':')
+        if name == key and buf.peek() == '[':
+            yield from _array_items(buf)
+        else:
+            buf.value()
+        if buf.peek() == ',':
+            buf.pos += 1
@@ -0,0 +1,114 @@
+# Odds Aggregation - best, median and overround across every bookmaker
+# The Odds API returns one price per bookmaker per runner. Rather than
+# keeping only the first bookmaker, every (event, runner, bookmaker, price)
+# quote is flattened into numpy arrays once and reduced per runner and per
+# event in a few vectorised calls:
+#  - best_price:   highest decimal price on offer (what a punter would take)
+#  - median_price: consensus price, used for the favourite and fair odds
+#  - overround:    sum of 1/price per bookmaker, averaged per event
+#  - best_book:    sum of 1/best_price, the margin when taking every best price
+#  - fair_probability: median implied probabilities with the margin removed
+
+import numpy as np
+
+
+def merge_regions(payloads):
+    """Combine per-region /odds payloads into one list, one entry per event id
+
+    The same bookmaker can be listed under more than one region; it is kept once.
+    """
+    events = {}
+    for payload in payloads:
+        for event in payload or []:
+            merged = events.get(event.get('id'))
+            if merged is None:
+                merged = events[event.get('id')] = dict(event, bookmakers=[])
+            seen = {b.get('key') for b in merged['bookmakers']}
+            merged['bookmakers'].extend(b for b in event.get('bookmakers', []) if b.get('key') not in seen)
+    return list(events.values())
+
+
+def _flatten(odds_data, market='h2h'):
+    """One row per quote: (event index, runner index, bookmaker index, price)"""
+    runner_names = []
+    runner_index = {}
+    event_of_runner = []
+    rows = []
+    book_index = {}
+    for e, event in enumerate(odds_data):
+        for bookmaker in event.get('bookmakers', []):
+            b = book_index.setdefault((e, bookmaker.get('key')), len(book_index))
+            for m in bookmaker.get('markets', []):
+                if m.get('key', market) != market:
+                    continue
+                for outcome in m.get('outcomes', []):
+                    key = (e, outcome.get('name'))
+                    r = runner_index.get(key)
+                    if r is None:
+                        r = runner_index[key] = len(runner_names)
+                        runner_names.append(outcome.get('name'))
+                        event_of_runner.append(e)
+                    rows.append((r, b, e, outcome.get('price', 0)))
+    return runner_names, np.array(event_of_runner, dtype=np.int64), np.array(rows, dtype=np.float64).reshape(-1, 4), len(book_index)
+
+
+def aggregate_odds(odds_data, market='h2h'):
+    """Per-event runner prices across all bookmakers
+
+    Returns a list (same order as odds_data) of
+    {'runners': [{name, best_price, median_price, bookmakers, fair_probability}],
+     'overround': ..., 'best_book': ..., 'bookmakers': ...}
+    """
+    names, event_of_runner, rows, num_books = _flatten(odds_data, market)
+    results = [{'runners': [], 'overround': None, 'best_book': None, 'bookmakers': 0} for _ in odds_data]
+    rows = rows[rows[:, 3] > 1.0]
+    if not len(rows):
+        return results
+
+    runner = rows[:, 0].astype(np.int64)
+    book = rows[:, 1].astype(np.int64)
+    event = rows[:, 2].astype(np.int64)
+    price = rows[:, 3]
+    num_runners = len(names)
+    num_events = len(odds_data)
+
+    # Sort by runner then price so every runner's quotes are one contiguous, ordered run
+    order = np.lexsort((price, runner))
+    runner_sorted, price_sorted = runner[order], price[order]
+    counts = np.bincount(runner_sorted, minlength=num_runners)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    quoted = counts > 0
+
+    best = np.full(num_runners, np.nan)
+    best[quoted] = price_sorted[starts[quoted] + counts[quoted] - 1]
+    lower = price_sorted[starts[quoted] + (counts[quoted] - 1) // 2]
+    upper = price_sorted[starts[quoted] + counts[quoted] // 2]
+    median = np.full(num_runners, np.nan)
+    median[quoted] = (lower + upper) / 2
+
+    # Margin of each bookmaker's book, then the average per event
+    book_margin = np.bincount(book, weights=1.0 / price, minlength=num_books)
+    book_event = np.zeros(num_books, dtype=np.int64)
+    book_event[book] = event
+    has_quotes = np.bincount(book, minlength=num_books) > 0
+    event_margin = np.bincount(book_event[has_quotes], weights=book_margin[has_quotes], minlength=num_events)
+    event_books = np.bincount(book_event[has_quotes], minlength=num_events)
+
+    best_book = np.bincount(event_of_runner[quoted], weights=1.0 / best[quoted], minlength=num_events)
+    median_implied = np.where(quoted, 1.0 / np.where(quoted, median, 1.0), 0.0)
+    median_total = np.bincount(event_of_runner, weights=median_implied, minlength=num_events)
+    fair = median_implied / np.where(median_total[event_of_runner] > 0, median_total[event_of_runner], 1.0)
+
+    for r in np.flatnonzero(quoted):
+        results[event_of_runner[r]]['runners'].append({
+            'name': names[r],
+            'best_price': round(float(best[r]), 2),
+            'median_price': round(float(median[r]), 2),
+            'bookmakers': int(counts[r]),
+            'fair_probability': round(float(fair[r]), 4)
+        })
+    for e in np.flatnonzero(event_books):
+        results[e]['overround'] = round(float(event_margin[e] / event_books[e]), 4)
+        results[e]['best_book'] = round(float(best_book[e]), 4)
+        results[e]['bookmakers'] = int(event_books[e])
+    return results
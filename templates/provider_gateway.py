@@ -0,0 +1,258 @@
+# Provider Gateway - request coalescing and quota budgeting
+# Every upstream racing/odds call goes through here so that:
+#  - concurrent identical fetches share one upstream request (single-flight)
+#  - a result fetched moments ago is reused instead of fetched again
+#  - the provider's free-tier allowance is spread across the race day, with
+#    the count kept in a small SQLite file so every worker spends one budget
+
+import os
+import sqlite3
+import threading
+import time
+import calendar
+from datetime import datetime, timedelta
+
+
+class QuotaExceeded(Exception):
+    """Raised when the budget has no request to spare and nothing is cached"""
+
+
+class TokenBucketQuota:
+    """Spread a request allowance (per day or per month) over the racing hours
+
+    Tokens drip in at budget / racing-seconds-in-period, so a 180/day plan
+    gets roughly one request every 3.7 minutes between race_day_start and
+    race_day_end, with `burst` requests of headroom for manual refreshes.
+    The hard period total is tracked separately so it can never be exceeded.
+    Both live in one row per provider, read and updated inside a single
+    write transaction, so all workers draw on the same allowance.
+    """
+
+    def __init__(self, budget, period='day', race_day_start=11, race_day_end=22, burst=5,
+                 name='default', db_path=None):
+        self.budget = budget
+        self.period = period
+        self.race_day_start = race_day_start
+        self.race_day_end = race_day_end
+        self.burst = burst
+        self.name = name
+        self.db_path = db_path or os.environ.get('PROVIDER_QUOTA_DB', 'provider_quota.db')
+        self._init_schema()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=5)
+        # Transactions are opened explicitly in _update
+        conn.isolation_level = None
+        return conn
+
+    def _init_schema(self):
+        conn = self._connect()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS provider_quota (
+                name TEXT PRIMARY KEY,
+                period_key TEXT,
+                used INTEGER DEFAULT 0,
+                tokens REAL DEFAULT 0,
+                last_refill REAL DEFAULT 0
+            )
+        ''')
+        conn.execute("INSERT OR IGNORE INTO provider_quota (name, tokens, last_refill) VALUES (?, ?, ?)",
+                     (self.name, self.burst, time.time()))
+        conn.close()
+
+    def _update(self, change):
+        """Run change(state, now_ts) on this provider's row while holding the database write lock"""
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT period_key, used, tokens, last_refill FROM provider_quota WHERE name = ?",
+                               (self.name,)).fetchone()
+            state = dict(zip(('period_key', 'used', 'tokens', 'last_refill'), row))
+            result = change(state, time.time())
+            conn.execute('''
+                UPDATE provider_quota SET period_key = ?, used = ?, tokens = ?, last_refill = ?
+                WHERE name = ?
+            ''', (state['period_key'], state['used'], state['tokens'], state['last_refill'], self.name))
+            conn.execute("COMMIT")
+            return result
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def _current_period(self, now):
+        if self.period == 'month':
+            return f"{now.year}-{now.month:02d}"
+        return now.date().isoformat()
+
+    def _racing_seconds_in_period(self, now):
+        day_seconds = (self.race_day_end - self.race_day_start) * 3600
+        if self.period == 'month':
+            return day_seconds * calendar.monthrange(now.year, now.month)[1]
+        return day_seconds
+
+    def _in_race_day(self, moment):
+        return self.race_day_start <= moment.hour < self.race_day_end
+
+    def _refill(self, state, now_ts):
+        now = datetime.fromtimestamp(now_ts)
+        period_key = self._current_period(now)
+        if period_key != state['period_key']:
+            state['period_key'] = period_key
+            state['used'] = 0
+            state['tokens'] = self.burst
+        rate = self.budget / self._racing_seconds_in_period(now)
+        # Only racing hours earn tokens; overnight the bucket stays put
+        if self._in_race_day(now) and self._in_race_day(datetime.fromtimestamp(state['last_refill'])):
+            state['tokens'] = min(self.burst, state['tokens'] + max(0, now_ts - state['last_refill']) * rate)
+        state['last_refill'] = now_ts
+        return rate
+
+    def try_acquire(self):
+        def claim(state, now_ts):
+            self._refill(state, now_ts)
+            if state['used'] >= self.budget or state['tokens'] < 1:
+                return False
+            state['tokens'] -= 1
+            state['used'] += 1
+            return True
+        return self._update(claim)
+
+    def status(self):
+        def report(state, now_ts):
+            rate = self._refill(state, now_ts)
+            now = datetime.fromtimestamp(now_ts)
+            if state['tokens'] >= 1:
+                next_in = 0
+            elif self._in_race_day(now):
+                next_in = int((1 - state['tokens']) / rate)
+            else:
+                opens = now.replace(hour=self.race_day_start, minute=0, second=0, microsecond=0)
+                if opens <= now:
+                    opens += timedelta(days=1)
+                next_in = int((opens - now).total_seconds())
+            return {
+                'budget': self.budget,
+                'period': self.period,
+                'used': state['used'],
+                'remaining': max(0, self.budget - state['used']),
+                'available_now': int(state['tokens']),
+                'next_request_in': next_in,
+                'racing_hours': f"{self.race_day_start:02d}:00-{self.race_day_end:02d}:00"
+            }
+        return self._update(report)
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class ProviderGateway:
+    def __init__(self, name, quota=None, fresh_seconds=60):
+        self.name = name
+        self.quota = quota
+        self.fresh_seconds = fresh_seconds
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._results = {}
+        self.upstream_calls = 0
+        self.coalesced = 0
+        self.cache_hits = 0
+        self.refused = 0
+
+    def fetch(self, key, fn, allow_stale=True):
+        """Return fn()'s result for key, sharing in-flight and recent calls
+
+        Raises QuotaExceeded when the budget is spent and there is no earlier
+        result to fall back on (or allow_stale is False).
+        """
+        with self._lock:
+            cached = self._results.get(key)
+            if cached and time.time() - cached[0] < self.fresh_seconds:
+                self.cache_hits += 1
+                return cached[1]
+            call = self._inflight.get(key)
+            leader = call is None
+            if leader:
+                call = self._inflight[key] = _Call()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error:
+                raise call.error
+            return call.result
+
+        try:
+            if self.quota is not None and not self.quota.try_acquire():
+                with self._lock:
+                    self.refused += 1
+                if cached and allow_stale:
+                    call.result = cached[1]
+                    return call.result
+                raise QuotaExceeded(f"{self.name} request budget exhausted")
+            with self._lock:
+                self.upstream_calls += 1
+            call.result = fn()
+            # Failed fetches (None) are not worth remembering
+            if call.result is not None:
+                with self._lock:
+                    self._results[key] = (time.time(), call.result)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            call.done.set()
+
+    def reserve(self):
+        """Take one request from the budget for a call that cannot be shared (e.g. a streamed body)"""
+        if self.quota is not None and not self.quota.try_acquire():
+            with self._lock:
+                self.refused += 1
+            raise QuotaExceeded(f"{self.name} request budget exhausted")
+        with self._lock:
+            self.upstream_calls += 1
+
+    def status(self):
+        with self._lock:
+            stats = {
+                'name': self.name,
+                'upstream_calls': self.upstream_calls,
+                'coalesced': self.coalesced,
+                'cache_hits': self.cache_hits,
+                'refused': self.refused
+            }
+        if self.quota is not None:
+            stats['quota'] = self.quota.status()
+        return stats
+
+
+# One gateway per provider, shared by every integration module in the process.
+# Free-tier limits as documented in sportmonks_integration.py and
+# the_odds_api_integration_example.py.
+GATEWAYS = {
+    'sportmonks': ProviderGateway('SportMonks', TokenBucketQuota(180, period='day', name='sportmonks'),
+                                  fresh_seconds=300),
+    'the_odds_api': ProviderGateway('The Odds API', TokenBucketQuota(500, period='month', name='the_odds_api'),
+                                    fresh_seconds=300),
+    # Generated locally, so no quota - just collapse duplicate refreshes
+    'free_racing': ProviderGateway('Free Racing Data', fresh_seconds=30)
+}
+
+
+def get_gateway(name):
+    return GATEWAYS[name]
+
+
+def budget_report():
+    """Status of every provider for the admin config page"""
+    return [gateway.status() for gateway in GATEWAYS.values()]
@@ -0,0 +1,189 @@
+# Provider Resilience - latency budgets, circuit breakers and hedged fallback
+# Wraps every upstream racing/odds adapter so a slow or failing provider can
+# never stall a race page:
+#  - each call gets a latency budget; the page stops waiting when it runs out
+#  - close to the deadline the virtual generator is started in parallel and
+#    whichever finishes first with races wins (a hedged request)
+#  - repeated failures or timeouts open a circuit breaker, after which the
+#    provider is skipped entirely until a cool-down has passed
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED, TimeoutError as FutureTimeout
+
+# Upstream calls run here so the request thread can stop waiting on them
+_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix='provider')
+# Hedged fallbacks get their own threads: a pool full of hung upstream calls must not hold them up
+_fallback_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='fallback')
+# How long past the budget to wait for a hedged fallback before giving up with no races
+FALLBACK_GRACE_SECONDS = 1.0
+
+
+class CircuitBreaker:
+    """closed -> open after `failure_threshold` failures in a row; one trial call after `reset_seconds`"""
+
+    def __init__(self, name, failure_threshold=3, reset_seconds=60):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._lock = threading.Lock()
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = None
+        self.trips = 0
+
+    def allow(self):
+        with self._lock:
+            if self.state == 'open':
+                if time.monotonic() - self.opened_at < self.reset_seconds:
+                    return False
+                # Let a single trial call through
+                self.state = 'half_open'
+                return True
+            return self.state == 'closed'
+
+    def record_success(self):
+        with self._lock:
+            self.state = 'closed'
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == 'half_open' or self.failures >= self.failure_threshold:
+                if self.state != 'open':
+                    self.trips += 1
+                    print(f"DEBUG: Circuit for {self.name} opened after {self.failures} failures")
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+
+    def status(self):
+        with self._lock:
+            retry_in = 0
+            if self.state == 'open':
+                retry_in = max(0, int(self.reset_seconds - (time.monotonic() - self.opened_at)))
+            return {
+                'name': self.name,
+                'state': self.state,
+                'failures': self.failures,
+                'trips': self.trips,
+                'retry_in': retry_in
+            }
+
+
+class ResilientProvider:
+    def __init__(self, name, budget_seconds=2.0, hedge_after=0.6, failure_threshold=3, reset_seconds=60):
+        self.name = name
+        self.budget_seconds = budget_seconds
+        # Fraction of the budget to wait before starting the fallback as well
+        self.hedge_after = hedge_after
+        self.breaker = CircuitBreaker(name, failure_threshold, reset_seconds)
+        self.primary_wins = 0
+        self.fallback_wins = 0
+        self.short_circuited = 0
+        self._lock = threading.Lock()
+
+    def _record(self, outcome, ok):
+        """Tell the breaker how one call went - only the first verdict counts"""
+        with self._lock:
+            if outcome['recorded']:
+                return
+            outcome['recorded'] = True
+        if ok:
+            self.breaker.record_success()
+        else:
+            self.breaker.record_failure()
+
+    def _settle(self, future, outcome, deadline):
+        """Record the upstream outcome once it finishes, even if nobody waited"""
+        ok = future.exception() is None and bool(future.result()) and time.monotonic() <= deadline
+        self._record(outcome, ok)
+
+    def _expire(self, future, outcome, deadline):
+        """Count the call as failed at its deadline if it is still running then (it may never return)"""
+        def check():
+            if not future.done():
+                self._record(outcome, False)
+        timer = threading.Timer(max(0, deadline - time.monotonic()), check)
+        timer.daemon = True
+        timer.start()
+
+    def call(self, fn, fallback, budget_seconds=None):
+        """Return (result, source) where source is 'primary' or 'fallback'
+
+        fn is the upstream fetch; fallback builds virtual races and must be
+        cheap. A falsy or failed upstream result counts as a failure.
+        """
+        budget = budget_seconds or self.budget_seconds
+        if not self.breaker.allow():
+            self.short_circuited += 1
+            return fallback(), 'fallback'
+
+        deadline = time.monotonic() + budget
+        outcome = {'recorded': False}
+        primary = _executor.submit(fn)
+        primary.add_done_callback(lambda f: self._settle(f, outcome, deadline))
+
+        done, _ = wait([primary], timeout=budget * self.hedge_after)
+        if primary in done and not primary.exception() and primary.result():
+            self.primary_wins += 1
+            return primary.result(), 'primary'
+
+        # Upstream failed outright: no point racing it
+        if primary in done:
+            self.fallback_wins += 1
+            return fallback(), 'fallback'
+
+        hedge = _fallback_executor.submit(fallback)
+        pending = {primary, hedge}
+        while pending:
+            done, pending = wait(pending, timeout=max(0, deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            if primary in done and not primary.exception() and primary.result():
+                self.primary_wins += 1
+                return primary.result(), 'primary'
+            if hedge in done:
+                self.fallback_wins += 1
+                if not primary.done():
+                    self._expire(primary, outcome, deadline)
+                return hedge.result(), 'fallback'
+
+        # Budget spent: the upstream missed its deadline, whatever it does later
+        if not primary.done():
+            self._record(outcome, False)
+        # The virtual races are local, so give them a short grace period - but not forever
+        self.fallback_wins += 1
+        try:
+            return hedge.result(timeout=FALLBACK_GRACE_SECONDS), 'fallback'
+        except FutureTimeout:
+            print(f"DEBUG: Fallback for {self.name} still running {FALLBACK_GRACE_SECONDS}s past the budget")
+            return [], 'fallback'
+
+    def status(self):
+        stats = self.breaker.status()
+        stats.update({
+            'budget_seconds': self.budget_seconds,
+            'primary_wins': self.primary_wins,
+            'fallback_wins': self.fallback_wins,
+            'short_circuited': self.short_circuited
+        })
+        return stats
+
+
+# One wrapper per upstream, shared by every integration module in the process
+PROVIDERS = {
+    'sportmonks': ResilientProvider('SportMonks'),
+    'the_odds_api': ResilientProvider('The Odds API'),
+    'betfair': ResilientProvider('Betfair Exchange', budget_seconds=2.5),
+    'free_racing': ResilientProvider('Free Racing Data', budget_seconds=1.0)
+}
+
+
+def get_provider(name):
+    return PROVIDERS[name]
+
+
+def resilience_report():
+    """Breaker state and win counts of every provider for the admin config page"""
+    return [provider.status() for provider in PROVIDERS.values()]
@@ -5,38 +5,100 @@ import requests
 import json
 from datetime import datetime, timedelta
 import random
+from concurrent.futures import ThreadPoolExecutor
+
+from provider_gateway import get_gateway, QuotaExceeded
+
+class IncludedIndex:
+    """JSON:API `included` resources indexed once per payload
+
+    Looked up by (type, id) for relationship links, and by (type, race_id)
+    for resources that only point back at their race through an attribute.
+    """
+    def __init__(self, included):
+        self.by_id = {}
+        self.by_race = {}
+        for item in included or []:
+            key = (item.get('type'), str(item.get('id')))
+            if key in self.by_id:
+                continue  # the same resource can be included by several pages
+            self.by_id[key] = item
+            race_id = item.get('attributes', {}).get('race_id')
+            if race_id is not None:
+                self.by_race.setdefault((item.get('type'), str(race_id)), []).append(item.get('attributes', {}))
+    
+    def get(self, type_, id_):
+        return self.by_id.get((type_, str(id_)))
+    
+    def for_race(self, type_, race_data):
+        """Resources of a type belonging to a race, via relationships or a race_id attribute"""
+        links = race_data.get('relationships', {}).get(type_, {}).get('data')
+        if links:
+            found = (self.get(link.get('type'), link.get('id')) for link in links)
+            return [item.get('attributes', {}) for item in found if item]
+        return self.by_race.get((type_, str(race_data.get('id'))), [])
 
 class SportMonksHorseRacingAPI:
-    def __init__(self, api_key):
+    def __init__(self, api_key, gateway=None):
         self.api_key = api_key
+        # Shared across requests: coalesces duplicate fetches, enforces the 180/day budget
+        self.gateway = gateway or get_gateway('sportmonks')
         self.base_url = "https://horse-racing.sportmonks.com/api/v1"
         self.headers = {
             'Authorization': f'Bearer {api_key}',
             'Accept': 'application/json'
         }
         
-    def get_races(self, region='uk'):
+    def get_races(self, region='uk', per_page=50, max_pages=10):
         """
-        Get upcoming horse races
+        Get upcoming horse races, following pagination
         
         Args:
             region: 'uk', 'us', 'au', 'ie'
+            per_page: races per page request
+            max_pages: upper bound on pages per refresh (each page is one request)
         """
         url = f"{self.base_url}/races"
         params = {
             'include': 'runners,market',
             'filter[region]': region,
             'filter[status]': 'upcoming',
-            'per_page': 10
+            'per_page': per_page
         }
         
-        try:
-            response = requests.get(url, headers=self.headers, params=params, timeout=15)
-            response.raise_for_status()
-            return response.json()
-        except requests.RequestException as e:
-            print(f"Error fetching races: {e}")
-            return None
+        first = self._get(('races', region, per_page, 1), url, params, timeout=15, what="races")
+        if not first:
+            return first
+        
+        last_page = min(self._last_page(first), max_pages)
+        if last_page > 1 and self.gateway.quota is not None:
+            # Only ask for the pages the budget can pay for right now
+            last_page = min(last_page, 1 + self.gateway.quota.status()['available_now'])
+        if last_page <= 1:
+            return first
+        
+        def fetch_page(page):
+            return self._get(('races', region, per_page, page), url, dict(params, page=page), timeout=15, what=f"races page {page}")
+        
+        with ThreadPoolExecutor(max_workers=min(4, last_page - 1)) as pool:
+            pages = [first] + [p for p in pool.map(fetch_page, range(2, last_page + 1)) if p]
+        
+        return {
+            'data': [race for page in pages for race in page.get('data', [])],
+            'included': [item for page in pages for item in page.get('included', [])],
+            'meta': first.get('meta', {})
+        }
+    
+    def _last_page(self, payload):
+        """Total pages from JSON:API meta, SportMonks pagination or a next link"""
+        meta = payload.get('meta', {})
+        pagination = meta.get('pagination') or payload.get('pagination') or {}
+        for value in (meta.get('last_page'), pagination.get('total_pages'), pagination.get('last_page')):
+            if value:
+                return int(value)
+        if pagination.get('has_more') or payload.get('links', {}).get('next'):
+            return int(pagination.get('current_page', 1)) + 1
+        return 1
     
     def get_race_details(self, race_id):
         """Get detailed information for a specific race"""
@@ -45,12 +107,23 @@ class SportMonksHorseRacingAPI:
             'include': 'runners,market,course'
         }
         
+        return self._get(('race', race_id), url, params, timeout=10, what="race details")
+    
+    def _get(self, key, url, params, timeout, what):
+        """GET through the provider gateway; None on failure or when the budget is spent"""
+        def fetch():
+            try:
+                response = requests.get(url, headers=self.headers, params=params, timeout=timeout)
+                response.raise_for_status()
+                return response.json()
+            except requests.RequestException as e:
+                print(f"Error fetching {what}: {e}")
+                return None
+        
         try:
-            response = requests.get(url, headers=self.headers, params=params, timeout=10)
-            response.raise_for_status()
-            return response.json()
-        except requests.RequestException as e:
-            print(f"Error fetching race details: {e}")
+            return self.gateway.fetch((self.api_key,) + key, fetch)
+        except QuotaExceeded as e:
+            print(f"Error fetching {what}: {e}")
             return None
     
     def transform_to_race_format(self, sportmonks_data):
@@ -61,6 +134,9 @@ class SportMonksHorseRacingAPI:
         
         if not sportmonks_data or 'data' not in sportmonks_data:
             return races
+        
+        # One pass over `included` for the whole card, not one per race
+        included = IncludedIndex(sportmonks_data.get('included'))
             
         for race_data in sportmonks_data['data']:
             race = {
@@ -76,7 +152,7 @@ class SportMonksHorseRacingAPI:
             runners = race_data.get('runners', [])
             if not runners and 'runners' in race_data.get('relationships', {}):
                 # Handle included data structure
-                runners = self._extract_included_runners(sportmonks_data, race_data)
+                runners = included.for_race('runners', race_data)
             
             for i, runner in enumerate(runners):
                 # Get odds from market data or generate realistic ones
@@ -108,17 +184,6 @@ class SportMonksHorseRacingAPI:
                 
         return races
     
-    def _extract_included_runners(self, full_data, race_data):
-        """Extract runners from included data structure"""
-        runners = []
-        included = full_data.get('included', [])
-        
-        for item in included:
-            if item.get('type') == 'runners' and item.get('attributes', {}).get('race_id') == race_data['id']:
-                runners.append(item.get('attributes', {}))
-                
-        return runners
-    
     def _get_runner_odds(self, runner, full_data):
         """Extract odds for a runner"""
         # Try to get odds from market data
@@ -201,16 +266,20 @@ class SportMonksHorseRacingAPI:
             url = f"{self.base_url}/courses"
             params = {'per_page': 1}
             
-            response = requests.get(url, headers=self.headers, params=params, timeout=10)
-            response.raise_for_status()
+            def fetch():
+                response = requests.get(url, headers=self.headers, params=params, timeout=10)
+                response.raise_for_status()
+                return response.json()
             
-            data = response.json()
+            data = self.gateway.fetch((self.api_key, 'courses'), fetch)
             
             if 'data' in data and len(data['data']) > 0:
                 return True, "✅ SportMonks API connection successful!"
             else:
                 return False, "⚠️ Connected but no data received."
                 
+        except QuotaExceeded as e:
+            return False, f"⏳ {e} - try again later"
         except requests.RequestException as e:
             if '401' in str(e):
                 return False, "❌ Invalid API key. Please check your SportMonks API key."
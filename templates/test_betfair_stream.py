@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Test the Betfair stream consumer against the local fake stream server
+No Betfair account needed - checks that deltas, checksums and resubscribes
+keep the price cache identical to the server's ladders
+"""
+
+import time
+
+from betfair_stream import StreamConsumer, ladder_checksum
+from fake_stream_server import serve
+
+class FakeSession:
+    def token(self):
+        return "fake-token"
+
+def test_stream(port=8766, seconds=3):
+    """Stream two markets for a few seconds and compare caches"""
+    print("🧪 Testing Betfair stream consumer...")
+    print("=" * 50)
+
+    server = serve(port=port, tick_ms=20, corrupt_every=50)
+    consumer = StreamConsumer('fake-app-key', FakeSession(), host='127.0.0.1', port=port, use_ssl=False)
+    consumer.watch(['1.111', '1.222'])
+    consumer.start()
+    time.sleep(seconds)
+
+    status = consumer.status()
+    print(f"Messages: {status['messages']}, checksum failures: {status['checksum_failures']}, clk: {status['clk']}")
+
+    ok = True
+    for market_id in ('1.111', '1.222'):
+        book = consumer.market_book(market_id)
+        if not book:
+            print(f"❌ No prices cached for {market_id}")
+            ok = False
+            continue
+        market = server.markets[market_id]
+        with market.lock:
+            expected = ladder_checksum(market.runners)
+        got = ladder_checksum(consumer.cache.markets[market_id].runners)
+        best = {r['selectionId']: r['ex']['availableToBack'][0]['price'] for r in book['runners'] if r['ex']['availableToBack']}
+        print(f"{'✅' if got == expected else '⚠️'} {market_id} best back prices: {best}")
+        # A delta may land between the two reads, so allow one more tick
+        if got != expected:
+            time.sleep(0.1)
+            with market.lock:
+                ok = ok and ladder_checksum(consumer.cache.markets[market_id].runners) == ladder_checksum(market.runners)
+
+    server.shutdown()
+    return ok
+
+if __name__ == "__main__":
+    success = test_stream()
+    print("\n✅ Stream cache matches the server" if success else "\n❌ Stream cache drifted from the server")
@@ -5,11 +5,18 @@ import requests
 import json
 from datetime import datetime, timedelta
 import random
+from concurrent.futures import ThreadPoolExecutor
+
+from provider_gateway import get_gateway, QuotaExceeded
+from odds_aggregation import aggregate_odds, merge_regions
+from json_stream import iter_json_array
 
 class TheOddsAPI:
-    def __init__(self, api_key):
+    def __init__(self, api_key, gateway=None):
         self.api_key = api_key
         self.base_url = "https://api.the-odds-api.com/v4"
+        # Shared across requests: coalesces duplicate fetches, enforces the 500/month budget
+        self.gateway = gateway or get_gateway('the_odds_api')
         
     def get_horse_racing_odds(self, sport='horse_racing_uk', regions='uk'):
         """
@@ -28,57 +35,106 @@ class TheOddsAPI:
             'dateFormat': 'iso'
         }
         
+        def fetch():
+            try:
+                response = requests.get(url, params=params, timeout=10)
+                response.raise_for_status()
+                return response.json()
+            except requests.RequestException as e:
+                print(f"Error fetching odds: {e}")
+                return None
+
         try:
-            response = requests.get(url, params=params)
-            response.raise_for_status()
-            return response.json()
-        except requests.RequestException as e:
+            return self.gateway.fetch(('odds', self.api_key, sport, regions), fetch)
+        except QuotaExceeded as e:
             print(f"Error fetching odds: {e}")
             return None
     
+    def get_odds_for_regions(self, sport='horse_racing_uk', regions=('uk',)):
+        """Fetch every region at once and merge the bookmakers per event"""
+        if len(regions) == 1:
+            return self.get_horse_racing_odds(sport=sport, regions=regions[0])
+        with ThreadPoolExecutor(max_workers=len(regions)) as pool:
+            payloads = list(pool.map(lambda region: self.get_horse_racing_odds(sport=sport, regions=region), regions))
+        if not any(payloads):
+            return None
+        return merge_regions(payloads)
+    
+    def get_races(self, sport='horse_racing_uk', regions=('uk',)):
+        """Races for the refresh: streamed one event at a time, whole-body fetch only if the stream fails"""
+        try:
+            # One request for every region: the API merges their bookmakers per event itself
+            return list(self._stream_races(sport, ','.join(regions)))
+        except QuotaExceeded as e:
+            print(f"Error streaming odds: {e}")
+            return []
+        except (requests.RequestException, ValueError) as e:
+            print(f"Error streaming odds, fetching the whole feed instead: {e}")
+        return self.transform_to_race_format(self.get_odds_for_regions(sport=sport, regions=regions))
+    
+    def iter_races(self, sport='horse_racing_uk', regions='uk'):
+        """Stream the odds feed, yielding each race as soon as its event has been parsed"""
+        try:
+            yield from self._stream_races(sport, regions)
+        except (requests.RequestException, ValueError, QuotaExceeded) as e:
+            print(f"Error streaming odds: {e}")
+    
+    def _stream_races(self, sport, regions):
+        url = f"{self.base_url}/sports/{sport}/odds"
+        params = {
+            'apiKey': self.api_key,
+            'regions': regions,
+            'markets': 'h2h',
+            'oddsFormat': 'decimal',
+            'dateFormat': 'iso'
+        }
+        
+        self.gateway.reserve()
+        with requests.get(url, params=params, stream=True, timeout=15) as response:
+            response.raise_for_status()
+            yield from self.races_from_chunks(response.iter_content(chunk_size=65536))
+    
+    def races_from_chunks(self, chunks):
+        """Normalise a chunked /odds body one event at a time (memory bounded by one event)"""
+        race_id = 0
+        for event in iter_json_array(chunks):
+            for race in self.transform_to_race_format([event]):
+                race_id += 1
+                race['id'] = race_id
+                yield race
+    
     def transform_to_race_format(self, odds_data):
-        """
-        Transform The Odds API data to your existing race format
-        """
+        """Transform The Odds API data to your existing race format, pricing every runner across all bookmakers"""
         races = []
         
         if not odds_data:
             return races
-            
-        for event in odds_data:
+        
+        for event, prices in zip(odds_data, aggregate_odds(odds_data)):
+            if not prices['runners']:
+                continue
+            # Favourite by consensus (median) price, not by whoever is listed first
+            favourite = min(prices['runners'], key=lambda r: r['median_price'])['name']
             race = {
                 'id': len(races) + 1,
                 'title': event.get('sport_title', 'Horse Race'),
                 'start_time': event.get('commence_time', ''),
                 'is_real_race': True,
-                'horses': []
+                'overround': prices['overround'],
+                'best_book': prices['best_book'],
+                'bookmakers': prices['bookmakers'],
+                'horses': [{
+                    'name': runner['name'],
+                    'fractional_odds': self._decimal_to_fractional(runner['best_price']),
+                    'decimal_odds': runner['best_price'],
+                    'median_odds': runner['median_price'],
+                    'fair_probability': runner['fair_probability'],
+                    'is_favourite': runner['name'] == favourite,
+                    'form': self._generate_form(),
+                    'momentum': self._generate_momentum()
+                } for runner in prices['runners']]
             }
-            
-            # Get bookmaker with the best odds (first one usually)
-            if event.get('bookmakers') and len(event['bookmakers']) > 0:
-                bookmaker = event['bookmakers'][0]
-                markets = bookmaker.get('markets', [])
-                
-                if markets:
-                    outcomes = markets[0].get('outcomes', [])
-                    
-                    for i, outcome in enumerate(outcomes):
-                        # Convert decimal odds to fractional
-                        decimal_odds = float(outcome.get('price', 2.0))
-                        fractional_odds = self._decimal_to_fractional(decimal_odds)
-                        
-                        horse = {
-                            'name': outcome.get('name', f'Horse {i+1}'),
-                            'fractional_odds': fractional_odds,
-                            'decimal_odds': decimal_odds,
-                            'is_favourite': i == 0,  # First horse is usually favorite
-                            'form': self._generate_form(),
-                            'momentum': self._generate_momentum()
-                        }
-                        race['horses'].append(horse)
-            
-            if race['horses']:  # Only add races with horses
-                races.append(race)
+            races.append(race)
                 
         return races
     
@@ -133,11 +189,8 @@ odds_api = TheOddsAPI(api_key='YOUR_API_KEY_HERE')
 # In your route that fetches races
 @app.route('/api/refresh-races')
 def refresh_races():
-    # Get data from The Odds API
-    odds_data = odds_api.get_horse_racing_odds(sport='horse_racing_uk')
-    
-    # Transform to your format
-    real_races = odds_api.transform_to_race_format(odds_data)
+    # Stream races from The Odds API (falls back to the whole-body fetch if the stream fails)
+    real_races = odds_api.get_races(sport='horse_racing_uk')
     
     # Fallback to virtual races if no real data
     if not real_races:
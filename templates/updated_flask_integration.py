@@ -6,12 +6,20 @@ import requests
 import json
 from datetime import datetime, timedelta
 import random
+from concurrent.futures import ThreadPoolExecutor
+
+from provider_gateway import get_gateway, budget_report, QuotaExceeded
+from odds_aggregation import aggregate_odds, merge_regions
+from json_stream import iter_json_array
+from provider_resilience import get_provider
 
 # The Odds API Class (copy to your main app)
 class TheOddsAPI:
-    def __init__(self, api_key):
+    def __init__(self, api_key, gateway=None):
         self.api_key = api_key
         self.base_url = "https://api.the-odds-api.com/v4"
+        # Shared across requests: coalesces duplicate fetches, enforces the 500/month budget
+        self.gateway = gateway or get_gateway('the_odds_api')
         
     def get_horse_racing_odds(self, sport='horse_racing_uk', regions='uk'):
         """Get horse racing odds and events"""
@@ -24,53 +32,106 @@ class TheOddsAPI:
             'dateFormat': 'iso'
         }
         
+        def fetch():
+            try:
+                response = requests.get(url, params=params, timeout=10)
+                response.raise_for_status()
+                return response.json()
+            except requests.RequestException as e:
+                print(f"Error fetching odds: {e}")
+                return None
+
         try:
-            response = requests.get(url, params=params)
-            response.raise_for_status()
-            return response.json()
-        except requests.RequestException as e:
+            return self.gateway.fetch(('odds', self.api_key, sport, regions), fetch)
+        except QuotaExceeded as e:
             print(f"Error fetching odds: {e}")
             return None
     
+    def get_odds_for_regions(self, sport='horse_racing_uk', regions=('uk',)):
+        """Fetch every region at once and merge the bookmakers per event"""
+        if len(regions) == 1:
+            return self.get_horse_racing_odds(sport=sport, regions=regions[0])
+        with ThreadPoolExecutor(max_workers=len(regions)) as pool:
+            payloads = list(pool.map(lambda region: self.get_horse_racing_odds(sport=sport, regions=region), regions))
+        if not any(payloads):
+            return None
+        return merge_regions(payloads)
+    
+    def get_races(self, sport='horse_racing_uk', regions=('uk',)):
+        """Races for the refresh: streamed one event at a time, whole-body fetch only if the stream fails"""
+        try:
+            # One request for every region: the API merges their bookmakers per event itself
+            return list(self._stream_races(sport, ','.join(regions)))
+        except QuotaExceeded as e:
+            print(f"Error streaming odds: {e}")
+            return []
+        except (requests.RequestException, ValueError) as e:
+            print(f"Error streaming odds, fetching the whole feed instead: {e}")
+        return self.transform_to_race_format(self.get_odds_for_regions(sport=sport, regions=regions))
+    
+    def iter_races(self, sport='horse_racing_uk', regions='uk'):
+        """Stream the odds feed, yielding each race as soon as its event has been parsed"""
+        try:
+            yield from self._stream_races(sport, regions)
+        except (requests.RequestException, ValueError, QuotaExceeded) as e:
+            print(f"Error streaming odds: {e}")
+    
+    def _stream_races(self, sport, regions):
+        url = f"{self.base_url}/sports/{sport}/odds"
+        params = {
+            'apiKey': self.api_key,
+            'regions': regions,
+            'markets': 'h2h',
+            'oddsFormat': 'decimal',
+            'dateFormat': 'iso'
+        }
+        
+        self.gateway.reserve()
+        with requests.get(url, params=params, stream=True, timeout=15) as response:
+            response.raise_for_status()
+            yield from self.races_from_chunks(response.iter_content(chunk_size=65536))
+    
+    def races_from_chunks(self, chunks):
+        """Normalise a chunked /odds body one event at a time (memory bounded by one event)"""
+        race_id = 0
+        for event in iter_json_array(chunks):
+            for race in self.transform_to_race_format([event]):
+                race_id += 1
+                race['id'] = race_id
+                yield race
+    
     def transform_to_race_format(self, odds_data):
-        """Transform The Odds API data to your existing race format"""
+        """Transform The Odds API data to your existing race format, pricing every runner across all bookmakers"""
         races = []
         
         if not odds_data:
             return races
-            
-        for event in odds_data:
+        
+        for event, prices in zip(odds_data, aggregate_odds(odds_data)):
+            if not prices['runners']:
+                continue
+            # Favourite by consensus (median) price, not by whoever is listed first
+            favourite = min(prices['runners'], key=lambda r: r['median_price'])['name']
             race = {
                 'id': len(races) + 1,
                 'title': event.get('sport_title', 'Horse Race'),
                 'start_time': event.get('commence_time', ''),
                 'is_real_race': True,
-                'horses': []
+                'overround': prices['overround'],
+                'best_book': prices['best_book'],
+                'bookmakers': prices['bookmakers'],
+                'horses': [{
+                    'name': runner['name'],
+                    'fractional_odds': self._decimal_to_fractional(runner['best_price']),
+                    'decimal_odds': runner['best_price'],
+                    'median_odds': runner['median_price'],
+                    'fair_probability': runner['fair_probability'],
+                    'is_favourite': runner['name'] == favourite,
+                    'form': self._generate_form(),
+                    'momentum': self._generate_momentum()
+                } for runner in prices['runners']]
             }
-            
-            if event.get('bookmakers') and len(event['bookmakers']) > 0:
-                bookmaker = event['bookmakers'][0]
-                markets = bookmaker.get('markets', [])
-                
-                if markets:
-                    outcomes = markets[0].get('outcomes', [])
-                    
-                    for i, outcome in enumerate(outcomes):
-                        decimal_odds = float(outcome.get('price', 2.0))
-                        fractional_odds = self._decimal_to_fractional(decimal_odds)
-                        
-                        horse = {
-                            'name': outcome.get('name', f'Horse {i+1}'),
-                            'fractional_odds': fractional_odds,
-                            'decimal_odds': decimal_odds,
-                            'is_favourite': i == 0,
-                            'form': self._generate_form(),
-                            'momentum': self._generate_momentum()
-                        }
-                        race['horses'].append(horse)
-            
-            if race['horses']:
-                races.append(race)
+            races.append(race)
                 
         return races
     
@@ -117,10 +178,12 @@ class TheOddsAPI:
             url = f"{self.base_url}/sports"
             params = {'apiKey': self.api_key}
             
-            response = requests.get(url, params=params, timeout=10)
-            response.raise_for_status()
+            def fetch():
+                response = requests.get(url, params=params, timeout=10)
+                response.raise_for_status()
+                return response.json()
             
-            sports = response.json()
+            sports = self.gateway.fetch(('sports', self.api_key), fetch)
             horse_racing_available = any('horse_racing' in sport.get('key', '') for sport in sports)
             
             if horse_racing_available:
@@ -128,6 +191,8 @@ class TheOddsAPI:
             else:
                 return False, "⚠️ Connected but no horse racing sports found."
                 
+        except QuotaExceeded as e:
+            return False, f"⏳ {e} - try again later"
         except requests.RequestException as e:
             return False, f"❌ API connection failed: {str(e)}"
 
@@ -141,6 +206,7 @@ def api_config():
         session['use_odds_api'] = 'use_odds_api' in request.form
         session['odds_api_key'] = request.form.get('odds_api_key', '')
         session['odds_sport'] = request.form.get('odds_sport', 'horse_racing_uk')
+        session['odds_regions'] = ','.join(request.form.getlist('odds_regions')) or 'uk'
         session['update_frequency'] = request.form.get('update_frequency', '60')
         session['use_virtual'] = 'use_virtual' in request.form
         session['racing_mode'] = request.form.get('racing_mode', 'enhanced')
@@ -166,10 +232,12 @@ def api_config():
                          use_odds_api=session.get('use_odds_api', False),
                          odds_api_key=session.get('odds_api_key', ''),
                          odds_sport=session.get('odds_sport', 'horse_racing_uk'),
+                         odds_regions=session.get('odds_regions', 'uk'),
                          update_frequency=session.get('update_frequency', '60'),
                          use_virtual=session.get('use_virtual', True),
                          racing_mode=session.get('racing_mode', 'enhanced'),
                          odds_api_status=session.get('odds_api_status', 'Not configured'),
+                         provider_budget=budget_report(),
                          api_status="API Configuration Ready")
 
 @app.route('/admin/test-api')
@@ -186,7 +254,8 @@ def test_api():
     if success:
         # Try to fetch some actual horse racing data
         sport = session.get('odds_sport', 'horse_racing_uk')
-        odds_data = odds_api.get_horse_racing_odds(sport=sport)
+        regions = tuple(session.get('odds_regions', 'uk').split(','))
+        odds_data = odds_api.get_odds_for_regions(sport=sport, regions=regions)
         
         if odds_data and len(odds_data) > 0:
             flash(f"✅ API Test Successful! Found {len(odds_data)} horse racing events.")
@@ -200,29 +269,32 @@ def test_api():
 @app.route('/api/refresh-races')
 def refresh_races_api():
     """Refresh races from The Odds API or fallback to virtual"""
-    races = []
+    use_virtual = session.get('use_virtual', True)
     
     # Try to get real data if API is configured
     if session.get('use_odds_api') and session.get('odds_api_key'):
-        try:
-            odds_api = TheOddsAPI(session['odds_api_key'])
-            sport = session.get('odds_sport', 'horse_racing_uk')
-            
-            odds_data = odds_api.get_horse_racing_odds(sport=sport)
-            races = odds_api.transform_to_race_format(odds_data)
-            
-            if races:
-                session['races'] = races
-                return jsonify({
-                    'success': True, 
-                    'races_count': len(races),
-                    'source': 'The Odds API'
-                })
-        except Exception as e:
-            print(f"Error fetching from The Odds API: {e}")
+        odds_api = TheOddsAPI(session['odds_api_key'])
+        sport = session.get('odds_sport', 'horse_racing_uk')
+        regions = tuple(session.get('odds_regions', 'uk').split(','))
+        
+        def fetch_real_races():
+            return odds_api.get_races(sport=sport, regions=regions)
+        
+        # Bounded wait: virtual races are raced in parallel near the deadline
+        # and used straight away while the circuit is open
+        fallback = generate_virtual_races if use_virtual else list
+        races, source = get_provider('the_odds_api').call(fetch_real_races, fallback)
+        
+        if races:
+            session['races'] = races
+            return jsonify({
+                'success': True, 
+                'races_count': len(races),
+                'source': 'The Odds API' if source == 'primary' else 'Virtual Racing System'
+            })
     
     # Fallback to virtual races
-    if session.get('use_virtual', True):
+    if use_virtual:
         races = generate_virtual_races()  # Your existing function
         session['races'] = races
         return jsonify({